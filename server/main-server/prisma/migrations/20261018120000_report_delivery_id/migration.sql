@@ -0,0 +1,5 @@
+-- AlterTable
+ALTER TABLE "Report" ADD COLUMN     "deliveryId" TEXT;
+
+-- CreateIndex
+CREATE UNIQUE INDEX "Report_deliveryId_key" ON "Report"("deliveryId");
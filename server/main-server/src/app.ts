@@ -10,7 +10,8 @@ import reportRoutes from './routes/report.routes';
 dotenv.config();
 const app: Application = express();
 
-app.use(express.json());
+// Bulk report deliveries from the ML backend carry several full lab reports per request
+app.use(express.json({ limit: process.env.JSON_BODY_LIMIT || '10mb' }));
 app.use(cors({
   origin: [process.env.CORS_ORIGIN || 'http://localhost:5173', 'http://localhost:3000'],
   credentials: true,
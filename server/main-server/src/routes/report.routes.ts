@@ -7,7 +7,7 @@ const router = Router();
 
 router.post('/create', asyncHandler(async (req: Request, res: Response) => {
     try {
-        const { session_id, filename, extracted_data, timestamp } = req.body;
+        const { session_id, filename, extracted_data, timestamp, delivery_id } = req.body;
 
         if (!session_id || !filename || !extracted_data || !timestamp) {
             return res.status(400).json({
@@ -28,11 +28,18 @@ router.post('/create', asyncHandler(async (req: Request, res: Response) => {
 
         console.log('Structured Report Data:', JSON.stringify(reportData, null, 2));
 
-        const newlyCreatedRecord = await prisma.report.create({
-            data: {
-                structuredData: reportData,
-            }
-        });
+        // The ML backend retries and replays deliveries with the same delivery_id; store each once
+        const newlyCreatedRecord = delivery_id
+            ? await prisma.report.upsert({
+                where: { deliveryId: delivery_id },
+                create: { deliveryId: delivery_id, structuredData: reportData },
+                update: {}
+            })
+            : await prisma.report.create({
+                data: {
+                    structuredData: reportData,
+                }
+            });
 
         return res.status(201).json({
             success: true,
@@ -48,6 +55,68 @@ router.post('/create', asyncHandler(async (req: Request, res: Response) => {
     }
 }));
 
+router.post('/create/bulk', asyncHandler(async (req: Request, res: Response) => {
+    try {
+        const { reports } = req.body;
+
+        if (!Array.isArray(reports) || reports.length === 0) {
+            return res.status(400).json({
+                success: false,
+                message: "Expected a non-empty reports array"
+            });
+        }
+
+        // Invalid reports are reported per item so the valid ones in the batch are still stored
+        const errors: { index: number; delivery_id?: string; message: string }[] = [];
+        const valid = reports.filter((report: any, index: number) => {
+            if (!report || !report.session_id || !report.filename || !report.extracted_data || !report.timestamp) {
+                errors.push({
+                    index,
+                    delivery_id: report?.delivery_id,
+                    message: "Missing required fields: session_id, filename, extracted_data, timestamp"
+                });
+                return false;
+            }
+            return true;
+        });
+
+        if (valid.length === 0) {
+            return res.status(400).json({
+                success: false,
+                message: "No valid reports in batch",
+                errors
+            });
+        }
+
+        const result = await prisma.report.createMany({
+            data: valid.map(({ session_id, filename, extracted_data, timestamp, delivery_id }: any) => ({
+                deliveryId: delivery_id || null,
+                structuredData: {
+                    session_id,
+                    filename,
+                    timestamp,
+                    raw_extracted_data: extracted_data,
+                    structured_data: parseExtractedData(extracted_data)
+                }
+            })),
+            skipDuplicates: true
+        });
+
+        return res.status(201).json({
+            success: true,
+            message: errors.length ? "Some reports were rejected" : "Reports created successfully",
+            count: result.count,
+            errors
+        });
+    } catch (error) {
+        console.error('Error creating reports:', error);
+        return res.status(500).json({
+            success: false,
+            message: "Internal server error"
+        });
+    }
+}));
+
 router.get("/", asyncHandler(async (req: Request, res: Response) => {
     try {
         const reports = await prisma.report.findMany({
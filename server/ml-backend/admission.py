@@ -0,0 +1,204 @@
+import asyncio
+import math
+import threading
+import time
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed; carries the HTTP status and Retry-After seconds"""
+
+    def __init__(self, message, status=429, retry_after=1):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.retry_after = max(int(math.ceil(retry_after)), 1)
+
+
+def _wake(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class AgentLimiter:
+    """Cap concurrent calls to one agent, with a bounded wait queue
+
+    Up to ``max_concurrent`` callers run at once and up to ``max_waiting``
+    more wait, each for at most ``wait_timeout`` seconds. A caller that finds
+    the queue full is rejected with 429 immediately; one whose wait expires
+    gets 503. Retry-After is estimated from the average call duration.
+
+    Event-loop callers wait in ``acquire_async`` without holding a thread;
+    they share the same slots and queue as threaded callers.
+    """
+
+    def __init__(self, name, max_concurrent=8, max_waiting=16, wait_timeout=10.0):
+        self.name = name
+        self.max_concurrent = max(int(max_concurrent), 1)
+        self.max_waiting = max(int(max_waiting), 0)
+        self.wait_timeout = wait_timeout
+        self._cond = threading.Condition()
+        self._async_waiters = set()
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._held_total = 0.0
+        self._held_count = 0
+
+    def _retry_after(self):
+        average = self._held_total / self._held_count if self._held_count else 1.0
+        return average * (self.waiting + 1) / self.max_concurrent
+
+    def acquire(self, timeout=None):
+        """Wait for a slot; returns the acquisition time to pass to ``release``"""
+        timeout = self.wait_timeout if timeout is None else timeout
+        with self._cond:
+            if self.active >= self.max_concurrent or self.waiting:
+                if self.waiting >= self.max_waiting:
+                    self.rejected += 1
+                    raise Overloaded(f"{self.name} agent is at capacity", 429, self._retry_after())
+                deadline = time.monotonic() + timeout
+                self.waiting += 1
+                try:
+                    while self.active >= self.max_concurrent:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.timed_out += 1
+                            raise Overloaded(f"Timed out waiting for the {self.name} agent", 503, self._retry_after())
+                        self._cond.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.active += 1
+            self.admitted += 1
+        return time.monotonic()
+
+    async def acquire_async(self, timeout=None):
+        """``acquire`` for coroutines: waits on the event loop instead of blocking a thread"""
+        timeout = self.wait_timeout if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        with self._cond:
+            if self.active < self.max_concurrent and not self.waiting:
+                self.active += 1
+                self.admitted += 1
+                return time.monotonic()
+            if self.waiting >= self.max_waiting:
+                self.rejected += 1
+                raise Overloaded(f"{self.name} agent is at capacity", 429, self._retry_after())
+            deadline = time.monotonic() + timeout
+            self.waiting += 1
+        wakeup = None
+        try:
+            while True:
+                with self._cond:
+                    if self.active < self.max_concurrent:
+                        self.active += 1
+                        self.admitted += 1
+                        return time.monotonic()
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timed_out += 1
+                        raise Overloaded(f"Timed out waiting for the {self.name} agent", 503, self._retry_after())
+                    wakeup = (loop, loop.create_future())
+                    self._async_waiters.add(wakeup)
+                try:
+                    await asyncio.wait_for(wakeup[1], remaining)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                self.waiting -= 1
+                self._async_waiters.discard(wakeup)
+
+    def release(self, acquired_at):
+        with self._cond:
+            self.active -= 1
+            self._held_total += time.monotonic() - acquired_at
+            self._held_count += 1
+            self._cond.notify()
+            # Wake every coroutine waiter to re-check; the loser goes back to waiting
+            waiters, self._async_waiters = self._async_waiters, set()
+        for loop, future in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, future)
+            except RuntimeError:
+                pass  # that waiter's event loop is closed
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_concurrent": self.max_concurrent,
+                "max_waiting": self.max_waiting,
+                "wait_timeout_s": self.wait_timeout,
+                "active": self.active,
+                "waiting": self.waiting,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "avg_call_ms": round(self._held_total * 1000.0 / self._held_count, 1) if self._held_count else 0.0
+            }
+
+
+class Lane:
+    """Cap on requests of one class in flight (running or waiting) in this process
+
+    Keeping the LLM lane below the server's thread count leaves threads free
+    for cheap endpoints, so /chat and /predict never queue behind LLM calls.
+    """
+
+    def __init__(self, name, max_in_flight):
+        self.name = name
+        self.max_in_flight = max(int(max_in_flight), 1)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.rejected = 0
+
+    def enter(self):
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                self.rejected += 1
+                raise Overloaded(f"Too many {self.name} requests in progress", 429, 1)
+            self.in_flight += 1
+
+    def exit(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"max_in_flight": self.max_in_flight, "in_flight": self.in_flight, "rejected": self.rejected}
+
+
+class AdmissionController:
+    """Per-agent limiters plus request lanes"""
+
+    def __init__(self):
+        self.limiters = {}
+        self.lanes = {}
+
+    def add_agent(self, name, max_concurrent=8, max_waiting=16, wait_timeout=10.0):
+        self.limiters[name] = AgentLimiter(name, max_concurrent, max_waiting, wait_timeout)
+        return self.limiters[name]
+
+    def add_lane(self, name, max_in_flight):
+        self.lanes[name] = Lane(name, max_in_flight)
+        return self.lanes[name]
+
+    def acquire(self, agent_name):
+        limiter = self.limiters.get(agent_name)
+        return limiter.acquire() if limiter is not None else None
+
+    async def acquire_async(self, agent_name):
+        limiter = self.limiters.get(agent_name)
+        return await limiter.acquire_async() if limiter is not None else None
+
+    def release(self, agent_name, acquired_at):
+        limiter = self.limiters.get(agent_name)
+        if limiter is not None and acquired_at is not None:
+            limiter.release(acquired_at)
+
+    def stats(self):
+        return {
+            "agents": {name: limiter.stats() for name, limiter in self.limiters.items()},
+            "lanes": {name: lane.stats() for name, lane in self.lanes.items()}
+        }
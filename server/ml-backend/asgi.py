@@ -0,0 +1,565 @@
+"""ASGI serving mode for the ML backend
+
+Run with ``uvicorn asgi:app --port 5000``. The chat, report and prediction
+routes are served natively: agent calls are awaited through ``Agent.arun``
+(or streamed from ``Agent.run`` on a bounded pool when the model has no
+async streaming), ``/predict`` awaits the micro-batcher's future, and
+CPU-bound work (PDF extraction, batch ``predict_proba``) runs in executors,
+so one process can hold many concurrent chat sessions. Every other route falls through to the
+Flask app in ``server.py``.
+"""
+import asyncio
+import inspect
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.wsgi import WSGIMiddleware
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+import server
+from admission import Overloaded
+from inference import InvalidRecord
+from metrics import REQUEST_LATENCY, record_agent_call, span, start_trace
+
+NO_RESPONSE = server.NO_RESPONSE_MESSAGE
+AGENT_ERROR = server.AGENT_ERROR_MESSAGE
+
+
+# Agents whose model has no async streaming (phidata's Gemini) are streamed from their sync
+# ``run`` on this pool, sized so every admitted agent call can hold a thread
+sync_agent_pool = ThreadPoolExecutor(
+    max_workers=sum(limiter.max_concurrent for limiter in server.admission.limiters.values()),
+    thread_name_prefix="asgi-agent"
+)
+
+
+def _supports_async_stream(agent):
+    if getattr(agent, "arun", None) is None:
+        return False
+    # phi's Agent.arun(stream=True) needs Model.aresponse_stream and raises NotImplementedError without it
+    model = getattr(agent, "model", None)
+    return model is None or hasattr(model, "aresponse_stream")
+
+
+async def _sync_contents(agent, prompt):
+    """Pull a sync agent stream chunk by chunk on the bounded pool"""
+    loop = asyncio.get_running_loop()
+    stream = await loop.run_in_executor(sync_agent_pool, lambda: iter(agent.run(prompt, stream=True)))
+    try:
+        while True:
+            chunk = await loop.run_in_executor(sync_agent_pool, next, stream, None)
+            if chunk is None:
+                return
+            if chunk.content:
+                yield chunk.content
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            await loop.run_in_executor(sync_agent_pool, close)
+
+
+async def _agent_contents(agent, prompt):
+    if not _supports_async_stream(agent):
+        async for content in _sync_contents(agent, prompt):
+            yield content
+        return
+
+    streamed = False
+    try:
+        stream = agent.arun(prompt, stream=True)
+        if inspect.isawaitable(stream):
+            stream = await stream
+        async for chunk in stream:
+            streamed = True
+            if chunk.content:
+                yield chunk.content
+    except NotImplementedError:
+        if streamed:
+            raise
+        async for content in _sync_contents(agent, prompt):
+            yield content
+
+
+async def admit(request, agent):
+    """Hold one of ``agent``'s admission slots until the request (and its stream) finishes
+
+    Streaming routes call this before building their response, so a shed
+    request gets a 429/503 with Retry-After rather than a 200 stream carrying
+    an error event. ``timed_native_app`` releases the slot.
+    """
+    acquired_at = await server.admission.acquire_async(agent.name)
+    request.scope.setdefault("admission_slots", []).append((agent.name, acquired_at))
+
+
+async def agent_chunks(agent, prompt, admitted=False):
+    """Yield non-empty chunk contents from an agent without blocking the loop
+
+    Unless the route already ``admit``-ted the request, one of the agent's
+    admission slots is held for the duration of the call.
+    """
+    acquired_at = None if admitted else await server.admission.acquire_async(agent.name)
+    started = time.perf_counter()
+    first_chunk = None
+    chunks = 0
+    failed = False
+    try:
+        async for content in _agent_contents(agent, prompt):
+            if first_chunk is None:
+                first_chunk = time.perf_counter() - started
+            chunks += 1
+            yield content
+    except Exception:
+        failed = True
+        raise
+    finally:
+        record_agent_call(agent.name, time.perf_counter() - started, first_chunk, chunks, failed)
+        if not admitted:
+            server.admission.release(agent.name, acquired_at)
+
+
+async def run_agent(agent, prompt, error_label="Agent"):
+    try:
+        response = "".join([content async for content in agent_chunks(agent, prompt)])
+        return response if response.strip() else NO_RESPONSE
+    except Overloaded:
+        raise
+    except Exception as e:
+        print(f"{error_label} error: {e}")
+        return AGENT_ERROR
+
+
+async def stream_agent(route, agent, prompt, metadata, error_label="Agent", started=None, on_complete=None):
+    """Async counterpart of server.stream_agent_response; the caller must ``admit`` the request first"""
+    started = started or time.perf_counter()
+    first_chunk_at = None
+    chunk_count = 0
+    parts = []
+    try:
+        async for content in agent_chunks(agent, prompt, admitted=True):
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+            chunk_count += 1
+            parts.append(content)
+            yield server.sse_event("chunk", {"content": content})
+
+        if not chunk_count:
+            yield server.sse_event("chunk", {"content": NO_RESPONSE})
+        elif on_complete is not None:
+            on_complete("".join(parts))
+
+    except Exception as e:
+        print(f"{error_label} error: {e}")
+        yield server.sse_event("error", {"message": AGENT_ERROR})
+
+    yield server.sse_event("done", metadata)
+
+    ttfb_ms = (first_chunk_at - started) * 1000.0 if first_chunk_at else None
+    total_ms = (time.perf_counter() - started) * 1000.0
+    print(f"{route} stream: ttfb={'n/a' if ttfb_ms is None else f'{ttfb_ms:.0f}ms'} total={total_ms:.0f}ms chunks={chunk_count}")
+
+
+async def cached_general_answer(template, prompt, query):
+    """Return (response, cached) for a general question, consulting the response cache first"""
+    response = server.response_cache.get(template, query)
+    if response is not None:
+        return response, True
+    response = await run_agent(server.general_agent, prompt, "General agent")
+    if response not in (NO_RESPONSE, AGENT_ERROR):
+        server.response_cache.put(template, query, response)
+    return response, False
+
+
+async def stream_cached_general(request, route, template, prompt, query, metadata, started=None):
+    """Async counterpart of server.stream_cached_general; only a cache miss takes an agent slot"""
+    response = server.response_cache.get(template, query)
+    if response is not None:
+        async def cached_events():
+            yield server.sse_event("chunk", {"content": response})
+            yield server.sse_event("done", {**metadata, "cached": True})
+        return cached_events()
+    await admit(request, server.general_agent)
+    return stream_agent(
+        route, server.general_agent, prompt, {**metadata, "cached": False}, error_label="General agent",
+        started=started, on_complete=lambda text: server.response_cache.put(template, query, text)
+    )
+
+
+def sse_response(events):
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except Exception:
+        return None
+
+
+def error(message, status=400):
+    return JSONResponse({"error": message}, status_code=status)
+
+
+async def overloaded(request, e):
+    return JSONResponse(
+        {"error": e.message, "retry_after": e.retry_after},
+        status_code=e.status, headers={"Retry-After": str(e.retry_after)}
+    )
+
+
+async def predict(request):
+    records, _, failure = server.parse_predict_request(await read_json(request))
+    if failure:
+        return JSONResponse({"message": failure}, status_code=400)
+    try:
+        with span("feature_encoding"):
+            features = server.encoder.encode_one(records[0])
+
+        if server.batcher is not None:
+            active, prob_array = await asyncio.wrap_future(server.batcher.enqueue(features))
+        else:
+            active, prob_array = (await asyncio.to_thread(server.predict_rows, features))[0]
+
+        result = active.ranker.rank(prob_array, n=3)[0]
+
+        return JSONResponse({
+            "message": "Prediction successful",
+            "top_nurses": result
+        })
+    except InvalidRecord as e:
+        return JSONResponse({"message": f"Invalid request. {e}"}, status_code=400)
+    except Exception as e:
+        return JSONResponse({
+            "message": "Error during prediction",
+            "error": str(e)
+        }, status_code=500)
+
+
+async def predict_batch(request):
+    records, top_n, failure = server.parse_predict_request(await read_json(request), batch=True)
+    if failure:
+        return JSONResponse({"message": failure}, status_code=400)
+
+    try:
+        with span("feature_encoding"):
+            features = server.encoder.encode(records)
+        active = server.model_manager.active
+        with span("predict_proba"):
+            prob_matrix = await asyncio.to_thread(active.model.predict_proba, features)
+
+        results = [
+            {"top_nurses": top_nurses}
+            for top_nurses in active.ranker.rank(prob_matrix, n=top_n)
+        ]
+
+        return JSONResponse({
+            "message": "Prediction successful",
+            "model_version": active.version,
+            "count": len(results),
+            "results": results
+        })
+    except InvalidRecord as e:
+        return JSONResponse({"message": f"Invalid request. {e}"}, status_code=400)
+    except Exception as e:
+        return JSONResponse({
+            "message": "Error during prediction",
+            "error": str(e)
+        }, status_code=500)
+
+
+async def upload_pdf(request):
+    try:
+        form = await request.form()
+        file = form.get("pdf")
+        if file is None or isinstance(file, str):
+            return error("No file provided")
+
+        if not file.filename:
+            return error("No file selected")
+
+        if not server.allowed_file(file.filename):
+            return error("Only PDF files are allowed")
+
+        body, status = await asyncio.to_thread(server.ingest_pdf, file.file, file.filename)
+        return JSONResponse(body, status_code=status)
+
+    except Exception as e:
+        return error(f"Upload failed: {str(e)}", 500)
+
+
+async def parse_question(request, require_session=False):
+    """Return (query, session_id, session_info, error response)"""
+    data = await read_json(request)
+    if not data:
+        return None, None, None, error("No JSON data provided")
+
+    query = data.get("query", "").strip()
+    session_id = data.get("session_id", "").strip()
+
+    if not query:
+        return None, None, None, error("No question provided")
+
+    if require_session and not session_id:
+        return None, None, None, error("No session ID provided")
+
+    session_info = server.session_data.get(session_id) if session_id else None
+    if require_session and session_info is None:
+        return None, None, None, error("Session not found or expired. Please upload your PDF again.")
+
+    return query, session_id, session_info, None
+
+
+async def smart_query(request):
+    try:
+        query, session_id, session_info, failure = await parse_question(request)
+        if failure:
+            return failure
+
+        if server.detect_query_type(query) == 'upload_request':
+            return JSONResponse({
+                "response": "To upload a lab report, please use the upload button above or drag and drop a PDF file. I'll be able to analyze your lab results once you upload the file.",
+                "query_type": "upload_request",
+                "action_needed": "upload_file"
+            })
+
+        if session_info is not None:
+            prompt = server.build_report_query_prompt(server.report_context_for("/smart_query", session_info, query), query, session_id)
+            response = await run_agent(server.assistant_agent, prompt)
+            return JSONResponse({
+                "response": response,
+                "query_type": "lab_report",
+                "filename": session_info.filename
+            })
+
+        response, cached = await cached_general_answer(
+            server.GENERAL_QUERY_TEMPLATE, server.build_general_query_prompt(query), query
+        )
+        return JSONResponse({
+            "response": response,
+            "query_type": "general",
+            "cached": cached
+        })
+
+    except Overloaded:
+        raise
+    except Exception as e:
+        return error(f"Failed to process question: {str(e)}", 500)
+
+
+async def smart_query_stream(request):
+    started = time.perf_counter()
+    query, session_id, session_info, failure = await parse_question(request)
+    if failure:
+        return failure
+
+    if server.detect_query_type(query) == 'upload_request':
+        async def upload_events():
+            yield server.sse_event("chunk", {"content": "To upload a lab report, please use the upload button above or drag and drop a PDF file. I'll be able to analyze your lab results once you upload the file."})
+            yield server.sse_event("done", {"query_type": "upload_request", "action_needed": "upload_file"})
+        return sse_response(upload_events())
+
+    if session_info is not None:
+        await admit(request, server.assistant_agent)
+        return sse_response(stream_agent(
+            "/smart_query", server.assistant_agent,
+            server.build_report_query_prompt(server.report_context_for("/smart_query", session_info, query), query, session_id),
+            {"query_type": "lab_report", "filename": session_info.filename},
+            started=started
+        ))
+
+    return sse_response(await stream_cached_general(
+        request, "/smart_query", server.GENERAL_QUERY_TEMPLATE, server.build_general_query_prompt(query),
+        query, {"query_type": "general"}, started=started
+    ))
+
+
+async def ask(request):
+    try:
+        query, session_id, session_info, failure = await parse_question(request, require_session=True)
+        if failure:
+            return failure
+
+        extraction_future = server.background_pool.submit(server.get_report_extraction, session_id, session_info)
+
+        response = await run_agent(
+            server.assistant_agent,
+            server.build_report_answer_prompt(server.report_context_for("/ask", session_info, query), query, session_id)
+        )
+
+        if extraction_future.done() and extraction_future.exception() is None:
+            extracted_data, success, external_response = extraction_future.result()
+            external_status = "queued" if success else "failed"
+        else:
+            extracted_data, external_response, external_status = None, None, "pending"
+
+        return JSONResponse({
+            "response": response,
+            "filename": session_info.filename,
+            "extracted_data": extracted_data,
+            "external_backend_status": external_status,
+            "external_backend_response": external_response if external_status != "failed" else str(external_response)
+        })
+
+    except Overloaded:
+        raise
+    except Exception as e:
+        return error(f"Failed to process question: {str(e)}", 500)
+
+
+async def ask_stream(request):
+    started = time.perf_counter()
+    query, session_id, session_info, failure = await parse_question(request, require_session=True)
+    if failure:
+        return failure
+
+    await admit(request, server.assistant_agent)
+    server.background_pool.submit(server.get_report_extraction, session_id, session_info)
+
+    return sse_response(stream_agent(
+        "/ask", server.assistant_agent,
+        server.build_report_answer_prompt(server.report_context_for("/ask", session_info, query), query, session_id),
+        {"query_type": "lab_report", "filename": session_info.filename},
+        started=started
+    ))
+
+
+async def ask_general(request):
+    try:
+        query, _, _, failure = await parse_question(request)
+        if failure:
+            return failure
+
+        response, cached = await cached_general_answer(
+            server.GENERAL_ANSWER_TEMPLATE, server.build_general_answer_prompt(query), query
+        )
+        return JSONResponse({
+            "response": response,
+            "query_type": "general",
+            "cached": cached
+        })
+
+    except Overloaded:
+        raise
+    except Exception as e:
+        return error(f"Failed to process question: {str(e)}", 500)
+
+
+async def ask_general_stream(request):
+    started = time.perf_counter()
+    query, _, _, failure = await parse_question(request)
+    if failure:
+        return failure
+
+    return sse_response(await stream_cached_general(
+        request, "/ask_general", server.GENERAL_ANSWER_TEMPLATE, server.build_general_answer_prompt(query),
+        query, {"query_type": "general"}, started=started
+    ))
+
+
+async def extract_data(request):
+    try:
+        data = await read_json(request)
+        if not data:
+            return error("No JSON data provided")
+
+        session_id = data.get("session_id", "").strip()
+
+        if not session_id:
+            return error("No session ID provided")
+
+        session_info = server.session_data.get(session_id)
+        if session_info is None:
+            return error("Session not found or expired. Please upload your PDF again.")
+
+        extracted_data, success, external_response = await asyncio.wrap_future(
+            server.background_pool.submit(server.get_report_extraction, session_id, session_info)
+        )
+
+        return JSONResponse({
+            "extracted_data": extracted_data,
+            "filename": session_info.filename,
+            "external_backend_status": "queued" if success else "failed",
+            "external_backend_response": external_response if success else str(external_response)
+        })
+
+    except Overloaded:
+        raise
+    except Exception as e:
+        return error(f"Failed to extract data: {str(e)}", 500)
+
+
+routes = [
+    Route("/predict", predict, methods=["POST"]),
+    Route("/predict/batch", predict_batch, methods=["POST"]),
+    Route("/upload", upload_pdf, methods=["POST"]),
+    Route("/smart_query", smart_query, methods=["POST"]),
+    Route("/smart_query/stream", smart_query_stream, methods=["POST"]),
+    Route("/ask", ask, methods=["POST"]),
+    Route("/ask/stream", ask_stream, methods=["POST"]),
+    Route("/ask_general", ask_general, methods=["POST"]),
+    Route("/ask_general/stream", ask_general_stream, methods=["POST"]),
+    Route("/extract_data", extract_data, methods=["POST"]),
+]
+NATIVE_PATHS = frozenset(route.path for route in routes)
+# Routes admitted through the LLM lane; /predict never waits behind them
+LLM_PATHS = NATIVE_PATHS - {"/predict", "/predict/batch", "/upload"}
+
+native_app = Starlette(
+    routes=routes,
+    exception_handlers={Overloaded: overloaded},
+    middleware=[Middleware(CORSMiddleware, allow_origins=['http://localhost:3000'], allow_methods=["*"], allow_headers=["*"])]
+)
+# Flask already applies its own CORS headers, so it is not wrapped in CORSMiddleware
+flask_app = WSGIMiddleware(server.app)
+
+
+async def timed_native_app(scope, receive, send):
+    """Run a native route, recording its latency up to the response headers like Flask's after_request
+
+    LLM routes hold a slot in the LLM lane, and any agent slots they ``admit``, until their
+    response (or stream) finishes.
+    """
+    started = time.perf_counter()
+    headers = dict(scope.get("headers") or [])
+    start_trace(headers.get(b"x-request-id", b"").decode("latin-1") or uuid.uuid4().hex[:16])
+
+    async def send_timed(message):
+        if message["type"] == "http.response.start":
+            REQUEST_LATENCY.observe(
+                time.perf_counter() - started, scope["path"], scope["method"], str(message["status"])
+            )
+        await send(message)
+
+    lane = server.admission.lanes["llm"] if scope["path"] in LLM_PATHS else None
+    if lane is not None:
+        try:
+            lane.enter()
+        except Overloaded as e:
+            response = await overloaded(None, e)
+            await response(scope, receive, send_timed)
+            return
+    try:
+        await native_app(scope, receive, send_timed)
+    finally:
+        for agent_name, acquired_at in scope.get("admission_slots", ()):
+            server.admission.release(agent_name, acquired_at)
+        if lane is not None:
+            lane.exit()
+
+
+async def app(scope, receive, send):
+    """Dispatch native routes to Starlette and everything else (/chat, /admin/*, stats) to Flask"""
+    if scope["type"] != "http":
+        await native_app(scope, receive, send)
+    elif scope["path"] not in NATIVE_PATHS:
+        await flask_app(scope, receive, send)
+    else:
+        await timed_native_app(scope, receive, send)
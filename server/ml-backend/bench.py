@@ -0,0 +1,337 @@
+"""Benchmarks for the ML backend hot paths
+
+By default the Flask app is driven in-process through its test client with
+the offline FakeAgent (ML_FAKE_AGENT=1), so no network or API key is needed
+and peak RSS is this process (plus PDF extraction workers):
+
+    python bench.py                              # every scenario
+    python bench.py predict predict_batch -n 2000 -c 16
+    python bench.py upload --pages 12 --reports 40
+    python bench.py sessions --chunk-delay-ms 5 --chunk-chars 20
+
+With ``--base-url`` the same scenarios run over HTTP against a running
+server (start it with ML_FAKE_AGENT=1 to keep it offline); RSS is then read
+from the server's /metrics endpoint.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from loadtest import summarize
+
+SCENARIOS = ("predict", "predict_batch", "upload", "sessions")
+SYMPTOMS = ('swelling', 'nausea', 'frequent urination', 'coughing', 'fatigue',
+            'light sensitivity', 'joint pain', 'stiffness', 'shortness of breath')
+CONDITIONS = ('Arthritis', 'Asthma', 'Diabetes', 'Hypertension')
+COMORBIDITIES = ('comorbidity_Kidney Issues', 'comorbidity_Liver Disease',
+                 'comorbidity_Lung Disease', 'comorbidity_Thyroid')
+# (name, unit, low, high) for the synthetic reports
+LAB_TESTS = (
+    ("Hemoglobin", "g/dL", 13.0, 17.0), ("Total Leukocyte Count", "10^3/uL", 4.0, 10.0),
+    ("Platelet Count", "10^3/uL", 150.0, 410.0), ("RBC Count", "10^6/uL", 4.5, 5.5),
+    ("Hematocrit", "%", 40.0, 50.0), ("MCV", "fL", 83.0, 101.0), ("MCH", "pg", 27.0, 32.0),
+    ("Fasting Glucose", "mg/dL", 70.0, 100.0), ("HbA1c", "%", 4.0, 5.6),
+    ("Total Cholesterol", "mg/dL", 125.0, 200.0), ("HDL Cholesterol", "mg/dL", 40.0, 60.0),
+    ("LDL Cholesterol", "mg/dL", 50.0, 130.0), ("Triglycerides", "mg/dL", 50.0, 150.0),
+    ("Serum Creatinine", "mg/dL", 0.7, 1.3), ("Blood Urea", "mg/dL", 17.0, 43.0),
+    ("Uric Acid", "mg/dL", 3.5, 7.2), ("SGPT ALT", "U/L", 10.0, 50.0), ("SGOT AST", "U/L", 10.0, 40.0),
+    ("Total Bilirubin", "mg/dL", 0.3, 1.2), ("TSH", "uIU/mL", 0.4, 4.2), ("Vitamin D", "ng/mL", 30.0, 100.0),
+    ("Vitamin B12", "pg/mL", 200.0, 900.0), ("Sodium", "mmol/L", 136.0, 145.0), ("Potassium", "mmol/L", 3.5, 5.1),
+)
+QUESTIONS = (
+    "Is my hemoglobin normal?", "What does a high LDL cholesterol mean?",
+    "Should I worry about my thyroid results?", "Explain my kidney function tests",
+    "Are my vitamin levels okay?", "What does HbA1c tell me about diabetes?",
+)
+GENERAL_QUESTIONS = ("What is HbA1c?", "How can I lower triglycerides?", "What causes low vitamin D?")
+
+
+def random_record(rng):
+    record = {"duration_months": rng.randint(1, 36), "pain_level": rng.randint(1, 10)}
+    record[rng.choice(CONDITIONS)] = 1
+    for symptom in rng.sample(SYMPTOMS, rng.randint(1, 3)):
+        record[symptom] = 1
+    if rng.random() < 0.5:
+        record["prior_diagnosis_Yes"] = 1
+    if rng.random() < 0.3:
+        record[rng.choice(COMORBIDITIES)] = 1
+    if rng.random() < 0.4:
+        record["preferred_language_Hindi"] = 1
+    return record
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(pages):
+    """Build a minimal text-only PDF; ``pages`` is a list of line lists"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        ops = ["BT", "/F1 9 Tf", "12 TL", "40 800 Td"]
+        for line in lines:
+            ops.append(f"({_pdf_escape(line)}) Tj T*")
+        ops.append("ET")
+        stream = "\n".join(ops).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n" % number + body + b"\nendobj\n")
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def make_lab_report(rng, n_pages, tests_per_page=14):
+    """Synthetic multi-page lab report with a letterhead, patient header and footer on every page"""
+    patient = f"{rng.choice(['Asha', 'Ravi', 'Meera', 'Arjun', 'Priya', 'Vikram'])} {rng.choice(['Sharma', 'Iyer', 'Khan', 'Patel', 'Das'])}"
+    header = [
+        "CITY DIAGNOSTICS LABORATORY",
+        "www.citydiagnostics.example   Phone: 1800 000 0000",
+        f"Patient Name: {patient}   Age: {rng.randint(18, 80)}   Sex: {rng.choice(['Male', 'Female'])}",
+        f"Lab No: {rng.randint(100000, 999999)}   Collected: 12/03/2025",
+        "",
+    ]
+    pages = []
+    for page in range(n_pages):
+        lines = list(header)
+        lines.append(rng.choice(["COMPLETE BLOOD COUNT", "LIPID PROFILE", "LIVER FUNCTION TEST",
+                                 "KIDNEY FUNCTION TEST", "THYROID PROFILE", "BIOCHEMISTRY"]))
+        lines.append("Test   Result   Unit   Reference Range")
+        for name, unit, low, high in rng.sample(LAB_TESTS, min(tests_per_page, len(LAB_TESTS))):
+            value = round(rng.uniform(low * 0.7, high * 1.3), 1)
+            lines.append(f"{name}   {value}   {unit}   {low:g} - {high:g}")
+        lines.extend(["", "This is a computer generated report and does not require a signature.",
+                      f"Page {page + 1} of {n_pages}"])
+        pages.append(lines)
+    return make_pdf(pages)
+
+
+def peak_rss_bytes():
+    """Peak RSS of this process plus its (largest) child, e.g. PDF extraction workers"""
+    scale = 1 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * scale
+    return own, children
+
+
+class LocalTarget:
+    """Drive the Flask app in-process through its test client"""
+
+    def __init__(self):
+        os.environ.setdefault("ML_FAKE_AGENT", "1")
+        import server
+        self.app = server.app
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        return client
+
+    def post_json(self, path, body):
+        response = self._client().post(path, json=body)
+        return response.status_code, response.get_data()
+
+    def post_pdf(self, path, name, data):
+        response = self._client().post(
+            path, data={"pdf": (io.BytesIO(data), name)}, content_type="multipart/form-data"
+        )
+        return response.status_code, response.get_data()
+
+    def rss(self):
+        own, children = peak_rss_bytes()
+        return {"peak_rss_mb": round(own / 2 ** 20, 1), "peak_child_rss_mb": round(children / 2 ** 20, 1)}
+
+
+class HttpTarget:
+    """Drive a running server over HTTP"""
+
+    def __init__(self, base_url, timeout):
+        import httpx
+        self.base_url = base_url.rstrip("/")
+        self.client = httpx.Client(timeout=timeout, limits=httpx.Limits(max_connections=256))
+
+    def post_json(self, path, body):
+        response = self.client.post(self.base_url + path, json=body)
+        return response.status_code, response.content
+
+    def post_pdf(self, path, name, data):
+        response = self.client.post(self.base_url + path, files={"pdf": (name, data, "application/pdf")})
+        return response.status_code, response.content
+
+    def rss(self):
+        try:
+            text = self.client.get(self.base_url + "/metrics").text
+        except Exception:
+            return {}
+        for line in text.splitlines():
+            if line.startswith("ml_process_resident_memory_bytes "):
+                return {"server_rss_mb": round(float(line.split()[1]) / 2 ** 20, 1)}
+        return {}
+
+
+def run_requests(calls, concurrency):
+    """Run zero-argument callables returning (status, body) and summarize their latency"""
+    latencies = []
+    failures = 0
+    lock = threading.Lock()
+
+    def timed(call):
+        nonlocal failures
+        started = time.perf_counter()
+        try:
+            status, _ = call()
+        except Exception as e:
+            print(f"Request error: {e}")
+            status = None
+        elapsed = time.perf_counter() - started
+        with lock:
+            if status is None or status >= 400:
+                failures += 1
+            else:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, calls))
+    return summarize(latencies, failures, time.perf_counter() - started)
+
+
+def bench_predict(target, args, rng):
+    calls = [lambda record=random_record(rng): target.post_json("/predict", record) for _ in range(args.requests)]
+    return run_requests(calls, args.concurrency)
+
+
+def bench_predict_batch(target, args, rng):
+    calls = [
+        lambda records=[random_record(rng) for _ in range(args.batch_size)]: target.post_json(
+            "/predict/batch", {"records": records}
+        )
+        for _ in range(max(args.requests // args.batch_size, 1))
+    ]
+    result = run_requests(calls, args.concurrency)
+    result["rows_per_s"] = round(result["throughput_rps"] * args.batch_size, 1)
+    return result
+
+
+def make_corpus(args, rng):
+    return [(f"report-{i}.pdf", make_lab_report(rng, args.pages)) for i in range(args.reports)]
+
+
+def bench_upload(target, args, rng):
+    corpus = make_corpus(args, rng)
+    cold = run_requests([lambda item=item: target.post_pdf("/upload", *item) for item in corpus], args.concurrency)
+    # Same bytes again: served from the PDF text cache
+    warm = run_requests([lambda item=item: target.post_pdf("/upload", *item) for item in corpus], args.concurrency)
+    return {"pages_per_report": args.pages, "avg_pdf_kb": round(sum(len(data) for _, data in corpus) / len(corpus) / 1024, 1),
+            "cold": cold, "cached": warm}
+
+
+def bench_sessions(target, args, rng):
+    session_ids = []
+    for name, data in make_corpus(args, rng):
+        status, body = target.post_pdf("/upload", name, data)
+        if status == 200:
+            session_ids.append(json.loads(body)["session_id"])
+    if not session_ids:
+        return {"error": "no sessions could be created"}
+
+    def question(path):
+        return [
+            lambda session_id=rng.choice(session_ids), query=rng.choice(QUESTIONS): target.post_json(
+                path, {"session_id": session_id, "query": query}
+            )
+            for _ in range(args.requests)
+        ]
+
+    results = {"sessions": len(session_ids)}
+    for path in ("/ask", "/smart_query", "/ask/stream"):
+        results[path] = run_requests(question(path), args.concurrency)
+    results["/ask_general"] = run_requests([
+        lambda query=rng.choice(GENERAL_QUESTIONS): target.post_json("/ask_general", {"query": query})
+        for _ in range(args.requests)
+    ], args.concurrency)
+    results["/extract_data"] = run_requests([
+        lambda session_id=session_id: target.post_json("/extract_data", {"session_id": session_id})
+        for session_id in session_ids
+    ], args.concurrency)
+    return results
+
+
+BENCHMARKS = {
+    "predict": bench_predict,
+    "predict_batch": bench_predict_batch,
+    "upload": bench_upload,
+    "sessions": bench_sessions,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", metavar="scenario", help=f"any of {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--base-url", help="benchmark a running server instead of the in-process app")
+    parser.add_argument("-n", "--requests", type=int, default=500)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--reports", type=int, default=20, help="synthetic PDFs for upload/sessions")
+    parser.add_argument("--pages", type=int, default=6, help="pages per synthetic PDF")
+    parser.add_argument("--chunk-delay-ms", type=float, help="FakeAgent delay between chunks")
+    parser.add_argument("--chunk-chars", type=int, help="FakeAgent characters per chunk")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--write-pdfs", metavar="DIR", help="only write the synthetic corpus to DIR")
+    args = parser.parse_args()
+
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(sorted(unknown))}")
+    rng = random.Random(args.seed)
+    if args.write_pdfs:
+        os.makedirs(args.write_pdfs, exist_ok=True)
+        for name, data in make_corpus(args, rng):
+            with open(os.path.join(args.write_pdfs, name), "wb") as f:
+                f.write(data)
+        print(f"Wrote {args.reports} reports to {args.write_pdfs}")
+        return
+
+    if args.chunk_delay_ms is not None:
+        os.environ["FAKE_AGENT_CHUNK_DELAY_MS"] = str(args.chunk_delay_ms)
+    if args.chunk_chars is not None:
+        os.environ["FAKE_AGENT_CHUNK_CHARS"] = str(args.chunk_chars)
+    target = HttpTarget(args.base_url, args.timeout) if args.base_url else LocalTarget()
+
+    results = {}
+    for scenario in args.scenarios or SCENARIOS:
+        print(f"Running {scenario}...", file=sys.stderr)
+        results[scenario] = BENCHMARKS[scenario](target, args, rng)
+    results["memory"] = target.rss()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+
+class SingleFlightCache:
+    """LRU memo where concurrent callers for the same key share one computation
+
+    ``compute`` returns ``(value, cacheable)``; failed results are handed to
+    every waiting caller but not remembered, so the next call retries.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, key, compute):
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return self._results[key]
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            value, cacheable = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._in_flight[key]
+            if cacheable:
+                self._results[key] = value
+                while len(self._results) > self.max_entries:
+                    self._results.popitem(last=False)
+        future.set_result(value)
+        return value
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._results),
+                "in_flight": len(self._in_flight),
+                "hits": self.hits,
+                "misses": self.misses
+            }
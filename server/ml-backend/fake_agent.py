@@ -0,0 +1,76 @@
+"""Offline stand-in for the phi agents, for benchmarks and local load tests
+
+Set ``ML_FAKE_AGENT=1`` and server.py builds FakeAgents instead of Gemini
+agents. FAKE_AGENT_CHUNK_DELAY_MS, FAKE_AGENT_CHUNK_CHARS,
+FAKE_AGENT_RESPONSE_CHARS and FAKE_AGENT_FIRST_CHUNK_MS shape the stream.
+"""
+import asyncio
+import os
+import time
+
+LOREM = (
+    "Your results are mostly within the reference ranges. Hemoglobin is slightly low, "
+    "which can be associated with fatigue. Please discuss these values with your doctor, "
+    "who can interpret them alongside your history and any symptoms. "
+)
+
+
+class FakeChunk:
+    """The part of phi's RunResponse the server reads"""
+
+    __slots__ = ("content",)
+
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeAgent:
+    """Stream a canned answer with configurable latency and chunking
+
+    ``run(prompt, stream=True)`` yields FakeChunks like ``phi.agent.Agent``;
+    with ``stream=False`` it returns a single FakeChunk holding the whole
+    answer. ``arun`` is the asyncio equivalent used by asgi.py.
+    """
+
+    def __init__(self, name="fake", chunk_delay_ms=20.0, chunk_chars=40, response_chars=800,
+                 first_chunk_ms=None, text=None):
+        self.name = name
+        self.chunk_delay = max(chunk_delay_ms, 0.0) / 1000.0
+        self.first_chunk_delay = self.chunk_delay if first_chunk_ms is None else max(first_chunk_ms, 0.0) / 1000.0
+        self.chunk_chars = max(int(chunk_chars), 1)
+        base = text or LOREM
+        self.text = (base * (response_chars // len(base) + 1))[:response_chars]
+
+    @classmethod
+    def from_env(cls, name):
+        first_chunk_ms = os.getenv('FAKE_AGENT_FIRST_CHUNK_MS')
+        return cls(
+            name,
+            chunk_delay_ms=float(os.getenv('FAKE_AGENT_CHUNK_DELAY_MS', '20')),
+            chunk_chars=int(os.getenv('FAKE_AGENT_CHUNK_CHARS', '40')),
+            response_chars=int(os.getenv('FAKE_AGENT_RESPONSE_CHARS', '800')),
+            first_chunk_ms=float(first_chunk_ms) if first_chunk_ms else None
+        )
+
+    def _pieces(self):
+        return [self.text[i:i + self.chunk_chars] for i in range(0, len(self.text), self.chunk_chars)]
+
+    def _stream(self):
+        for i, piece in enumerate(self._pieces()):
+            time.sleep(self.first_chunk_delay if i == 0 else self.chunk_delay)
+            yield FakeChunk(piece)
+
+    def run(self, prompt, stream=False):
+        if stream:
+            return self._stream()
+        return FakeChunk("".join(chunk.content for chunk in self._stream()))
+
+    async def _astream(self):
+        for i, piece in enumerate(self._pieces()):
+            await asyncio.sleep(self.first_chunk_delay if i == 0 else self.chunk_delay)
+            yield FakeChunk(piece)
+
+    async def arun(self, prompt, stream=False):
+        if stream:
+            return self._astream()
+        return FakeChunk("".join([chunk.content async for chunk in self._astream()]))
@@ -0,0 +1,269 @@
+import json
+import os
+import queue
+import random
+import tempfile
+import threading
+import time
+import uuid
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import TimingStat, span
+from startup import on_worker_fork
+
+
+class ReportForwarder:
+    """Deliver extracted reports to the main server off the request path
+
+    Reports go into a bounded queue drained by worker threads that share one
+    pooled ``requests.Session``. Failed deliveries are retried with
+    exponential backoff and jitter. When the queue is full or retries run out,
+    reports are written to a spool directory and replayed later. Every POST
+    carries the report's ``delivery_id`` so retries are idempotent. With a
+    ``bulk_url``, up to ``batch_size`` queued reports are sent per POST as
+    ``{"reports": [...]}``.
+    """
+
+    def __init__(self, url, bulk_url=None, spool_dir=None, max_queue=1000, workers=2,
+                 max_retries=5, backoff_base=0.5, backoff_max=30.0, batch_size=10,
+                 timeout=10.0, replay_interval=30.0):
+        self.url = url
+        self.bulk_url = bulk_url
+        self.spool_dir = spool_dir
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.batch_size = max(int(batch_size), 1) if bulk_url else 1
+        self.timeout = timeout
+        self.replay_interval = replay_interval
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 1))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.max_queue = max_queue
+        self.workers = max(workers, 1)
+        self._lock = threading.Lock()
+        self.delivered = 0
+        self.failed = 0
+        self.retries = 0
+        self.spooled = 0
+        self.dead_lettered = 0
+        self.latency = TimingStat()
+
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+
+        self._start()
+        on_worker_fork(self._start)
+
+    def _start(self):
+        # Also runs in each preforked worker: threads do not survive fork, so
+        # each worker gets its own queue and delivery threads.
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"report-forwarder-{i}", daemon=True).start()
+        if self.spool_dir:
+            threading.Thread(target=self._replay_loop, name="report-forwarder-replay", daemon=True).start()
+
+    def enqueue(self, payload):
+        """Accept a report for delivery; returns its delivery id
+
+        Raises OSError only if the queue is full and the report cannot be
+        spooled to disk either.
+        """
+        item = {"id": str(uuid.uuid4()), "payload": payload, "enqueued_at": time.time()}
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._spool(item)
+        return item["id"]
+
+    def _work(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._deliver(batch)
+
+    @staticmethod
+    def _body(item):
+        # The delivery id lets the main server drop duplicates of a retried or replayed report
+        return {**item["payload"], "delivery_id": item["id"]}
+
+    def _post(self, batch):
+        if self.bulk_url and len(batch) > 1:
+            return self.session.post(
+                self.bulk_url, json={"reports": [self._body(item) for item in batch]}, timeout=self.timeout
+            )
+        return self.session.post(self.url, json=self._body(batch[0]), timeout=self.timeout)
+
+    def _deliver(self, batch):
+        if len(batch) > 1 and not self.bulk_url:
+            for item in batch:
+                self._deliver([item])
+            return
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                with self._lock:
+                    self.retries += 1
+                delay = min(self.backoff_base * (2 ** (attempt - 1)), self.backoff_max)
+                time.sleep(delay * random.uniform(0.5, 1.0))
+            try:
+                with span("forward_post"):
+                    response = self._post(batch)
+            except requests.exceptions.RequestException as e:
+                print(f"Error sending to external backend: {e}")
+                continue
+
+            if 200 <= response.status_code < 300:
+                rejected = self._rejected_count(response) if len(batch) > 1 else 0
+                now = time.time()
+                for item in batch:
+                    self.latency.add(now - item["enqueued_at"])
+                with self._lock:
+                    self.delivered += len(batch) - rejected
+                    self.failed += rejected
+                return
+            if len(batch) > 1 and 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                # One bad report (or a body over the server's size limit) must not sink the others
+                print(f"External backend rejected a batch of {len(batch)}: status code {response.status_code}; sending individually")
+                for item in batch:
+                    self._deliver([item])
+                return
+            if 400 <= response.status_code < 500 and response.status_code not in (408, 429):
+                # The report itself was rejected; retrying will not help
+                print(f"External backend rejected report: status code {response.status_code}")
+                with self._lock:
+                    self.failed += len(batch)
+                return
+            print(f"External backend returned status code: {response.status_code}")
+
+        for item in batch:
+            try:
+                self._spool(item)
+            except OSError as e:
+                print(f"Failed to spool report {item['id']}: {e}")
+                with self._lock:
+                    self.failed += 1
+
+    @staticmethod
+    def _rejected_count(response):
+        """Items the bulk route reported as invalid in an otherwise accepted batch"""
+        try:
+            errors = response.json().get("errors") or []
+        except (ValueError, AttributeError):
+            return 0
+        for error in errors:
+            print(f"External backend rejected report {error.get('delivery_id') or error.get('index')}: {error.get('message')}")
+        return len(errors)
+
+    def _spool(self, item):
+        if not self.spool_dir:
+            raise OSError("Forwarding queue is full and no spool directory is configured")
+        name = f"{int(item['enqueued_at'] * 1000):015d}-{item['id']}.json"
+        fd, tmp_path = tempfile.mkstemp(dir=self.spool_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(item, f)
+        os.replace(tmp_path, os.path.join(self.spool_dir, name))
+        with self._lock:
+            self.spooled += 1
+
+    def _spool_files(self):
+        return sorted(name for name in os.listdir(self.spool_dir) if name.endswith(".json"))
+
+    def _claim_dir(self):
+        return os.path.join(self.spool_dir, f".claimed-{os.getpid()}")
+
+    def _release_orphaned_claims(self):
+        """Move files claimed by processes that have exited back into the spool"""
+        for name in os.listdir(self.spool_dir):
+            if not name.startswith(".claimed-"):
+                continue
+            try:
+                pid = int(name[len(".claimed-"):])
+            except ValueError:
+                continue
+            if pid == os.getpid():
+                continue
+            try:
+                os.kill(pid, 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue
+            claim_dir = os.path.join(self.spool_dir, name)
+            try:
+                for filename in os.listdir(claim_dir):
+                    os.replace(os.path.join(claim_dir, filename), os.path.join(self.spool_dir, filename))
+                os.rmdir(claim_dir)
+            except FileNotFoundError:
+                pass  # another process is releasing the same claims
+
+    def replay_spool(self):
+        """Move spooled reports back onto the queue while it has room
+
+        Each file is first claimed by renaming it into a per-process directory,
+        so when several workers share the spool only one of them replays it.
+        """
+        self._release_orphaned_claims()
+        claim_dir = self._claim_dir()
+        os.makedirs(claim_dir, exist_ok=True)
+        replayed = 0
+        for name in self._spool_files():
+            path = os.path.join(self.spool_dir, name)
+            claimed = os.path.join(claim_dir, name)
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue  # another process claimed it first
+            try:
+                with open(claimed) as f:
+                    item = json.load(f)
+            except (OSError, ValueError) as e:
+                # Retrying will not make it readable; set it aside as <name>.bad for inspection
+                print(f"Dead-lettering unreadable spooled report {name}: {e}")
+                os.replace(claimed, path + ".bad")
+                with self._lock:
+                    self.dead_lettered += 1
+                continue
+            try:
+                self._queue.put_nowait(item)
+            except queue.Full:
+                os.replace(claimed, path)
+                break
+            os.remove(claimed)
+            replayed += 1
+        return replayed
+
+    def _replay_loop(self):
+        while True:
+            time.sleep(self.replay_interval)
+            try:
+                self.replay_spool()
+            except OSError as e:
+                print(f"Spool replay error: {e}")
+
+    def stats(self):
+        with self._lock:
+            counters = {
+                "delivered": self.delivered,
+                "failed": self.failed,
+                "retries": self.retries,
+                "spooled_total": self.spooled,
+                "dead_lettered": self.dead_lettered
+            }
+        return {
+            "queue_depth": self._queue.qsize(),
+            "spool_depth": len(self._spool_files()) if self.spool_dir else 0,
+            **counters,
+            "delivery_latency": self.latency.snapshot()
+        }
@@ -0,0 +1,24 @@
+import os
+
+# Load the app (models, agents, PDF stack) once in the master and fork
+# workers from it so they share those pages copy-on-write.
+os.environ.setdefault("ML_PRELOAD", "1")
+preload_app = True
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "2"))
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+# Keep two threads per worker free of LLM traffic for /chat and /predict
+os.environ.setdefault("LLM_MAX_IN_FLIGHT", str(max(threads - 2, 1)))
+# In-memory sessions are per process; workers must share one store or a
+# follow-up request routed to another worker loses the uploaded report
+os.environ.setdefault("SESSION_BACKEND", "sqlite")
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+wsgi_app = "server:app"
+
+
+def post_fork(server, worker):
+    # Restart the app's background threads (batcher, forwarder, sweepers) in each worker;
+    # os.register_at_fork would also start them in the PDF extraction pool's children
+    from startup import after_worker_fork
+    after_worker_fork()
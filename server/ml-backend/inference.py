@@ -0,0 +1,172 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics import TimingStat
+from startup import on_worker_fork
+
+
+class InvalidRecord(ValueError):
+    """A patient record that cannot be encoded; the request, not the model, is at fault"""
+
+
+class FeatureEncoder:
+    """Encode patient records straight into the model's feature matrix"""
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.column_index = {col: i for i, col in enumerate(self.columns)}
+
+    def encode(self, records):
+        """Encode a list of record dicts into a (len(records), n_features) matrix
+
+        Unknown keys are ignored and missing columns stay 0, matching the old
+        DataFrame reindexing behaviour. Raises InvalidRecord naming the record
+        index for non-object records and non-numeric feature values.
+        """
+        matrix = np.zeros((len(records), len(self.columns)), dtype=np.float64)
+        column_index = self.column_index
+        for row, record in enumerate(records):
+            if not isinstance(record, dict):
+                raise InvalidRecord(f"Record {row} is not a JSON object")
+            for key, value in record.items():
+                col = column_index.get(key)
+                if col is not None and value is not None:
+                    try:
+                        matrix[row, col] = float(value)
+                    except (TypeError, ValueError):
+                        raise InvalidRecord(f"Record {row}: {key} must be a number, got {value!r}") from None
+        return matrix
+
+    def encode_one(self, record):
+        """Encode a single record into a (1, n_features) matrix"""
+        return self.encode([record])
+
+
+class MicroBatcher:
+    """Coalesce concurrent single-row predictions into batched model calls
+
+    Callers block in ``submit`` while a worker thread collects requests for up
+    to ``window_ms`` (or until ``max_batch_size`` rows are queued), runs one
+    ``predict_fn`` over the stacked rows and hands each caller its own row.
+    """
+
+    def __init__(self, predict_fn, window_ms=3.0, max_batch_size=32):
+        self.predict_fn = predict_fn
+        self.window = max(window_ms, 0) / 1000.0
+        self.max_batch_size = max(int(max_batch_size), 1)
+        self._start()
+        on_worker_fork(self._start)
+
+    def _start(self):
+        # Also runs in each preforked worker: threads do not survive fork, so
+        # each worker gets its own queue and batching thread.
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._batch_sizes = {}
+        self._queue_time = TimingStat()
+        self._inference_time = TimingStat()
+        self._worker = threading.Thread(target=self._run, name="predict-batcher", daemon=True)
+        self._worker.start()
+
+    def enqueue(self, features):
+        """Queue one (1, n_features) row; the returned Future resolves to its row"""
+        future = Future()
+        self._queue.put((features, time.perf_counter(), future))
+        return future
+
+    def submit(self, features, timeout=None):
+        """Queue one (1, n_features) row and wait for its probability row"""
+        return self.enqueue(features).result(timeout=timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            for _, enqueued, _ in batch:
+                self._queue_time.add(started - enqueued)
+            try:
+                probabilities = self.predict_fn(np.vstack([features for features, _, _ in batch]))
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            finally:
+                self._inference_time.add(time.perf_counter() - started)
+                with self._lock:
+                    self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+            for row, (_, _, future) in enumerate(batch):
+                future.set_result(probabilities[row])
+
+    def stats(self):
+        """Return batch-size histogram and queue/inference timing totals"""
+        with self._lock:
+            histogram = dict(sorted(self._batch_sizes.items()))
+        return {
+            "window_ms": self.window * 1000.0,
+            "max_batch_size": self.max_batch_size,
+            "queue_depth": self._queue.qsize(),
+            "batch_size_histogram": histogram,
+            "queue_time": self._queue_time.snapshot(),
+            "inference_time": self._inference_time.snapshot()
+        }
+
+
+def top_k(probabilities, k):
+    """Return (indices, values) of the k largest entries of every row, best first
+
+    Uses argpartition so only the k winners per row are sorted.
+    """
+    probabilities = np.atleast_2d(probabilities)
+    k = min(max(int(k), 0), probabilities.shape[1])
+    if k == 0:
+        empty = np.empty((probabilities.shape[0], 0))
+        return empty.astype(np.intp), empty
+    if k < probabilities.shape[1]:
+        candidates = np.argpartition(probabilities, -k, axis=1)[:, -k:]
+    else:
+        candidates = np.broadcast_to(np.arange(k), probabilities.shape)
+    candidate_values = np.take_along_axis(probabilities, candidates, axis=1)
+    order = np.argsort(-candidate_values, axis=1, kind="stable")
+    indices = np.take_along_axis(candidates, order, axis=1)
+    return indices, np.take_along_axis(candidate_values, order, axis=1)
+
+
+class NurseRanker:
+    """Rank nurses for batched probability matrices using a precomputed id lookup"""
+
+    def __init__(self, nurse_map):
+        # Model class index i corresponds to nurse number i + 1
+        size = max(nurse_map) if nurse_map else 0
+        self.nurse_ids = np.empty(size, dtype=object)
+        for nurse_num, nurse_id in nurse_map.items():
+            self.nurse_ids[nurse_num - 1] = nurse_id
+
+    def rank(self, probabilities, n=3):
+        """Return the top-n ``{"nurse_id", "probability"}`` lists for every row"""
+        indices, values = top_k(probabilities, n)
+        ids = self.nurse_ids[indices].tolist()
+        values = np.round(values, 4).tolist()
+        return [
+            [
+                {"nurse_id": nurse_id, "probability": prob}
+                for nurse_id, prob in zip(row_ids, row_values)
+            ]
+            for row_ids, row_values in zip(ids, values)
+        ]
@@ -0,0 +1,356 @@
+"""Local parsing of the 7-question patient intake into nurse-model features
+
+The answers to the intake questions (see ``questions`` in server.py) are
+mostly short and predictable, so they are parsed with rules and keyword
+matching against the model's one-hot vocabulary. Only answers the rules
+cannot resolve are sent, together, to one LLM normalization call.
+"""
+import json
+import re
+import uuid
+
+FIELDS = ("disease", "duration_months", "symptoms", "pain_level",
+          "prior_diagnosis", "comorbidity", "preferred_language")
+# Fields the model cannot do without; the others fall back to "none reported"
+REQUIRED_FIELDS = ("duration_months", "pain_level")
+
+WORD_NUMBERS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7,
+    "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "half": 0.5, "couple": 2, "few": 3,
+}
+# Pain needs a definite number; "a", "few" and "couple" only make sense as amounts of time
+PAIN_NUMBERS = {word: value for word, value in WORD_NUMBERS.items()
+                if word not in ("a", "an", "couple", "few") and 1 <= value <= 10}
+UNIT_MONTHS = {"day": 1 / 30.0, "week": 12 / 52.0, "month": 1.0, "year": 12.0, "yr": 12.0, "mo": 1.0}
+_UNIT = r"(day|week|month|year|yr|mo)s?\b"
+# "half a year", "one and a half years", "a year and a half"
+HALF_UNIT = re.compile(rf"\bhalf (?:an? )?{_UNIT}")
+AND_A_HALF_UNIT = re.compile(rf"(\d+(?:\.\d+)?|[a-z]+) and an? half {_UNIT}")
+UNIT_AND_A_HALF = re.compile(rf"(\d+(?:\.\d+)?|[a-z]+) {_UNIT} and an? half\b")
+# Fractions left after the halves are rewritten are read wrongly by the unit pattern
+FRACTION = re.compile(r"\b(half|quarter|third)\b|\d\s*/\s*\d")
+# 100 years; also rejects calendar years given alone ("since 2019")
+MAX_DURATION_MONTHS = 1200
+PAIN_WORDS = {"no pain": 1, "none": 1, "mild": 3, "slight": 2, "moderate": 5, "bad": 7,
+              "severe": 8, "very severe": 9, "unbearable": 10, "worst": 10, "excruciating": 10}
+YES = frozenset("yes y yeah yep yup ya haan han ha ji correct true diagnosed".split())
+NO = frozenset("no n nope nah nahi not never false".split())
+UNSURE = re.compile(r"\b(not sure|unsure|no idea|(?:don'?t|do not) know|not certain|pata nahi?)\b", re.IGNORECASE)
+NONE_ANSWERS = re.compile(r"^\s*(no|none|nothing|nil|na|n/a|not really|no other|nope)\b", re.IGNORECASE)
+# A negation covers the rest of its clause: "no swelling, just fatigue" only reports fatigue
+NEGATION = re.compile(r"\b(no|not|without|never|none|(?:do|does|did)n'?t|do not|does not|denies|deny)\b", re.IGNORECASE)
+CLAUSE_BREAK = re.compile(r"[,.;:!?]|\b(?:but|just|only|except)\b", re.IGNORECASE)
+# Mentions that name a condition without the patient having it ("low blood sugar" is not Diabetes)
+NOT_A_CONDITION = re.compile(r"\blow (?:blood )?(?:sugar|bp|blood pressure)\b", re.IGNORECASE)
+# Answers about someone else's health; the rules cannot tell whose condition is whose
+THIRD_PARTY = re.compile(
+    r"\b(mother|father|mom|mum|dad|parents?|brother|sister|siblings?|son|daughter|wife|husband|"
+    r"grand\w*|uncle|aunt|cousin|family|relatives?|friend)\b",
+    re.IGNORECASE
+)
+LANGUAGES = {"english": "English", "angrezi": "English", "hindi": "Hindi", "हिंदी": "Hindi", "हिन्दी": "Hindi"}
+
+# Extra phrasings for the model's one-hot columns; the column names themselves always match
+SYNONYMS = {
+    "Diabetes": ("diabetic", "sugar", "blood sugar", "madhumeh"),
+    "Hypertension": ("high blood pressure", "high bp"),
+    "Asthma": ("asthmatic", "wheezing"),
+    "Arthritis": ("arthritic", "rheumatoid", "osteoarthritis", "gout"),
+    "swelling": ("swollen", "swell", "edema", "oedema"),
+    "nausea": ("nauseous", "nauseated", "vomit", "vomiting", "queasy"),
+    "frequent urination": ("urinating often", "urinate often", "peeing a lot", "frequent urge to urinate", "polyuria"),
+    "coughing": ("cough", "coughs"),
+    "fatigue": ("tired", "tiredness", "exhausted", "exhaustion", "weakness", "weak", "lethargy"),
+    "light sensitivity": ("sensitive to light", "photophobia", "bright light"),
+    "joint pain": ("joints hurt", "aching joints", "painful joints", "knee pain", "joint ache"),
+    "stiffness": ("stiff", "stiff joints"),
+    "shortness of breath": ("breathless", "breathlessness", "short of breath", "difficulty breathing", "trouble breathing"),
+    "comorbidity_Kidney Issues": ("kidney", "renal", "ckd"),
+    "comorbidity_Liver Disease": ("liver", "hepatic", "fatty liver", "hepatitis", "cirrhosis"),
+    "comorbidity_Lung Disease": ("lung", "copd", "respiratory", "bronchitis"),
+    "comorbidity_Thyroid": ("thyroid", "hypothyroid", "hyperthyroid", "hypothyroidism", "hyperthyroidism"),
+}
+
+
+def _number(token):
+    token = token.lower()
+    if token in WORD_NUMBERS:
+        return float(WORD_NUMBERS[token])
+    try:
+        return float(token)
+    except ValueError:
+        return None
+
+
+def _half_more(match):
+    value = _number(match.group(1))
+    return match.group(0) if value is None else f"{value + 0.5:g} {match.group(2)}"
+
+
+def parse_duration(text):
+    """Months from answers like "6", "2 years", "three weeks", "1.5 yrs"; None when unclear"""
+    text = text.lower().replace(",", ".")
+    text = AND_A_HALF_UNIT.sub(_half_more, text)
+    text = UNIT_AND_A_HALF.sub(_half_more, text)
+    text = HALF_UNIT.sub(r"0.5 \1", text)
+    if FRACTION.search(text):
+        return None
+    total = 0.0
+    found = False
+    for amount, unit in re.findall(r"(\d+(?:\.\d+)?|[a-z]+)\s*(day|week|month|year|yr|mo)s?\b", text):
+        value = _number(amount)
+        if value is not None:
+            total += value * UNIT_MONTHS[unit]
+            found = True
+    if not found:
+        numbers = re.findall(r"\d+(?:\.\d+)?", text)
+        if len(numbers) != 1:
+            return None
+        total = float(numbers[0])
+    return round(total, 1) if total <= MAX_DURATION_MONTHS else None
+
+
+def _negated_spans(text):
+    """(start, end) of every clause remainder that follows a negation"""
+    spans = []
+    start = 0
+    for clause_break in [*CLAUSE_BREAK.finditer(text), None]:
+        end = clause_break.start() if clause_break else len(text)
+        negation = NEGATION.search(text, start, end)
+        if negation:
+            spans.append((negation.start(), end))
+        start = clause_break.end() if clause_break else end
+    return spans
+
+
+def _negated(position, spans):
+    return any(start <= position < end for start, end in spans)
+
+
+def parse_pain(text):
+    """Pain level 1-10 from "7", "7/10", "seven" or words like "moderate"; None when unclear
+
+    A negated level ("not bad", "not 7") only says what the pain is not, so
+    it is skipped and, failing any other level, left to the LLM.
+    """
+    lowered = text.lower().strip()
+    negated = _negated_spans(lowered)
+    number = re.search(r"\d+(?:\.\d+)?", lowered)
+    if number:
+        value = float(number.group(0))
+        return value if 1 <= value <= 10 and not _negated(number.start(), negated) else None
+    for word in re.finditer(r"[a-z]+", lowered):
+        if word.group(0) in PAIN_NUMBERS:
+            return None if _negated(word.start(), negated) else float(PAIN_NUMBERS[word.group(0)])
+    for phrase in sorted(PAIN_WORDS, key=len, reverse=True):
+        match = re.search(rf"\b{re.escape(phrase)}\b", lowered)
+        # "no pain" and "none" are negations themselves
+        if match and (phrase in ("no pain", "none") or not _negated(match.start(), negated)):
+            return float(PAIN_WORDS[phrase])
+    return None
+
+
+def parse_yes_no(text):
+    """True/False for yes/no answers (English and Hinglish); None when unclear"""
+    if UNSURE.search(text):
+        return None
+    words = re.findall(r"[a-z]+", text.lower())
+    if not words:
+        return None
+    if words[0] in YES:
+        return True
+    if words[0] in NO:
+        return False
+    return None
+
+
+def parse_language(text):
+    lowered = text.lower()
+    matches = {language for key, language in LANGUAGES.items() if key in lowered}
+    return matches.pop() if len(matches) == 1 else None
+
+
+class IntakeParser:
+    """Turn intake answers into a feature record for the nurse model
+
+    The one-hot vocabulary comes from the model's ``columns``: ``comorbidity_*``,
+    ``prior_diagnosis_Yes`` and ``preferred_language_Hindi`` are recognised by
+    name, capitalized columns are diagnosed conditions and the remaining
+    lowercase ones are symptoms.
+    """
+
+    def __init__(self, columns):
+        self.columns = list(columns)
+        self.comorbidities = [c for c in self.columns if c.startswith("comorbidity_")]
+        named = {"duration_months", "pain_level", "prior_diagnosis_Yes", "preferred_language_Hindi", *self.comorbidities}
+        self.conditions = [c for c in self.columns if c not in named and c[:1].isupper()]
+        self.symptoms = [c for c in self.columns if c not in named and not c[:1].isupper()]
+        self._patterns = {
+            column: re.compile(
+                r"\b(" + "|".join(re.escape(term) for term in
+                                  sorted({self._label(column).lower(), *SYNONYMS.get(column, ())}, key=len, reverse=True))
+                + r")\b",
+                re.IGNORECASE
+            )
+            for column in self.conditions + self.symptoms + self.comorbidities
+        }
+
+    @staticmethod
+    def _label(column):
+        return column.split("_", 1)[1] if column.startswith("comorbidity_") else column
+
+    def labels(self, field):
+        """Allowed values for a categorical field, as shown to the LLM"""
+        if field == "disease":
+            return list(self.conditions)
+        if field == "symptoms":
+            return list(self.symptoms)
+        if field == "comorbidity":
+            return [self._label(column) for column in self.comorbidities]
+        return []
+
+    def match(self, text, candidates):
+        """Columns mentioned in ``text``, skipping mentions that follow a negation in the same clause"""
+        negated = _negated_spans(text) + [m.span() for m in NOT_A_CONDITION.finditer(text)]
+        return [
+            column for column in candidates
+            if any(not _negated(m.start(), negated) for m in self._patterns[column].finditer(text))
+        ]
+
+    def _match_many(self, text, candidates):
+        matched = self.match(text, candidates)
+        if matched:
+            return matched
+        return [] if NONE_ANSWERS.match(text) else None
+
+    def parse_field(self, field, text):
+        """Parse one answer; returns the normalized value or None when it is ambiguous"""
+        text = str(text).strip()
+        if not text:
+            return None
+        if field in ("disease", "symptoms", "comorbidity") and THIRD_PARTY.search(text):
+            return None
+        if field == "disease":
+            matched = self.match(text, self.conditions)
+            return matched or ([] if NONE_ANSWERS.match(text) else None)
+        if field == "duration_months":
+            return parse_duration(text)
+        if field == "symptoms":
+            return self._match_many(text, self.symptoms)
+        if field == "pain_level":
+            return parse_pain(text)
+        if field == "prior_diagnosis":
+            return parse_yes_no(text)
+        if field == "comorbidity":
+            return self._match_many(text, self.comorbidities)
+        if field == "preferred_language":
+            return parse_language(text)
+        raise ValueError(f"Unknown intake field {field}")
+
+    def parse(self, answers):
+        """Parse every answer; returns ``(values, ambiguous_fields)``"""
+        values = {}
+        ambiguous = []
+        for field in FIELDS:
+            value = self.parse_field(field, answers.get(field, ""))
+            if value is None:
+                ambiguous.append(field)
+            else:
+                values[field] = value
+        return values, ambiguous
+
+    def vocabulary(self):
+        """Allowed values per field; fixed for a given model, so it belongs in the prompt prefix"""
+        return "\n".join([
+            f"disease: a list chosen from {json.dumps(self.labels('disease'))} (empty list if none apply)",
+            "duration_months: a number of months",
+            f"symptoms: a list chosen from {json.dumps(self.labels('symptoms'))} (empty list if none apply)",
+            "pain_level: a number from 1 to 10",
+            "prior_diagnosis: true or false",
+            f"comorbidity: a list chosen from {json.dumps(self.labels('comorbidity'))} (empty list if none apply)",
+            'preferred_language: "English" or "Hindi"',
+        ])
+
+    @staticmethod
+    def ambiguous_answers(answers, fields, questions):
+        """The question and answer for every field the local parsers could not resolve"""
+        return "\n\n".join(
+            f"{field}\n  Question: {questions[FIELDS.index(field)]}\n  Answer: {answers.get(field, '')}"
+            for field in fields
+        )
+
+    def apply_normalized(self, values, reply, fields):
+        """Merge the LLM's JSON reply into ``values``; returns fields still unresolved
+
+        Every normalized value is run back through the local parsers so only
+        values from the model's vocabulary are accepted.
+        """
+        match = re.search(r"\{.*\}", reply, re.DOTALL)
+        try:
+            normalized = json.loads(match.group(0)) if match else {}
+        except ValueError:
+            normalized = {}
+        unresolved = []
+        for field in fields:
+            raw = normalized.get(field) if isinstance(normalized, dict) else None
+            if raw is None:
+                unresolved.append(field)
+                continue
+            if isinstance(raw, bool):
+                raw = "yes" if raw else "no"
+            if isinstance(raw, list):
+                raw = ", ".join(str(item) for item in raw) or "none"
+            value = self.parse_field(field, str(raw))
+            if value is None:
+                unresolved.append(field)
+            else:
+                values[field] = value
+        return unresolved
+
+    def to_record(self, values):
+        """Build the /predict feature record from parsed values (missing categoricals stay 0)"""
+        record = {
+            "duration_months": values["duration_months"],
+            "pain_level": values["pain_level"],
+        }
+        for column in values.get("disease", []) + values.get("symptoms", []) + values.get("comorbidity", []):
+            record[column] = 1
+        if values.get("prior_diagnosis"):
+            record["prior_diagnosis_Yes"] = 1
+        if values.get("preferred_language") == "Hindi":
+            record["preferred_language_Hindi"] = 1
+        return record
+
+
+def answers_from_payload(answers):
+    """Accept answers as a list in question order or as a dict keyed by field name"""
+    if isinstance(answers, list):
+        return {field: answer for field, answer in zip(FIELDS, answers)}
+    if isinstance(answers, dict):
+        return {field: answers[field] for field in FIELDS if field in answers}
+    raise ValueError("answers must be a list in question order or an object keyed by field")
+
+
+class IntakeStore:
+    """In-progress intakes for the one-question-at-a-time flow
+
+    Answers live in the report session backend (sessions.py), so with
+    SESSION_BACKEND=sqlite or redis any worker can take the next answer.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def start(self):
+        intake_id = str(uuid.uuid4())
+        self.backend.put_intake(intake_id, {})
+        return intake_id
+
+    def get(self, intake_id):
+        return self.backend.get_intake(intake_id)
+
+    def save(self, intake_id, answers):
+        self.backend.put_intake(intake_id, answers)
+
+    def finish(self, intake_id):
+        self.backend.delete_intake(intake_id)
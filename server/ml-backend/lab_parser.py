@@ -0,0 +1,167 @@
+import re
+
+# A comma before exactly three digits groups thousands ("4,500", "1,234,567") or follows
+# Indian grouping ("2,50,000"); any other comma is a decimal comma ("13,5")
+GROUPED = r"\d{1,2}(?:,\d{2})+,\d{3}|\d{1,3}(?:,\d{3})+"
+NUMBER = rf"(?:(?:{GROUPED})(?:\.\d+)?|\d+(?:[.,]\d+)?)"
+_GROUPED_NUMBER = re.compile(rf"(?:{GROUPED})(?:\.\d+)?")
+_DECIMAL_COMMA = re.compile(r"\d+,\d+")
+# A number and a unit inside the name mean the name swallowed the row's real value
+# ("Vitamin B12 171.5 pg/mL" read as the name of a result taken from the range)
+_VALUE_IN_NAME = re.compile(r"\s\d+(?:[.,]\d+)?\s*(?:%|[a-zA-Zµμ]+/[a-zA-Zµμ0-9.]+)")
+# "<name>  [H|L]  <value>  [H|L]  [<unit>]  <reference range>"
+ROW = re.compile(
+    rf"^(?P<name>[A-Za-z][A-Za-z0-9 ,()/%.+\-]*?[A-Za-z0-9)%])\s*[:\-]?\s+"
+    rf"(?:(?P<flag_before>H|L|HIGH|LOW|High|Low)\s+)?"
+    # The value never ends inside a number, so it cannot be the leading digits of the range
+    rf"(?P<value>[<>]?\s?{NUMBER})(?![\d.,]?\d)\s*"
+    rf"(?:(?P<flag_after>H|L|HIGH|LOW|High|Low)\s+)?"
+    rf"(?P<unit>(?:[a-zA-Zµμ%/^*]+[a-zA-Z0-9µμ%/^*.]*)|(?:10\^?\d+/[a-zA-Zµμ]+))?\s*"
+    rf"(?P<range>"
+    rf"(?P<low>{NUMBER})\s*(?:-|–|to)\s*(?P<high>{NUMBER})"
+    rf"|(?P<op>[<>]=?|upto|up to|below|above)\s*(?P<limit>{NUMBER})"
+    rf")"
+    rf"\s*(?P<range_unit>[a-zA-Zµμ%/]+[a-zA-Z0-9µμ%/]*)?\s*$",
+    re.IGNORECASE
+)
+PATIENT_FIELDS = {
+    "name": re.compile(r"(?:patient(?:'s)?\s*name|name)\s*[:\-]\s*(?:(?:mr|mrs|ms|miss|dr)\.?\s+)?([A-Za-z][A-Za-z .']+?)(?=\s{2,}|\s+(?:age|sex|gender)\b|$)", re.IGNORECASE),
+    "age": re.compile(r"\bage\s*(?:/\s*(?:sex|gender))?\s*[:\-]\s*(\d{1,3})", re.IGNORECASE),
+    "gender": re.compile(r"\b(?:sex|gender)\s*[:\-]?\s*(?:\d{1,3}\s*\w*\s*/\s*)?(male|female|m|f)\b", re.IGNORECASE),
+}
+METADATA = re.compile(
+    r"\b(age|sex|gender|date|time|collected|received|reported|registered|sample|specimen|"
+    r"ref\.?\s*by|referred|doctor|dr\.|lab\s*no|patient\s*id|uhid|barcode|page|phone|mobile|pin)\b",
+    re.IGNORECASE
+)
+
+
+def _number(text, decimal_comma=False):
+    """Parse a report number; commas are thousands separators unless ``decimal_comma``
+
+    A comma that cannot be a thousands separator is only read as a decimal
+    point when the row's reference range also uses decimal commas; otherwise
+    the number is ambiguous and ValueError is raised.
+    """
+    text = text.lstrip("<> ").strip()
+    if "," not in text:
+        return float(text)
+    if decimal_comma and _DECIMAL_COMMA.fullmatch(text):
+        return float(text.replace(",", "."))
+    if _GROUPED_NUMBER.fullmatch(text):
+        return float(text.replace(",", ""))
+    raise ValueError(f"Ambiguous comma in {text!r}")
+
+
+def _uses_decimal_comma(*numbers):
+    return any("," in number and not _GROUPED_NUMBER.fullmatch(number) for number in numbers if number)
+
+
+def interpret(value, low=None, high=None, op=None, limit=None):
+    """Return Low/Normal/High for a numeric value against its reference range"""
+    if low is not None and high is not None:
+        if value < low:
+            return "Low"
+        if value > high:
+            return "High"
+        return "Normal"
+    if op is not None and limit is not None:
+        op = op.lower()
+        if op in ("<", "<=", "upto", "up to", "below"):
+            return "High" if value > limit or (op == "<" and value == limit) else "Normal"
+        return "Low" if value < limit or (op == ">" and value == limit) else "Normal"
+    return None
+
+
+def parse_patient(text):
+    """Pull patient name, age and gender from the report header"""
+    details = {}
+    for field, pattern in PATIENT_FIELDS.items():
+        match = pattern.search(text)
+        if match:
+            details[field] = match.group(1).strip()
+    gender = details.get("gender", "").lower()
+    if gender in ("m", "f"):
+        details["gender"] = "Male" if gender == "m" else "Female"
+    elif gender:
+        details["gender"] = gender.capitalize()
+    return details
+
+
+def parse_rows(text):
+    """Parse "Test  Value  Unit  Reference Range" rows
+
+    Returns ``(tests, candidate_lines)`` where candidate lines are the lines
+    that look like they carry a result (letters and a number, not header
+    metadata). Their parse rate is the parser's confidence.
+    """
+    tests = []
+    candidates = 0
+    for line in text.splitlines():
+        line = " ".join(line.split())
+        if not line or not re.search(r"[A-Za-z]", line) or not re.search(r"\d", line):
+            continue
+        if METADATA.search(line):
+            continue
+        candidates += 1
+        match = ROW.match(line)
+        if not match or _VALUE_IN_NAME.search(match.group("name")):
+            continue
+        decimal_comma = _uses_decimal_comma(match.group("low"), match.group("high"), match.group("limit"))
+        try:
+            value = _number(match.group("value"), decimal_comma)
+            if match.group("low") is not None:
+                low, high = _number(match.group("low"), decimal_comma), _number(match.group("high"), decimal_comma)
+                reference = f"{match.group('low')}-{match.group('high')}"
+                interpretation = interpret(value, low, high)
+            else:
+                op, limit = match.group("op"), _number(match.group("limit"), decimal_comma)
+                reference = f"{op} {match.group('limit')}"
+                interpretation = interpret(value, op=op, limit=limit)
+        except ValueError:
+            continue
+        unit = match.group("unit") or match.group("range_unit") or ""
+        tests.append({
+            "name": match.group("name").strip(" :-"),
+            "value": f"{match.group('value').replace(' ', '')} {unit}".strip(),
+            "reference_range": reference,
+            "interpretation": interpretation,
+        })
+    return tests, candidates
+
+
+def parse_lab_report(text, min_tests=3):
+    """Parse a report locally; returns ``(result, confidence)``
+
+    ``confidence`` is the share of result-looking lines that parsed, and 0
+    when fewer than ``min_tests`` tests were found.
+    """
+    tests, candidates = parse_rows(text)
+    confidence = len(tests) / candidates if candidates and len(tests) >= min_tests else 0.0
+    return {"patient": parse_patient(text), "tests": tests}, confidence
+
+
+def format_extraction(result):
+    """Render a parse result in the same layout the extraction agent produces"""
+    patient = result["patient"]
+    lines = [
+        f"- Patient Name: {patient.get('name', '')}",
+        f"- Age: {patient.get('age', '')}",
+        f"- Gender: {patient.get('gender', '')}",
+        "",
+    ]
+    for test in result["tests"]:
+        interpretation = test["interpretation"] or "Normal"
+        lines.extend([
+            f"- Test: {test['name']}",
+            f"  - Value: {test['value']}",
+            f"  - Reference Range: {test['reference_range']}",
+            f"  - Interpretation: {interpretation}",
+            f"  - Risk Category: {'Within reference range' if interpretation == 'Normal' else 'Outside reference range'}",
+        ])
+    abnormal = [f"{test['name']} ({test['interpretation']})" for test in result["tests"]
+                if test["interpretation"] in ("Low", "High")]
+    summary = f"Values outside the reference range: {', '.join(abnormal)}." if abnormal \
+        else "All parsed values are within their reference ranges."
+    lines.extend(["", f"**Summary:** {summary}"])
+    return "\n".join(lines)
@@ -0,0 +1,87 @@
+"""Minimal concurrent load generator for comparing Flask and ASGI serving modes
+
+    # Flask mode
+    python server.py
+    # ASGI mode
+    uvicorn asgi:app --port 5000
+
+    python loadtest.py --path /ask_general --body '{"query": "what is HbA1c"}' -c 100 -n 1000
+
+Run the same command against both modes and compare throughput and latency.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies, failures, elapsed):
+    latencies = sorted(latencies)
+    completed = len(latencies)
+    return {
+        "requests": completed + failures,
+        "failures": failures,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(completed / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000.0, 1),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000.0, 1),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000.0, 1),
+        "max_ms": round(latencies[-1] * 1000.0, 1) if latencies else 0.0
+    }
+
+
+async def run(url, body, concurrency, total, timeout):
+    latencies = []
+    failures = 0
+    remaining = iter(range(total))
+
+    async with httpx.AsyncClient(timeout=timeout, limits=httpx.Limits(max_connections=concurrency)) as client:
+        async def worker():
+            nonlocal failures
+            for _ in remaining:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(url, json=body)
+                    if response.status_code >= 400:
+                        failures += 1
+                        continue
+                except httpx.HTTPError:
+                    failures += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    return summarize(latencies, failures, elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--path", default="/predict")
+    parser.add_argument("--body", default='{"duration_months": 6, "pain_level": 5, "Diabetes": 1}')
+    parser.add_argument("-c", "--concurrency", type=int, default=50)
+    parser.add_argument("-n", "--requests", type=int, default=500)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(
+        args.base_url.rstrip("/") + args.path, json.loads(args.body),
+        args.concurrency, args.requests, args.timeout
+    ))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
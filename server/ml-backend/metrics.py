@@ -0,0 +1,231 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from fast model calls up to slow LLM generations
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TRACE_LOG = os.getenv('ML_TRACE_LOG') == '1'
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+
+
+class TimingStat:
+    """Thread-safe count/sum/max accumulator for durations in seconds"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "total_ms": round(self.total * 1000.0, 3),
+                "avg_ms": round(self.total * 1000.0 / self.count, 3) if self.count else 0.0,
+                "max_ms": round(self.max * 1000.0, 3)
+            }
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """Prometheus-style histogram with one series per label-value tuple"""
+
+    def __init__(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * len(self.buckets) + [0.0, 0]
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, ('le', repr(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, labels, ('le', '+Inf'))} {values[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(values[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, labels)} {values[-1]}")
+        return lines
+
+
+class Counter:
+    """Monotonic counter with one series per label-value tuple"""
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def inc(self, amount=1, *label_values):
+        with self._lock:
+            self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            series = dict(self._series)
+        for labels, value in sorted(series.items()):
+            lines.append(f"{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """Gauge whose value is read from a callback at scrape time"""
+
+    def __init__(self, name, help_text, read):
+        self.name = name
+        self.help_text = help_text
+        self.read = read
+
+    def render(self):
+        try:
+            value = self.read()
+        except Exception as e:
+            print(f"Gauge {self.name} error: {e}")
+            return []
+        if value is None:
+            return []
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge", f"{self.name} {_format_value(value)}"]
+
+
+class MetricsRegistry:
+    """Collection of metrics rendered together in the Prometheus text format"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, label_names=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help_text, label_names, buckets))
+
+    def counter(self, name, help_text, label_names=()):
+        return self.register(Counter(name, help_text, label_names))
+
+    def gauge(self, name, help_text, read):
+        return self.register(Gauge(name, help_text, read))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+REQUEST_LATENCY = registry.histogram(
+    "ml_request_duration_seconds", "Time to produce a response, by route", ("route", "method", "status")
+)
+STAGE_LATENCY = registry.histogram(
+    "ml_stage_duration_seconds", "Time spent in each processing stage", ("stage",)
+)
+AGENT_LATENCY = registry.histogram(
+    "ml_agent_duration_seconds", "Total time of an agent call, including streaming", ("agent",)
+)
+AGENT_FIRST_CHUNK = registry.histogram(
+    "ml_agent_first_chunk_seconds", "Time from an agent call to its first non-empty chunk", ("agent",)
+)
+AGENT_CHUNKS = registry.counter("ml_agent_chunks_total", "Non-empty chunks streamed by agents", ("agent",))
+AGENT_ERRORS = registry.counter("ml_agent_errors_total", "Agent calls that raised", ("agent",))
+
+
+def start_trace(trace_id):
+    """Tag the spans recorded from now on in this context (request) with ``trace_id``"""
+    _trace_id.set(trace_id)
+
+
+def _log_span(kind, name, seconds, detail=""):
+    trace_id = _trace_id.get()
+    print(f"trace={trace_id or '-'} {kind}={name} ms={seconds * 1000.0:.1f}{detail}")
+
+
+@contextmanager
+def span(stage):
+    """Time a block as one processing stage; logged when ML_TRACE_LOG=1"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_LATENCY.observe(seconds, stage)
+        if TRACE_LOG:
+            _log_span("stage", stage, seconds)
+
+
+def record_agent_call(agent, seconds, first_chunk_seconds, chunks, failed=False):
+    """Record one agent call: total time, time to first chunk and chunk count"""
+    AGENT_LATENCY.observe(seconds, agent)
+    if first_chunk_seconds is not None:
+        AGENT_FIRST_CHUNK.observe(first_chunk_seconds, agent)
+    if chunks:
+        AGENT_CHUNKS.inc(chunks, agent)
+    if failed:
+        AGENT_ERRORS.inc(1, agent)
+    if TRACE_LOG:
+        first = "n/a" if first_chunk_seconds is None else f"{first_chunk_seconds * 1000.0:.1f}"
+        _log_span("agent", agent, seconds, f" first_chunk_ms={first} chunks={chunks}{' failed' if failed else ''}")
+
+
+def traced_chunks(agent_name, agent, prompt):
+    """Stream ``agent.run(prompt, stream=True)`` while recording the call's timings"""
+    started = time.perf_counter()
+    first_chunk = None
+    chunks = 0
+    failed = False
+    try:
+        for chunk in agent.run(prompt, stream=True):
+            if chunk.content:
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - started
+                chunks += 1
+            yield chunk
+    except Exception:
+        failed = True
+        raise
+    finally:
+        record_agent_call(agent_name, time.perf_counter() - started, first_chunk, chunks, failed)
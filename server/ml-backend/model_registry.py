@@ -0,0 +1,218 @@
+import json
+import os
+import pickle
+import re
+import resource
+import sys
+import threading
+import time
+from datetime import datetime
+
+import joblib
+import numpy as np
+
+from inference import NurseRanker
+from startup import on_worker_fork
+
+DEFAULT_MODEL_PATHS = ("model.joblib", "model.pkl")
+NURSE_MAP_FILENAME = "nurse_map.json"
+
+
+def resolve_model_path(path=None):
+    """Pick the explicit path, else the first existing default artifact"""
+    if path:
+        return path
+    for candidate in DEFAULT_MODEL_PATHS:
+        if os.path.exists(candidate):
+            return candidate
+    return DEFAULT_MODEL_PATHS[-1]
+
+
+def save_model(model, path):
+    """Save an estimator uncompressed so its arrays can be memory-mapped on load"""
+    joblib.dump(model, path, compress=0)
+    return path
+
+
+def load_model(path, mmap_mode="r"):
+    """Load an estimator, memory-mapping its arrays for joblib artifacts
+
+    Arrays loaded with ``mmap_mode="r"`` are backed by the page cache, so
+    forked workers share them read-only instead of each holding a private copy.
+    Legacy ``.pkl`` files are still read with pickle.
+    """
+    if path.endswith(".pkl"):
+        with open(path, "rb") as f:
+            return pickle.load(f)
+    return joblib.load(path, mmap_mode=mmap_mode)
+
+
+def current_rss_bytes():
+    """Resident set size of this process, falling back to peak RSS off Linux"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def find_model_file(directory):
+    """Return the model artifact inside a version directory, if any"""
+    for filename in DEFAULT_MODEL_PATHS:
+        candidate = os.path.join(directory, filename)
+        if os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def version_key(name):
+    """Sort key comparing the digit runs of a version name numerically, so v10 > v9"""
+    return [int(part) if i % 2 else part for i, part in enumerate(re.split(r"(\d+)", name))]
+
+
+def load_nurse_map(path):
+    """Read a ``{"<nurse number>": "<uuid>"}`` JSON file into an int-keyed dict"""
+    with open(path) as f:
+        return {int(nurse_num): nurse_id for nurse_num, nurse_id in json.load(f).items()}
+
+
+class ModelVersion:
+    """An immutable, warmed model together with its class->nurse mapping"""
+
+    def __init__(self, version, path, model, nurse_map, load_ms):
+        self.version = version
+        self.path = path
+        self.model = model
+        self.nurse_map = nurse_map
+        self.ranker = NurseRanker(nurse_map)
+        self.load_ms = load_ms
+        self.loaded_at = datetime.now()
+
+    def info(self):
+        return {
+            "version": self.version,
+            "path": self.path,
+            "n_classes": len(self.nurse_map),
+            "load_ms": round(self.load_ms, 1),
+            "loaded_at": self.loaded_at.isoformat()
+        }
+
+
+class ModelManager:
+    """Hold the active model version and hot-swap newer ones from a directory
+
+    Versions live in ``<model_dir>/<version>/`` with a ``model.joblib`` (or
+    ``model.pkl``) and an optional ``nurse_map.json``; the greatest version
+    wins, comparing digit runs as numbers (``v10`` is newer than ``v9``). Publish a version by writing it to a temporary
+    directory and renaming it into place. A new version is loaded and warmed
+    with a canary prediction off the request path, then swapped in with a
+    single reference assignment, so in-flight requests keep the version they
+    already read from ``active``.
+    """
+
+    def __init__(self, n_features, default_nurse_map, model_dir=None, model_path=None, poll_interval=30.0):
+        self.n_features = n_features
+        self.default_nurse_map = dict(default_nurse_map)
+        self.model_dir = model_dir
+        self.poll_interval = poll_interval
+        self.last_error = None
+        self._load_lock = threading.Lock()
+        self._watcher = None
+
+        latest = self.latest_version()
+        if latest:
+            self.active = self._build(latest, os.path.join(model_dir, latest))
+        else:
+            path = resolve_model_path(model_path)
+            self.active = self._build("static", os.path.dirname(path) or ".", path)
+
+    def latest_version(self):
+        """Return the newest complete version name in the model directory"""
+        if not self.model_dir or not os.path.isdir(self.model_dir):
+            return None
+        versions = [
+            name for name in os.listdir(self.model_dir)
+            if not name.startswith(".") and find_model_file(os.path.join(self.model_dir, name))
+        ]
+        return max(versions, key=version_key) if versions else None
+
+    def _build(self, version, directory, path=None):
+        path = path or find_model_file(directory)
+        if path is None:
+            raise FileNotFoundError(f"No model artifact in {directory}")
+        map_path = os.path.join(directory, NURSE_MAP_FILENAME)
+        nurse_map = load_nurse_map(map_path) if os.path.exists(map_path) else self.default_nurse_map
+
+        started = time.perf_counter()
+        model = load_model(path)
+        # Canary prediction warms the estimator and validates the mapping
+        canary = model.predict_proba(np.zeros((1, self.n_features)))
+        candidate = ModelVersion(version, path, model, nurse_map, 0.0)
+        if canary.shape[1] > candidate.ranker.nurse_ids.size:
+            raise ValueError(
+                f"Model {version} has {canary.shape[1]} classes but only "
+                f"{candidate.ranker.nurse_ids.size} nurses are mapped"
+            )
+        candidate.load_ms = (time.perf_counter() - started) * 1000.0
+
+        print(f"Loaded model {version} from {path} in {candidate.load_ms:.1f} ms "
+              f"(pid={os.getpid()}, rss={current_rss_bytes() / (1024 * 1024):.1f} MiB)")
+        return candidate
+
+    def load_version(self, version):
+        """Load, warm and activate a version from the model directory"""
+        with self._load_lock:
+            candidate = self._build(version, os.path.join(self.model_dir, version))
+            self.active = candidate
+            self.last_error = None
+            return candidate
+
+    def check_for_update(self):
+        """Activate the newest version if it differs from the active one"""
+        latest = self.latest_version()
+        if not latest or latest == self.active.version:
+            return False
+        try:
+            self.load_version(latest)
+            return True
+        except Exception as e:
+            self.last_error = f"{latest}: {e}"
+            print(f"Model reload failed: {self.last_error}")
+            return False
+
+    def start_watching(self):
+        """Poll the model directory on a daemon thread"""
+        if not self.model_dir or self._watcher is not None:
+            return
+        self._spawn_watcher()
+        # Threads do not survive fork; restart the watcher in preloaded workers
+        on_worker_fork(self._spawn_watcher)
+
+    def _spawn_watcher(self):
+        def watch():
+            while True:
+                time.sleep(self.poll_interval)
+                self.check_for_update()
+
+        self._watcher = threading.Thread(target=watch, name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def status(self):
+        return {
+            "active": self.active.info(),
+            "model_dir": self.model_dir,
+            "latest_available": self.latest_version(),
+            "watching": self._watcher is not None,
+            "last_error": self.last_error
+        }
+
+
+if __name__ == "__main__":
+    # Convert a legacy pickle into the mmap-friendly layout:
+    #   python model_registry.py model.pkl model.joblib
+    if len(sys.argv) != 3:
+        print("Usage: python model_registry.py <source.pkl> <target.joblib>")
+        sys.exit(1)
+    save_model(load_model(sys.argv[1]), sys.argv[2])
+    print(f"Saved {sys.argv[1]} to {sys.argv[2]}")
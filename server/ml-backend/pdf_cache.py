@@ -0,0 +1,149 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import zstandard
+
+
+class TextCache:
+    """Content-addressed cache of extracted PDF text
+
+    An in-memory LRU bounded by total text length sits in front of an optional
+    directory of zstd-compressed files bounded by total size on disk. Disk
+    entries are evicted oldest-access first. Each entry remembers whether the
+    text was cut short by the extraction caps; on disk that is part of the
+    file name.
+    """
+
+    def __init__(self, max_memory_bytes=64 * 1024 * 1024, directory=None, max_disk_bytes=256 * 1024 * 1024):
+        self.max_memory_bytes = max_memory_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    def get(self, key):
+        """Return ``(text, truncated)`` cached for ``key`` or None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, entry)
+        return entry
+
+    def put(self, key, text, truncated=False):
+        with self._lock:
+            self._remember(key, (text, truncated))
+        self._write_disk(key, text, truncated)
+
+    def _remember(self, key, entry):
+        size = len(entry[0])
+        if size > self.max_memory_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous[0])
+        self._memory[key] = entry
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted[0])
+
+    def _path(self, key, truncated=False):
+        suffix = ".truncated.txt.zst" if truncated else ".txt.zst"
+        return os.path.join(self.directory, key[:2], f"{key}{suffix}")
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return None
+        for truncated in (False, True):
+            path = self._path(key, truncated)
+            try:
+                with open(path, "rb") as f:
+                    text = zstandard.ZstdDecompressor().decompress(f.read()).decode("utf-8")
+                os.utime(path)
+                return text, truncated
+            except FileNotFoundError:
+                continue
+            except (OSError, zstandard.ZstdError, UnicodeDecodeError):
+                return None
+        return None
+
+    def _write_disk(self, key, text, truncated=False):
+        if not self.directory:
+            return
+        path = self._path(key, truncated)
+        if os.path.exists(path):
+            return
+        data = zstandard.ZstdCompressor(level=3).compress(text.encode("utf-8"))
+        if len(data) > self.max_disk_bytes:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        with self._lock:
+            self._disk_bytes += len(data)
+            over_budget = self._disk_bytes > self.max_disk_bytes
+        if over_budget:
+            self._evict_disk()
+
+    def _disk_entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".txt.zst"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _evict_disk(self):
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "disk_bytes": self._disk_bytes,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,140 @@
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+PARALLEL_MIN_PAGES = int(os.getenv('PDF_PARALLEL_MIN_PAGES', '8'))
+EXTRACT_WORKERS = int(os.getenv('PDF_EXTRACT_WORKERS', str(min(os.cpu_count() or 1, 4))))
+MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', '50'))  # 0 means no limit
+MAX_CHARS = int(os.getenv('PDF_MAX_CHARS', '200000'))  # 0 means no limit
+SPOOL_DIR = os.getenv('PDF_SPOOL_DIR')  # defaults to the system temp dir
+SPOOL_CHUNK_SIZE = 64 * 1024
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS)
+        return _pool
+
+
+def _reset_pool_after_fork():
+    # A forked worker must not reuse the parent's process pool
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_pool_after_fork)
+
+
+def _open(source):
+    """Open a PDF from a filesystem path or raw bytes"""
+    import pdfplumber  # imported on first use to keep startup light
+
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    return pdfplumber.open(source)
+
+
+def spool_upload(stream, directory=None):
+    """Copy an upload stream to a temp file in chunks, hashing as it goes
+
+    Returns ``(path, size, sha256 hex digest)``; the caller removes the file.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf", dir=directory or SPOOL_DIR) as spool:
+        try:
+            while True:
+                chunk = stream.read(SPOOL_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                spool.write(chunk)
+                size += len(chunk)
+        except Exception:
+            spool.close()
+            os.remove(spool.name)
+            raise
+    return spool.name, size, digest.hexdigest()
+
+
+def iter_page_texts(source, start=0, stop=None):
+    """Lazily yield the text of pages [start, stop) of a PDF"""
+    with _open(source) as pdf:
+        for page in pdf.pages[start:stop]:
+            yield page.extract_text() or ""
+
+
+def _extract_page_range(source, start, stop):
+    """Worker: reopen the PDF from its path or bytes and extract pages [start, stop)"""
+    return list(iter_page_texts(source, start, stop))
+
+
+def _join_pages(page_texts):
+    return "\n".join(text for text in page_texts if text).strip()
+
+
+def _truncate(text, max_chars):
+    if max_chars and len(text) > max_chars:
+        return text[:max_chars], True
+    return text, False
+
+
+def extract_text_sequential(source, max_pages=None, max_chars=None):
+    """Extract pages in order, stopping as soon as the character cap is reached
+
+    Returns ``(text, truncated)``.
+    """
+    page_texts = []
+    chars = 0
+    for page_text in iter_page_texts(source, 0, max_pages or None):
+        if not page_text:
+            continue
+        page_texts.append(page_text)
+        chars += len(page_text) + 1
+        if max_chars and chars > max_chars:
+            break
+    return _truncate(_join_pages(page_texts), max_chars)
+
+
+def extract_text_parallel(source, page_count, workers=None):
+    """Split the page range across the process pool and rejoin in page order"""
+    workers = max(min(workers or EXTRACT_WORKERS, page_count), 1)
+    chunk = -(-page_count // workers)
+    pool = _get_pool()
+    futures = [
+        pool.submit(_extract_page_range, source, start, min(start + chunk, page_count))
+        for start in range(0, page_count, chunk)
+    ]
+    page_texts = []
+    for future in futures:
+        page_texts.extend(future.result())
+    return _join_pages(page_texts)
+
+
+def extract_text(source, max_pages=MAX_PAGES, max_chars=MAX_CHARS):
+    """Extract text from a PDF path or bytes with page and character caps
+
+    Documents with at least ``PDF_PARALLEL_MIN_PAGES`` pages (after the page
+    cap) are extracted on a process pool; smaller ones are read sequentially
+    with early exit. Returns ``(text, truncated)``.
+    """
+    try:
+        with _open(source) as pdf:
+            total_pages = len(pdf.pages)
+        page_count = min(total_pages, max_pages) if max_pages else total_pages
+        if EXTRACT_WORKERS <= 1 or page_count < PARALLEL_MIN_PAGES:
+            text, truncated = extract_text_sequential(source, page_count, max_chars)
+        else:
+            text, truncated = _truncate(extract_text_parallel(source, page_count), max_chars)
+        return text, truncated or page_count < total_pages
+    except Exception as e:
+        raise Exception(f"Error extracting text from PDF: {str(e)}")
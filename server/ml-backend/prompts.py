@@ -0,0 +1,151 @@
+"""Versioned prompt templates laid out for upstream prompt caching
+
+Every prompt is a stable prefix (static instructions, then the report text)
+followed by the per-question suffix, so follow-up questions about the same
+report share a byte-identical prefix that the model provider can reuse.
+Bump a template's version whenever its text changes; the version is part of
+the response-cache key.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+from string import Formatter
+
+REPORT_INSTRUCTIONS = """You are helping a patient understand their medical lab report. When you answer:
+- Explain medical terms in simple language
+- Mention normal ranges when discussing lab values
+- Be reassuring and educational
+- Always recommend consulting with a healthcare provider
+- Never provide specific medical diagnoses or treatment recommendations
+- Use bullet points and clear formatting"""
+
+GENERAL_INSTRUCTIONS = """Please provide helpful, educational information about the user's health topic. Remember to:
+- Explain medical terms and concepts in simple language
+- Provide accurate, general health information
+- Be reassuring and educational
+- Always emphasize the importance of consulting healthcare professionals
+- Never provide specific diagnoses, prescriptions, or critical medical decisions
+- Stay within the bounds of general health education
+- Use bullet points and clear formatting for better readability"""
+
+
+class PromptTemplate:
+    """A named, versioned prompt split into a cacheable prefix and a per-question suffix
+
+    Both parts are parsed once at import; rendering only joins the literal
+    pieces with the field values.
+    """
+
+    def __init__(self, name, version, prefix, suffix=""):
+        self.name = name
+        self.version = version
+        self.key = f"{name}:v{version}"
+        self._prefix = self._compile(prefix)
+        self._suffix = self._compile(suffix)
+
+    @staticmethod
+    def _compile(template):
+        return [(literal, field) for literal, field, _, _ in Formatter().parse(template)]
+
+    @staticmethod
+    def _fill(parts, fields):
+        return "".join(literal + (str(fields[field]) if field is not None else "") for literal, field in parts)
+
+    def render(self, **fields):
+        return Prompt(self, self._fill(self._prefix, fields), self._fill(self._suffix, fields))
+
+
+class Prompt:
+    __slots__ = ("template", "prefix", "suffix")
+
+    def __init__(self, template, prefix, suffix):
+        self.template = template
+        self.prefix = prefix
+        self.suffix = suffix
+
+    @property
+    def text(self):
+        return self.prefix + self.suffix
+
+    @property
+    def prefix_hash(self):
+        return hashlib.sha256(f"{self.template.key}\x00{self.prefix}".encode("utf-8")).hexdigest()[:16]
+
+
+REPORT_QUERY = PromptTemplate(
+    "report_query", 2,
+    REPORT_INSTRUCTIONS + "\n- Provide structured data extraction when applicable\n\nHere is the lab report:\n\n{report}\n\n",
+    "User's question: {query}"
+)
+REPORT_ANSWER = PromptTemplate(
+    "report_answer", 2,
+    REPORT_INSTRUCTIONS + "\n\nHere is the lab report:\n\n{report}\n\n",
+    "User's question: {query}"
+)
+GENERAL_QUERY = PromptTemplate("general_query", 2, GENERAL_INSTRUCTIONS + "\n\n", "User's general medical question: {query}")
+GENERAL_ANSWER = PromptTemplate("general_answer", 2, """Please provide helpful, educational information about the user's health topic. Remember to:
+- Explain medical terms and concepts in simple language
+- Provide accurate, general health information
+- Be reassuring and educational
+- Always recommend professional consultation
+
+""", "User's general medical question: {query}")
+EXTRACTION = PromptTemplate("extraction", 2, """You are a medical assistant. From the raw test report text below, extract and clean up only the relevant medical information for the patient, including test names, values, reference ranges, whether they are within or outside normal limits, and any clinical interpretation or risk categories.
+
+Output Format:
+- Patient Name:
+- Age:
+- Gender:
+
+- Test: [Test Name]
+  - Value: [X]
+  - Reference Range: [X-Y]
+  - Interpretation: [Low/Normal/High]
+  - Risk Category: [e.g., Optimal/Borderline/High Risk]
+
+Repeat for each test and include a short summary at the end with any notable observations (e.g., high triglycerides, low HDL, etc.).
+
+Raw Report:
+\"\"\"
+{report}
+\"\"\"
+""")
+INTAKE_NORMALIZATION = PromptTemplate("intake_normalization", 1, """You normalize patient intake answers for a nurse-matching model. Reply with only a JSON object whose keys are the field names you are given, using these values:
+
+{vocabulary}
+
+Use null when an answer does not say.
+
+""", "{answers}")
+
+
+class PrefixTracker:
+    """Remember the last prefix hash per (session, template) (LRU) to measure prefix reuse"""
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._prefixes = OrderedDict()
+        self.reused = 0
+        self.changed = 0
+
+    def observe(self, session_id, prompt):
+        """Record ``prompt`` for ``session_id``; returns True if its prefix matches the previous one"""
+        key = (session_id, prompt.template.key)
+        prefix_hash = prompt.prefix_hash
+        with self._lock:
+            previous = self._prefixes.pop(key, None)
+            self._prefixes[key] = prefix_hash
+            while len(self._prefixes) > self.max_entries:
+                self._prefixes.popitem(last=False)
+            if previous is None:
+                return False
+            if previous == prefix_hash:
+                self.reused += 1
+                return True
+            self.changed += 1
+            return False
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._prefixes), "reused": self.reused, "changed": self.changed}
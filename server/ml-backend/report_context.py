@@ -0,0 +1,170 @@
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+
+BOILERPLATE_PATTERNS = [
+    re.compile(pattern, re.IGNORECASE) for pattern in (
+        r"^page\s*\d+\s*(of|/)\s*\d+$",
+        r"^-+\s*end of report\s*-+$",
+        r"computer[- ]generated report",
+        r"does not require (a )?signature",
+        r"^disclaimer\b",
+        r"not (valid|to be used) for medico[- ]?legal",
+        r"results? (relate|pertain)s? only to the sample",
+        r"(www\.|https?://)\S+",
+        r"\b[\w.+-]+@[\w-]+\.[\w.]+\b",
+        r"^(tel|ph|phone|fax|mobile|helpline|toll[- ]free)\b.*\d{5,}",
+        r"\b(cin|gstin|nabl|cap)\s*(no\.?|number)?\s*[:#]",
+        r"^(registered|corporate|regd\.?) office\b",
+    )
+]
+HEADING = re.compile(r"^[A-Z][A-Z0-9 ,&()/\-]{3,}:?$")
+TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it my of on or "
+    "should the this to was what when which why with you your me mean means".split()
+)
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)"""
+    return (len(text) + 3) // 4
+
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def strip_boilerplate(text, repeat_threshold=3):
+    """Drop disclaimer/contact lines and lines repeated across pages (headers/footers)
+
+    Short lines that occur ``repeat_threshold`` or more times are treated as
+    page headers or footers and kept only once; lines containing digits next
+    to letters (likely test values) are never de-duplicated.
+    """
+    lines = [line.strip() for line in text.splitlines()]
+    counts = Counter(line for line in lines if line)
+    kept = []
+    seen_repeated = set()
+    for line in lines:
+        if not line:
+            continue
+        if any(pattern.search(line) for pattern in BOILERPLATE_PATTERNS):
+            continue
+        if counts[line] >= repeat_threshold and len(line) <= 120 and not re.search(r"[a-zA-Z].*\d|\d.*[a-zA-Z]", line):
+            if line in seen_repeated:
+                continue
+            seen_repeated.add(line)
+        kept.append(line)
+    return "\n".join(kept)
+
+
+def split_chunks(text, max_lines=6):
+    """Split cleaned report text into small, per-test/per-section chunks
+
+    A new chunk starts at every heading-like line and whenever the current
+    chunk reaches ``max_lines``; the heading is repeated on continuation
+    chunks so each chunk stays self-describing.
+    """
+    chunks = []
+    heading = None
+    current = []
+    for line in text.splitlines():
+        if HEADING.match(line):
+            if current:
+                chunks.append("\n".join(current))
+            heading = line
+            current = [line]
+            continue
+        if len(current) >= max_lines:
+            chunks.append("\n".join(current))
+            current = [heading] if heading else []
+        current.append(line)
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+class ReportIndex:
+    """BM25 index over the chunks of one report"""
+
+    def __init__(self, text, k1=1.5, b=0.75):
+        self.text = text
+        self.chunks = split_chunks(text)
+        self.k1 = k1
+        self.b = b
+        self._term_counts = [Counter(tokenize(chunk)) for chunk in self.chunks]
+        self._lengths = [sum(counts.values()) for counts in self._term_counts]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        document_frequency = Counter()
+        for counts in self._term_counts:
+            document_frequency.update(counts.keys())
+        total = len(self.chunks)
+        self._idf = {
+            term: math.log(1 + (total - freq + 0.5) / (freq + 0.5))
+            for term, freq in document_frequency.items()
+        }
+
+    def scores(self, query):
+        terms = [term for term in tokenize(query) if term in self._idf]
+        results = []
+        for counts, length in zip(self._term_counts, self._lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / self._avg_length) if self._avg_length else self.k1
+            for term in terms:
+                freq = counts.get(term)
+                if freq:
+                    score += self._idf[term] * freq * (self.k1 + 1) / (freq + norm)
+            results.append(score)
+        return results
+
+    def select(self, query, max_chars=6000, lead_chunks=1):
+        """Return the report context relevant to ``query``
+
+        The first ``lead_chunks`` chunks (patient details) are always kept,
+        then the best-scoring chunks up to ``max_chars``, in report order. If
+        nothing matches the query, or the whole report already fits, the full
+        text is returned.
+        """
+        if len(self.text) <= max_chars:
+            return self.text
+        scores = self.scores(query)
+        ranked = [i for i in sorted(range(len(scores)), key=lambda i: -scores[i]) if scores[i] > 0]
+        if not ranked:
+            return self.text
+
+        selected = set(range(min(lead_chunks, len(self.chunks))))
+        used = sum(len(self.chunks[i]) + 1 for i in selected)
+        for i in ranked:
+            if i in selected:
+                continue
+            size = len(self.chunks[i]) + 1
+            if used + size > max_chars:
+                continue
+            selected.add(i)
+            used += size
+        return "\n".join(self.chunks[i] for i in sorted(selected))
+
+
+class ReportIndexCache:
+    """Small LRU of ReportIndex objects keyed by report text hash"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._indexes = OrderedDict()
+
+    def get(self, key, load_text):
+        """Return the index for ``key``, calling ``load_text()`` to build it on a miss"""
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+                return index
+        index = ReportIndex(load_text())
+        with self._lock:
+            self._indexes[key] = index
+            while len(self._indexes) > self.max_entries:
+                self._indexes.popitem(last=False)
+        return index
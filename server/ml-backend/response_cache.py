@@ -0,0 +1,218 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from startup import on_worker_fork
+
+_PUNCTUATION = re.compile(r"[^\w\s]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    """Lowercase, drop punctuation and collapse whitespace so trivial variants share a key"""
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", query.lower())).strip()
+
+
+class EmbeddingIndex:
+    """Brute-force cosine nearest-neighbour index over query embeddings
+
+    ``embed`` maps a string to a 1-D vector (for example a local
+    sentence-transformers model). A lookup returns the cache key of the most
+    similar stored query when its similarity reaches ``threshold``.
+    """
+
+    def __init__(self, embed, threshold=0.92, max_entries=10000):
+        self.embed = embed
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._keys = []
+        self._vectors = None
+
+    def _unit(self, text):
+        vector = np.asarray(self.embed(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, text):
+        vector = self._unit(text)
+        with self._lock:
+            if self._vectors is None or not self._keys:
+                return None
+            scores = self._vectors @ vector
+            best = int(np.argmax(scores))
+            return self._keys[best] if scores[best] >= self.threshold else None
+
+    def add(self, text, key):
+        vector = self._unit(text)[np.newaxis, :]
+        with self._lock:
+            self._keys.append(key)
+            self._vectors = vector if self._vectors is None else np.vstack([self._vectors, vector])
+            if len(self._keys) > self.max_entries:
+                self._keys = self._keys[-self.max_entries:]
+                self._vectors = self._vectors[-self.max_entries:]
+
+
+class ResponseCache:
+    """TTL + LRU cache of LLM answers keyed by prompt template version and normalized query
+
+    An optional SQLite file backs the in-memory LRU so answers survive
+    restarts and are shared between workers; ``start_purger`` keeps it to
+    unexpired rows and at most ``max_disk_entries`` of them. An optional
+    ``semantic_index`` (see EmbeddingIndex) lets paraphrased questions
+    resolve to an existing key.
+    """
+
+    def __init__(self, max_entries=2048, ttl_seconds=24 * 3600, db_path=None, semantic_index=None,
+                 max_disk_entries=100000, purge_interval=300.0):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.db_path = db_path
+        self.semantic_index = semantic_index
+        self.max_disk_entries = max_disk_entries
+        self.purge_interval = purge_interval
+        self._purger = None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (stored_at, response)
+        self._local = threading.local()
+        os.register_at_fork(after_in_child=self._reset_connections)
+        self.hits = 0
+        self.disk_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        if db_path:
+            conn = self._connect()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_stored_at ON responses (stored_at)")
+
+    @staticmethod
+    def make_key(template_version, query):
+        return hashlib.sha256(f"{template_version}\x00{normalize_query(query)}".encode("utf-8")).hexdigest()
+
+    def _reset_connections(self):
+        # SQLite connections must not be shared with a forked child
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _lookup(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    return entry[1], "memory"
+                del self._entries[key]
+
+        if self.db_path:
+            row = self._connect().execute(
+                "SELECT response, stored_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] <= self.ttl:
+                with self._lock:
+                    self._remember(key, row[0], row[1])
+                return row[0], "disk"
+        return None, None
+
+    def get(self, template_version, query):
+        """Return a cached response or None"""
+        key = self.make_key(template_version, query)
+        response, tier = self._lookup(key)
+
+        if response is None and self.semantic_index is not None:
+            similar_key = self.semantic_index.lookup(f"{template_version}: {normalize_query(query)}")
+            if similar_key is not None and similar_key != key:
+                response, tier = self._lookup(similar_key)
+                if response is not None:
+                    tier = "semantic"
+
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            elif tier == "memory":
+                self.hits += 1
+            elif tier == "disk":
+                self.disk_hits += 1
+            else:
+                self.semantic_hits += 1
+        return response
+
+    def put(self, template_version, query, response):
+        key = self.make_key(template_version, query)
+        stored_at = time.time()
+        with self._lock:
+            self._remember(key, response, stored_at)
+        if self.db_path:
+            self._connect().execute(
+                "INSERT OR REPLACE INTO responses (key, response, stored_at) VALUES (?, ?, ?)",
+                (key, response, stored_at)
+            )
+        if self.semantic_index is not None:
+            self.semantic_index.add(f"{template_version}: {normalize_query(query)}", key)
+
+    def _remember(self, key, response, stored_at):
+        self._entries[key] = (stored_at, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def purge(self):
+        """Drop expired rows, then the oldest rows beyond ``max_disk_entries``; returns rows removed"""
+        if not self.db_path:
+            return 0
+        conn = self._connect()
+        removed = conn.execute("DELETE FROM responses WHERE stored_at < ?", (time.time() - self.ttl,)).rowcount
+        removed += conn.execute(
+            "DELETE FROM responses WHERE key IN "
+            "(SELECT key FROM responses ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        ).rowcount
+        return removed
+
+    def start_purger(self):
+        """Purge the disk tier periodically on a daemon thread"""
+        if not self.db_path or self._purger is not None:
+            return
+        self._spawn_purger()
+        # Threads do not survive fork; restart the purger in preloaded workers
+        on_worker_fork(self._spawn_purger)
+
+    def _spawn_purger(self):
+        def purge():
+            while True:
+                time.sleep(self.purge_interval)
+                try:
+                    removed = self.purge()
+                except sqlite3.Error as e:
+                    print(f"Response cache purge error: {e}")
+                    continue
+                if removed:
+                    print(f"Purged {removed} cached responses")
+
+        self._purger = threading.Thread(target=purge, name="response-cache-purger", daemon=True)
+        self._purger.start()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses
+            }
@@ -1,24 +1,36 @@
-from flask import Flask, request, jsonify
-from flask_cors import CORS
-import pandas as pd
-import pickle
-import numpy as np
+from startup import LazyAgent, profile, report_startup
+
+with profile("import:flask"):
+    from flask import Flask, request, jsonify, make_response, Response, g, stream_with_context
+    from flask_cors import CORS
+    from werkzeug.utils import secure_filename
 import os
-import pdfplumber
+import json
+import time
 import uuid
-import io
-import re
-import requests
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, render_template
-from flask_cors import CORS
-from werkzeug.utils import secure_filename
+from datetime import datetime
 from dotenv import load_dotenv
-from phi.agent import Agent
-from phi.model.google import Gemini
-from phi.tools.duckduckgo import DuckDuckGo
-import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+# Local modules read their settings from the environment at import time
 load_dotenv()
+with profile("import:numpy+inference"):
+    from inference import FeatureEncoder, InvalidRecord, MicroBatcher
+with profile("import:model_registry"):
+    from model_registry import ModelManager, current_rss_bytes
+from pdf_cache import TextCache
+from admission import AdmissionController, Overloaded
+from extraction import SingleFlightCache
+from metrics import REQUEST_LATENCY, registry, span, start_trace, traced_chunks
+with profile("import:forwarder"):
+    from forwarder import ReportForwarder
+from prompts import EXTRACTION, GENERAL_ANSWER, GENERAL_QUERY, INTAKE_NORMALIZATION, REPORT_ANSWER, REPORT_QUERY, PrefixTracker
+from response_cache import ResponseCache
+from report_context import ReportIndexCache, estimate_tokens, strip_boilerplate
+from lab_parser import format_extraction, parse_lab_report
+from pdf_extraction import MAX_CHARS, MAX_PAGES, extract_text, spool_upload
+from sessions import create_session_store
+from intake import FIELDS, REQUIRED_FIELDS, IntakeParser, IntakeStore, answers_from_payload
 
 
 app = Flask(__name__)
@@ -27,9 +39,64 @@ app.secret_key = os.getenv('SECRET_KEY', 'your-secret-key-here')
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 ALLOWED_EXTENSIONS = {'pdf'}
+NO_RESPONSE_MESSAGE = "I apologize, but I couldn't generate a response. Please try rephrasing your question."
+AGENT_ERROR_MESSAGE = "I'm sorry, but I encountered an error while processing your question. Please try again."
 SESSION_TIMEOUT_MINUTES = 30
+PREDICT_BATCH_WINDOW_MS = float(os.getenv('PREDICT_BATCH_WINDOW_MS', '3'))  # 0 disables coalescing
+PREDICT_MAX_BATCH_SIZE = int(os.getenv('PREDICT_MAX_BATCH_SIZE', '32'))
+MODEL_DIR = os.getenv('MODEL_DIR')  # versioned models, hot-swapped when set
+MODEL_POLL_SECONDS = float(os.getenv('MODEL_POLL_SECONDS', '30'))
+
+# SESSION_BACKEND=sqlite (or redis) shares sessions across worker processes; the default
+# memory backend is per-process. SESSION_MAX_TEXT_MB caps compressed report text (LRU eviction)
+session_data = create_session_store(
+    backend=os.getenv('SESSION_BACKEND', 'memory'),
+    timeout_minutes=SESSION_TIMEOUT_MINUTES,
+    max_text_bytes=int(os.getenv('SESSION_MAX_TEXT_MB', '512')) * 1024 * 1024
+)
+session_data.start_sweeper()
+
+# Structured extraction and its forwarding are memoized per report text hash
+extraction_cache = SingleFlightCache(max_entries=int(os.getenv('EXTRACTION_CACHE_ENTRIES', '1024')))
+forward_cache = SingleFlightCache(max_entries=int(os.getenv('EXTRACTION_CACHE_ENTRIES', '1024')))
+
+# Report text is cleaned once at upload; prompts only get the chunks relevant to the question.
+# REPORT_CONTEXT_MAX_CHARS=0 (or REPORT_PROMPT_CONTEXT=full) sends the whole cleaned report,
+# which keeps the prompt prefix identical across a session's questions for upstream caching
+REPORT_PREPROCESS_VERSION = "clean1"
+REPORT_CONTEXT_MAX_CHARS = int(os.getenv('REPORT_CONTEXT_MAX_CHARS', '6000'))
+REPORT_PROMPT_CONTEXT = os.getenv('REPORT_PROMPT_CONTEXT', 'relevant')
+report_indexes = ReportIndexCache(max_entries=int(os.getenv('REPORT_INDEX_CACHE_ENTRIES', '256')))
+
+# Prompt layout: instructions + report first, question last (see prompts.py)
+prompt_prefixes = PrefixTracker()
+
+# General-question answers keyed by prompt template version + normalized query
+GENERAL_QUERY_TEMPLATE = GENERAL_QUERY.key
+GENERAL_ANSWER_TEMPLATE = GENERAL_ANSWER.key
+response_cache = ResponseCache(
+    max_entries=int(os.getenv('RESPONSE_CACHE_ENTRIES', '2048')),
+    ttl_seconds=int(os.getenv('RESPONSE_CACHE_TTL_SECONDS', str(24 * 3600))),
+    db_path=os.getenv('RESPONSE_CACHE_DB'),
+    max_disk_entries=int(os.getenv('RESPONSE_CACHE_DISK_ENTRIES', '100000'))
+)
+response_cache.start_purger()
 
-session_data = {}
+# Reports the local lab parser reads with at least this confidence skip the extraction LLM
+LAB_PARSER_MIN_CONFIDENCE = float(os.getenv('LAB_PARSER_MIN_CONFIDENCE', '0.7'))
+
+# Bounded pool for work kept off the request's critical path (extraction + forwarding in /ask)
+background_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv('BACKGROUND_WORKERS', '8')),
+    thread_name_prefix="report-background"
+)
+
+# Extracted PDF text keyed by SHA-256 of the upload; PDF_CACHE_DIR adds a compressed disk tier
+pdf_text_cache = TextCache(
+    max_memory_bytes=int(os.getenv('PDF_CACHE_MEMORY_MB', '64')) * 1024 * 1024,
+    directory=os.getenv('PDF_CACHE_DIR'),
+    max_disk_bytes=int(os.getenv('PDF_CACHE_DISK_MB', '256')) * 1024 * 1024
+)
 
 nurse_map = {
     1: "3f8a5c12-8f3e-44a1-bfdc-347c0d0c102d",
@@ -64,9 +131,6 @@ questions = [
     "7. What is your preferred language for communication? (English/Hindi)"
 ]
 
-with open("model.pkl", "rb") as f:
-    model = pickle.load(f)
-
 columns = [
     'duration_months', 'pain_level', 'Arthritis', 'Asthma',
     'Diabetes', 'Hypertension', 'swelling', 'nausea', 'frequent urination',
@@ -77,48 +141,128 @@ columns = [
     'preferred_language_Hindi'
 ]
 
-def get_top_n_nurses(probabilities, n=3):
-    sorted_indices = np.argsort(probabilities)[::-1][:n]
-    return [(int(i+1), float(probabilities[i])) for i in sorted_indices]
+# Without MODEL_DIR, MODEL_PATH (default model.joblib, then model.pkl) is loaded once
+# with the nurse_map above
+with profile("model:load"):
+    model_manager = ModelManager(len(columns), nurse_map, MODEL_DIR, os.getenv('MODEL_PATH'), MODEL_POLL_SECONDS)
+model_manager.start_watching()
+
+encoder = FeatureEncoder(columns)
+
+def predict_rows(features):
+    """Run the active model and pair every probability row with that version"""
+    active = model_manager.active
+    with span("predict_proba"):
+        probabilities = active.model.predict_proba(features)
+    return [(active, row) for row in probabilities]
+
+batcher = MicroBatcher(predict_rows, PREDICT_BATCH_WINDOW_MS, PREDICT_MAX_BATCH_SIZE) if PREDICT_BATCH_WINDOW_MS > 0 else None
+
+def predict_top_nurses(record, n=3):
+    """Encode one patient record and rank nurses, through the micro-batcher when enabled"""
+    with span("feature_encoding"):
+        features = encoder.encode_one(record)
+
+    if batcher is not None:
+        active, prob_array = batcher.submit(features)
+    else:
+        active, prob_array = predict_rows(features)[0]
+
+    return active.ranker.rank(prob_array, n=n)[0]
+
+def parse_predict_request(data, batch=False):
+    """Validate a /predict or /predict/batch body (``None`` when it was not JSON)
+
+    Returns ``(records, top_n, error)`` where ``error`` is the message for a
+    400. Shared by the Flask and ASGI handlers so the two modes accept the
+    same requests.
+    """
+    if data is None:
+        return None, None, "Invalid request. JSON expected."
+    if not batch:
+        return [data], 3, None
+
+    records = data.get("records") if isinstance(data, dict) else data
+    if not isinstance(records, list) or not records:
+        return None, None, "Invalid request. A non-empty list of records is expected."
+
+    top_n = data.get("top_n", 3) if isinstance(data, dict) else 3
+    if isinstance(top_n, bool) or not isinstance(top_n, int) or top_n < 1:
+        return None, None, "Invalid request. top_n must be a positive integer."
+    return records, top_n, None
 
 @app.route("/predict", methods=['POST'])
 def func():
-    if request.is_json:
-        data = request.get_json()
-        try:
-            df = pd.DataFrame([data])
-            for col in columns:
-                if col not in df.columns:
-                    df[col] = 0
-            df = df[columns]
+    records, _, error = parse_predict_request(request.get_json(silent=True))
+    if error:
+        return jsonify({"message": error}), 400
+    try:
+        result = predict_top_nurses(records[0])
 
-            prob_array = model.predict_proba(df)[0] 
+        print(f"Top nurses: {result}")
+
+        return jsonify({
+            "message": "Prediction successful",
+            "top_nurses": result
+        })
+    except InvalidRecord as e:
+        return jsonify({"message": f"Invalid request. {e}"}), 400
+    except Exception as e:
+        return jsonify({
+            "message": "Error during prediction",
+            "error": str(e)
+        }), 500
 
-            top_n = get_top_n_nurses(prob_array, n=3)
+@app.route("/predict/batch", methods=['POST'])
+def predict_batch():
+    """Predict top nurses for a list of patient records in one model call"""
+    records, top_n, error = parse_predict_request(request.get_json(silent=True), batch=True)
+    if error:
+        return jsonify({"message": error}), 400
 
-            result = [
-                {
-                    "nurse_id": nurse_map[nurse_num],
-                    "probability": round(prob, 4)
-                }
-                for nurse_num, prob in top_n
-            ]
+    try:
+        with span("feature_encoding"):
+            features = encoder.encode(records)
+        active = model_manager.active
+        with span("predict_proba"):
+            prob_matrix = active.model.predict_proba(features)
 
-            print(f"Top nurses: {result}")
+        results = [
+            {"top_nurses": top_nurses}
+            for top_nurses in active.ranker.rank(prob_matrix, n=top_n)
+        ]
 
-            return jsonify({
-                "message": "Prediction successful",
-                "top_nurses": result
-            })
-        except Exception as e:
-            return jsonify({
-                "message": "Error during prediction",
-                "error": str(e)
-            }), 500
-    else:
         return jsonify({
-            "message": "Invalid request. JSON expected."
-        }), 400
+            "message": "Prediction successful",
+            "model_version": active.version,
+            "count": len(results),
+            "results": results
+        })
+    except InvalidRecord as e:
+        return jsonify({"message": f"Invalid request. {e}"}), 400
+    except Exception as e:
+        return jsonify({
+            "message": "Error during prediction",
+            "error": str(e)
+        }), 500
+
+@app.route("/predict/stats", methods=['GET'])
+def predict_stats():
+    """Report micro-batching scheduler metrics"""
+    if batcher is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **batcher.stats()})
+
+@app.route("/admin/model", methods=['GET'])
+def model_status():
+    """Report the active model version and its load latency"""
+    return jsonify(model_manager.status())
+
+@app.route("/admin/model/reload", methods=['POST'])
+def reload_model():
+    """Check the model directory for a newer version right away"""
+    swapped = model_manager.check_for_update()
+    return jsonify({"reloaded": swapped, **model_manager.status()})
 
 @app.route("/chat", methods=['POST'])
 def chat():
@@ -135,85 +279,278 @@ def chat():
             "message": "Error Occurred"
         }
 
-assistant_agent = Agent(
-    model=Gemini(id="gemini-1.5-flash"),
-    tools=[DuckDuckGo()],
-    description="Medical assistant for lab report analysis",
-    instructions=[
-        "Explain lab results in simple language",
-        "Mention normal ranges for lab values",
-        "Be educational and reassuring",
-        "Always recommend consulting healthcare professionals",
-        "Never provide specific diagnoses or treatments",
-        "Use bullet points for clarity"
-    ],
-    markdown=True
-)
+# Agents (and the phi/Gemini/DuckDuckGo imports) are built on first use; see preload().
+# ML_FAKE_AGENT=1 swaps in offline FakeAgents (fake_agent.py) for benchmarks and load tests
+def agent_factory(name, build):
+    if os.getenv('ML_FAKE_AGENT') == '1':
+        from fake_agent import FakeAgent
+        return lambda: FakeAgent.from_env(name)
+    return build
 
-general_agent = Agent(
-    model=Gemini(id="gemini-1.5-flash"),
-    tools=[DuckDuckGo()],
-    description="Medical assistant for general health questions",
-    instructions=[
-        "Provide educational health information",
-        "Explain medical concepts clearly",
-        "Be reassuring and informative",
-        "Always recommend professional consultation",
-        "Stay within educational bounds",
-        "Use clear formatting"
-    ],
-    markdown=True
-)
+def _build_assistant_agent():
+    from phi.agent import Agent
+    from phi.model.google import Gemini
+    from phi.tools.duckduckgo import DuckDuckGo
+    return Agent(
+        model=Gemini(id="gemini-1.5-flash"),
+        tools=[DuckDuckGo()],
+        description="Medical assistant for lab report analysis",
+        instructions=[
+            "Explain lab results in simple language",
+            "Mention normal ranges for lab values",
+            "Be educational and reassuring",
+            "Always recommend consulting healthcare professionals",
+            "Never provide specific diagnoses or treatments",
+            "Use bullet points for clarity"
+        ],
+        markdown=True
+    )
+
+assistant_agent = LazyAgent("assistant", agent_factory("assistant", _build_assistant_agent))
+
+def _build_general_agent():
+    from phi.agent import Agent
+    from phi.model.google import Gemini
+    from phi.tools.duckduckgo import DuckDuckGo
+    return Agent(
+        model=Gemini(id="gemini-1.5-flash"),
+        tools=[DuckDuckGo()],
+        description="Medical assistant for general health questions",
+        instructions=[
+            "Provide educational health information",
+            "Explain medical concepts clearly",
+            "Be reassuring and informative",
+            "Always recommend professional consultation",
+            "Stay within educational bounds",
+            "Use clear formatting"
+        ],
+        markdown=True
+    )
+
+general_agent = LazyAgent("general", agent_factory("general", _build_general_agent))
 
 # Data extraction agent for extracting structured medical information
-data_extraction_agent = Agent(
-    model=Gemini(id="gemini-1.5-flash"),
-    description="Medical data extraction agent",
-    instructions=[
-        "Extract only medical information from lab reports",
-        "Follow the specified output format exactly",
-        "Include all test values, reference ranges, and interpretations",
-        "Provide clear categorization of results",
-        "Be precise and structured in output"
-    ],
-    markdown=False
-)
+def _build_data_extraction_agent():
+    from phi.agent import Agent
+    from phi.model.google import Gemini
+    return Agent(
+        model=Gemini(id="gemini-1.5-flash"),
+        description="Medical data extraction agent",
+        instructions=[
+            "Extract only medical information from lab reports",
+            "Follow the specified output format exactly",
+            "Include all test values, reference ranges, and interpretations",
+            "Provide clear categorization of results",
+            "Be precise and structured in output"
+        ],
+        markdown=False
+    )
+
+data_extraction_agent = LazyAgent("data_extraction", agent_factory("data_extraction", _build_data_extraction_agent))
+
+# Each agent gets a concurrency limit with a bounded wait queue (429 when full, 503 when
+# the wait deadline passes). LLM routes also share a lane capped below the worker's thread
+# count, so /chat and /predict always find a free thread. <NAME>_AGENT_MAX_CONCURRENT
+# overrides the limit for one agent
+AGENT_MAX_CONCURRENT = int(os.getenv('AGENT_MAX_CONCURRENT', '8'))
+AGENT_MAX_WAITING = int(os.getenv('AGENT_MAX_WAITING', '16'))
+AGENT_WAIT_SECONDS = float(os.getenv('AGENT_WAIT_SECONDS', '10'))
+LLM_MAX_IN_FLIGHT = int(os.getenv('LLM_MAX_IN_FLIGHT', '64'))
+
+admission = AdmissionController()
+for agent in (assistant_agent, general_agent, data_extraction_agent):
+    admission.add_agent(
+        agent.name,
+        max_concurrent=int(os.getenv(f'{agent.name.upper()}_AGENT_MAX_CONCURRENT', str(AGENT_MAX_CONCURRENT))),
+        max_waiting=AGENT_MAX_WAITING,
+        wait_timeout=AGENT_WAIT_SECONDS
+    )
+admission.add_lane("llm", LLM_MAX_IN_FLIGHT)
+
+def agent_chunks(agent, prompt):
+    """Stream an agent call while holding one of that agent's admission slots"""
+    acquired_at = admission.acquire(agent.name)
+    try:
+        yield from traced_chunks(agent.name, agent, prompt)
+    finally:
+        admission.release(agent.name, acquired_at)
+
+def admit(agent):
+    """Take one of ``agent``'s admission slots for a streamed response; returns the callable that frees it
+
+    Taking the slot before the response starts lets a shed stream return
+    429/503 with Retry-After instead of a 200 carrying an error event.
+    """
+    acquired_at = admission.acquire(agent.name)
+    return lambda: admission.release(agent.name, acquired_at)
+
+def llm_lane(view):
+    """Admit a request to the LLM lane until its response (or stream) is closed"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        lane = admission.lanes["llm"]
+        lane.enter()
+        try:
+            response = make_response(view(*args, **kwargs))
+        except BaseException:
+            lane.exit()
+            raise
+        response.call_on_close(lane.exit)
+        return response
+    return wrapper
+
+@app.errorhandler(Overloaded)
+def overloaded(e):
+    return jsonify({"error": e.message, "retry_after": e.retry_after}), e.status, {"Retry-After": str(e.retry_after)}
+
+@app.route('/admission/stats', methods=['GET'])
+def admission_stats():
+    """Report per-agent slots, queue lengths and shed requests"""
+    return jsonify(admission.stats())
+
+# chatty.py's 7-question intake, parsed server-side. Answers are matched against the model's
+# one-hot vocabulary locally; only the ones the rules cannot read go to the extraction agent,
+# all in one call, and the prediction runs in-process
+intake_parser = IntakeParser(columns)
+intake_store = IntakeStore(session_data)
+
+def normalize_intake(answers):
+    """Parse intake answers, asking the LLM once for any ambiguous ones; returns (values, llm_fields, unresolved)"""
+    with span("intake_parse"):
+        values, ambiguous = intake_parser.parse(answers)
+    if not ambiguous:
+        return values, [], []
+
+    prompt = log_prompt("/intake", INTAKE_NORMALIZATION.render(
+        vocabulary=intake_parser.vocabulary(),
+        answers=intake_parser.ambiguous_answers(answers, ambiguous, questions)
+    ))
+    try:
+        reply = "".join(chunk.content for chunk in agent_chunks(data_extraction_agent, prompt))
+    except Overloaded:
+        raise
+    except Exception as e:
+        print(f"Intake normalization error: {e}")
+        reply = ""
+    unresolved = intake_parser.apply_normalized(values, reply, ambiguous)
+    return values, [field for field in ambiguous if field not in unresolved], unresolved
+
+def intake_result(answers):
+    """Predict top nurses from a complete set of answers; returns (body, status)"""
+    values, llm_fields, unresolved = normalize_intake(answers)
+    missing = [field for field in REQUIRED_FIELDS if field in unresolved]
+    if missing:
+        return {
+            "message": "Could not understand some answers. Please answer these questions again.",
+            "fields": missing,
+            "questions": [questions[FIELDS.index(field)] for field in missing]
+        }, 422
+
+    record = intake_parser.to_record(values)
+    top_nurses = predict_top_nurses(record)
+    print(f"Intake top nurses: {top_nurses} (llm fields: {llm_fields})")
+    return {
+        "message": "Prediction successful",
+        "top_nurses": top_nurses,
+        "features": record,
+        "llm_fields": llm_fields,
+        "unresolved": unresolved
+    }, 200
+
+@app.route('/intake', methods=['POST'])
+@llm_lane
+def intake():
+    """Predict top nurses from all 7 intake answers (a list in question order or an object keyed by field)"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"message": "Invalid request. JSON expected."}), 400
+    try:
+        answers = answers_from_payload(data.get("answers"))
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    try:
+        body, status = intake_result(answers)
+        return jsonify(body), status
+    except Overloaded:
+        raise
+    except Exception as e:
+        return jsonify({
+            "message": "Error during prediction",
+            "error": str(e)
+        }), 500
+
+@app.route('/intake/answer', methods=['POST'])
+@llm_lane
+def intake_answer():
+    """Record one intake answer and return the next question, or the prediction after the last one
+
+    Omit ``intake_id`` to start a new intake; the first response carries the
+    id and the first question.
+    """
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"message": "Invalid request. JSON expected."}), 400
+    intake_id = data.get("intake_id")
+    if not intake_id:
+        intake_id = intake_store.start()
+        return jsonify({"intake_id": intake_id, "question_index": 0, "question": questions[0]})
+
+    answers = intake_store.get(intake_id)
+    if answers is None:
+        return jsonify({"message": "Intake not found or expired"}), 404
+    answer = data.get("answer")
+    if not isinstance(answer, str) or not answer.strip():
+        return jsonify({"message": "A non-empty answer is required"}), 400
+
+    pending = [field for field in FIELDS if field not in answers]
+    answers[pending[0]] = answer
+    if len(pending) > 1:
+        intake_store.save(intake_id, answers)
+        index = FIELDS.index(pending[1])
+        return jsonify({"intake_id": intake_id, "question_index": index, "question": questions[index]})
+
+    # The last answer is only kept once it produced a result, so a failed
+    # prediction can be retried by sending the same answer again
+
+    try:
+        body, status = intake_result(answers)
+    except Overloaded:
+        raise
+    except Exception as e:
+        return jsonify({
+            "message": "Error during prediction",
+            "error": str(e)
+        }), 500
+    if status == 422:
+        # Drop the unreadable answers; the next answers fill them in, in question order
+        for field in body["fields"]:
+            answers.pop(field, None)
+        intake_store.save(intake_id, answers)
+        body["question_index"] = FIELDS.index(body["fields"][0])
+        body["question"] = body["questions"][0]
+    else:
+        intake_store.finish(intake_id)
+    return jsonify({"intake_id": intake_id, **body}), status
 
 # Configuration for external backend
 EXTERNAL_BACKEND_URL = os.getenv('EXTERNAL_BACKEND_URL', 'http://localhost:3001/api/v1/report/create')  # Default URL
 
+# Reports are delivered by background workers over a pooled session, with retries and a disk spool
+report_forwarder = ReportForwarder(
+    EXTERNAL_BACKEND_URL,
+    bulk_url=os.getenv('EXTERNAL_BACKEND_BULK_URL'),  # e.g. http://localhost:3001/api/v1/report/create/bulk
+    spool_dir=os.getenv('FORWARD_SPOOL_DIR', 'forward_spool'),
+    max_queue=int(os.getenv('FORWARD_QUEUE_SIZE', '1000')),
+    workers=int(os.getenv('FORWARD_WORKERS', '2')),
+    max_retries=int(os.getenv('FORWARD_MAX_RETRIES', '5')),
+    batch_size=int(os.getenv('FORWARD_BATCH_SIZE', '10'))
+)
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def extract_text_from_pdf_bytes(pdf_bytes):
-    """Extract text from PDF bytes using pdfplumber"""
-    try:
-        text = ""
-        with pdfplumber.open(io.BytesIO(pdf_bytes)) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
-        return text.strip()
-    except Exception as e:
-        raise Exception(f"Error extracting text from PDF: {str(e)}")
-
-def cleanup_expired_sessions():
-    """Remove expired sessions from memory"""
-    current_time = datetime.now()
-    expired_sessions = []
-    
-    for session_id, data in session_data.items():
-        if current_time - data['timestamp'] > timedelta(minutes=SESSION_TIMEOUT_MINUTES):
-            expired_sessions.append(session_id)
-    
-    for session_id in expired_sessions:
-        del session_data[session_id]
-    
-    if expired_sessions:
-        print(f"Cleaned up {len(expired_sessions)} expired sessions")
-
 def detect_query_type(query):
     """Detect what type of query this is based on content"""
     query_lower = query.lower()
@@ -222,12 +559,63 @@ def detect_query_type(query):
     if any(keyword in query_lower for keyword in upload_keywords):
         return 'upload_request'
     
+def ingest_pdf(stream, filename):
+    """Spool, extract (or reuse cached text) and open a session for an uploaded PDF
+
+    Returns (response body, status code); shared by the Flask and ASGI /upload.
+    """
+    # Spool to disk instead of holding the whole upload in memory
+    try:
+        pdf_path, pdf_size, pdf_digest = spool_upload(stream)
+    except Exception as e:
+        return {"error": f"Failed to read file: {str(e)}"}, 400
+
+    try:
+        if not pdf_size:
+            return {"error": "File is empty"}, 400
+
+        # Extraction caps and the preprocessing version are part of the key so
+        # changing them never serves stale text
+        pdf_hash = f"{pdf_digest}-p{MAX_PAGES}-c{MAX_CHARS}-{REPORT_PREPROCESS_VERSION}"
+        entry = pdf_text_cache.get(pdf_hash)
+        cached = entry is not None
+        if cached:
+            text, truncated = entry
+        else:
+            try:
+                with span("pdf_extraction"):
+                    text, truncated = extract_text(pdf_path)
+            except Exception as e:
+                return {"error": f"Failed to process PDF: {str(e)}"}, 400
+            # Letterheads, disclaimers and repeated page headers/footers are dropped once here
+            with span("strip_boilerplate"):
+                text = strip_boilerplate(text)
+            if text:
+                pdf_text_cache.put(pdf_hash, text, truncated)
+    finally:
+        os.remove(pdf_path)
+    
+    if not text:
+        return {"error": "No text could be extracted from the PDF"}, 400
+    
+    session_id = str(uuid.uuid4())
+    
+    record = session_data.put(session_id, text, secure_filename(filename))
+    report_indexes.get(record.digest, lambda: text)
+    
+    return {
+        "message": "PDF uploaded and processed successfully",
+        "session_id": session_id,
+        "filename": secure_filename(filename),
+        "text_length": len(text),
+        "cached": cached,
+        "truncated": truncated
+    }, 200
+
 @app.route('/upload', methods=['POST'])
 def upload_pdf():
     """Handle PDF upload"""
     try:
-        cleanup_expired_sessions()
-        
         if 'pdf' not in request.files:
             return jsonify({"error": "No file provided"}), 400
         
@@ -238,45 +626,27 @@ def upload_pdf():
         if not allowed_file(file.filename):
             return jsonify({"error": "Only PDF files are allowed"}), 400
         
-        try:
-            file_content = file.read()
-            if not file_content:
-                return jsonify({"error": "File is empty"}), 400
-        except Exception as e:
-            return jsonify({"error": f"Failed to read file: {str(e)}"}), 400
-        
-        try:
-            text = extract_text_from_pdf_bytes(file_content)
-        except Exception as e:
-            return jsonify({"error": f"Failed to process PDF: {str(e)}"}), 400
-        
-        if not text:
-            return jsonify({"error": "No text could be extracted from the PDF"}), 400
-        
-        session_id = str(uuid.uuid4())
-        
-        session_data[session_id] = {
-            'text': text,
-            'filename': secure_filename(file.filename),
-            'timestamp': datetime.now()
-        }
-        
-        return jsonify({
-            "message": "PDF uploaded and processed successfully",
-            "session_id": session_id,
-            "filename": secure_filename(file.filename),
-            "text_length": len(text)
-        })
+        body, status = ingest_pdf(file.stream, file.filename)
+        return jsonify(body), status
     
     except Exception as e:
         return jsonify({"error": f"Upload failed: {str(e)}"}), 500
 
+@app.route('/upload/cache', methods=['GET'])
+def upload_cache_stats():
+    """Report PDF text cache usage and hit rates"""
+    return jsonify(pdf_text_cache.stats())
+
+@app.route('/response_cache/stats', methods=['GET'])
+def response_cache_stats():
+    """Report general-answer cache hit/miss counters"""
+    return jsonify(response_cache.stats())
+
 @app.route('/smart_query', methods=['POST'])
+@llm_lane
 def smart_query():
     """Handle smart query that determines the type automatically"""
     try:
-        cleanup_expired_sessions()
-        
         data = request.get_json()
         if not data:
             return jsonify({"error": "No JSON data provided"}), 400
@@ -299,81 +669,68 @@ def smart_query():
             })
         
         # Handle lab report questions if session exists
-        if session_id and session_id in session_data:
-            session_info = session_data[session_id]
-            session_info['timestamp'] = datetime.now()
-            
-            context = session_info['text']
-            full_prompt = f"""Here is a medical lab report:
-
-{context}
-
-User's question: {query}
-
-Please analyze this lab report and answer the user's question. Remember to:
-- Explain medical terms in simple language
-- Mention normal ranges for lab values
-- Be reassuring and educational
-- Always recommend consulting with a healthcare provider
-- Never provide specific medical diagnoses or treatment recommendations
-- Use bullet points and clear formatting
-- Provide structured data extraction when applicable"""
+        session_info = session_data.get(session_id) if session_id else None
+        if session_info is not None:
+            context = report_context_for("/smart_query", session_info, query)
+            full_prompt = build_report_query_prompt(context, query, session_id)
             
             try:
                 response = ""
-                for chunk in assistant_agent.run(full_prompt, stream=True):
+                for chunk in agent_chunks(assistant_agent, full_prompt):
                     response += chunk.content
                 
                 if not response.strip():
-                    response = "I apologize, but I couldn't generate a response. Please try rephrasing your question."
+                    response = NO_RESPONSE_MESSAGE
             
+            except Overloaded:
+                raise
             except Exception as e:
                 print(f"Agent error: {e}")
-                response = "I'm sorry, but I encountered an error while processing your question. Please try again."
+                response = AGENT_ERROR_MESSAGE
             
             return jsonify({
                 "response": response,
                 "query_type": "lab_report",
-                "filename": session_info['filename']
+                "filename": session_info.filename
             })
         else:
-            full_prompt = f"""User's general medical question: {query}
-
-Please provide helpful, educational information about this health topic. Remember to:
-- Explain medical terms and concepts in simple language
-- Provide accurate, general health information
-- Be reassuring and educational
-- Always emphasize the importance of consulting healthcare professionals
-- Never provide specific diagnoses, prescriptions, or critical medical decisions
-- Stay within the bounds of general health education
-- Use bullet points and clear formatting for better readability"""
-            
-            try:
-                response = ""
-                for chunk in general_agent.run(full_prompt, stream=True):
-                    response += chunk.content
+            response = response_cache.get(GENERAL_QUERY_TEMPLATE, query)
+            cached = response is not None
+            if not cached:
+                full_prompt = build_general_query_prompt(query)
                 
-                if not response.strip():
-                    response = "I apologize, but I couldn't generate a response. Please try rephrasing your question."
-            
-            except Exception as e:
-                print(f"General agent error: {e}")
-                response = "I'm sorry, but I encountered an error while processing your question. Please try again."
+                try:
+                    response = ""
+                    for chunk in agent_chunks(general_agent, full_prompt):
+                        response += chunk.content
+                    
+                    if not response.strip():
+                        response = NO_RESPONSE_MESSAGE
+                    else:
+                        response_cache.put(GENERAL_QUERY_TEMPLATE, query, response)
+                
+                except Overloaded:
+                    raise
+                except Exception as e:
+                    print(f"General agent error: {e}")
+                    response = AGENT_ERROR_MESSAGE
             
             return jsonify({
                 "response": response,
-                "query_type": "general"
+                "query_type": "general",
+                "cached": cached
             })
     
+    except Overloaded:
+        raise
     except Exception as e:
         return jsonify({"error": f"Failed to process question: {str(e)}"}), 500
 
 @app.route('/ask', methods=['POST'])
+@llm_lane
 def ask_question():
     """Handle question about uploaded report"""
     try:
-        cleanup_expired_sessions()
-        
         data = request.get_json()
         if not data:
             return jsonify({"error": "No JSON data provided"}), 400
@@ -387,95 +744,54 @@ def ask_question():
         if not session_id:
             return jsonify({"error": "No session ID provided"}), 400
         
-        if session_id not in session_data:
+        session_info = session_data.get(session_id)
+        if session_info is None:
             return jsonify({"error": "Session not found or expired. Please upload your PDF again."}), 400
         
-        session_info = session_data[session_id]
-        session_info['timestamp'] = datetime.now()
-        
-        context = session_info['text']
+        context = report_context_for("/ask", session_info, query)
         
-        # Extract structured medical data using Gemini
-        extraction_prompt = f"""
-You are a medical assistant. From the following raw test report text, extract and clean up only the relevant medical information for the patient, including test names, values, reference ranges, whether they are within or outside normal limits, and any clinical interpretation or risk categories.
-
-Raw Report:
-\"\"\"
-{context}
-\"\"\"
-
-Output Format:
-- Patient Name:
-- Age:
-- Gender:
-
-- Test: [Test Name]
-  - Value: [X]
-  - Reference Range: [X-Y]
-  - Interpretation: [Low/Normal/High]
-  - Risk Category: [e.g., Optimal/Borderline/High Risk]
-
-Repeat for each test and include a short summary at the end with any notable observations (e.g., high triglycerides, low HDL, etc.).
-"""
-        
-        try:
-            # Extract structured data
-            extracted_data = ""
-            for chunk in data_extraction_agent.run(extraction_prompt, stream=True):
-                extracted_data += chunk.content
-            
-            if not extracted_data.strip():
-                extracted_data = "Unable to extract structured data from the report."
-        
-        except Exception as e:
-            print(f"Data extraction error: {e}")
-            extracted_data = "Error occurred during data extraction."
-        
-        # Send extracted data to external backend
-        success, external_response = send_to_external_backend(extracted_data, session_id, session_info['filename'])
-        
-        if not success:
-            print(f"Failed to send to external backend: {external_response}")
+        # Extraction and forwarding run once per report, in the background, so the
+        # user only waits for the answer call below
+        extraction_future = background_pool.submit(get_report_extraction, session_id, session_info)
         
         # Answer the user's question
-        full_prompt = f"""Here is a medical lab report:
-
-{context}
-
-User's question: {query}
-
-Please analyze this lab report and answer the user's question. Remember to:
-- Explain medical terms in simple language
-- Mention normal ranges when discussing lab values
-- Be reassuring and educational
-- Always recommend consulting with a healthcare provider
-- Never provide specific medical diagnoses or treatment recommendations
-- Use bullet points and clear formatting"""
+        full_prompt = build_report_answer_prompt(context, query, session_id)
         
         try:
             response = ""
-            for chunk in assistant_agent.run(full_prompt, stream=True):
+            for chunk in agent_chunks(assistant_agent, full_prompt):
                 response += chunk.content
             
             if not response.strip():
-                response = "I apologize, but I couldn't generate a response. Please try rephrasing your question."
+                response = NO_RESPONSE_MESSAGE
         
+        except Overloaded:
+            raise
         except Exception as e:
             print(f"Agent error: {e}")
-            response = "I'm sorry, but I encountered an error while processing your question. Please try again."
+            response = AGENT_ERROR_MESSAGE
+        
+        if extraction_future.done() and extraction_future.exception() is None:
+            extracted_data, success, external_response = extraction_future.result()
+            external_status = "queued" if success else "failed"
+        else:
+            extracted_data, external_response, external_status = None, None, "pending"
         
         return jsonify({
             "response": response,
-            "filename": session_info['filename'],
+            "filename": session_info.filename,
             "extracted_data": extracted_data,
-            "external_backend_status": "success" if success else "failed",
-            "external_backend_response": external_response if success else str(external_response)
+            "external_backend_status": external_status,
+            "external_backend_response": external_response if external_status != "failed" else str(external_response)
         })
     
+    except Overloaded:
+        raise
     except Exception as e:
         return jsonify({"error": f"Failed to process question: {str(e)}"}), 500
 
 @app.route('/ask_general', methods=['POST'])
+@llm_lane
 def ask_general_question():
     """Handle general medical questions"""
     try:
@@ -488,41 +804,199 @@ def ask_general_question():
         if not query:
             return jsonify({"error": "No question provided"}), 400
         
-        full_prompt = f"""User's general medical question: {query}
-
-Please provide helpful, educational information about this health topic. Remember to:
-- Explain medical terms and concepts in simple language
-- Provide accurate, general health information
-- Be reassuring and educational
-- Always recommend professional consultation
-        """
-        
-        try:
-            response = ""
-            for chunk in general_agent.run(full_prompt, stream=True):
-                response += chunk.content
+        response = response_cache.get(GENERAL_ANSWER_TEMPLATE, query)
+        cached = response is not None
+        if not cached:
+            full_prompt = build_general_answer_prompt(query)
             
-            if not response.strip():
-                response = "I apologize, but I couldn't generate a response. Please try rephrasing your question."
-        
-        except Exception as e:
-            print(f"General agent error: {e}")
-            response = "I'm sorry, but I encountered an error while processing your question. Please try again."
+            try:
+                response = ""
+                for chunk in agent_chunks(general_agent, full_prompt):
+                    response += chunk.content
+                
+                if not response.strip():
+                    response = NO_RESPONSE_MESSAGE
+                else:
+                    response_cache.put(GENERAL_ANSWER_TEMPLATE, query, response)
+            
+            except Overloaded:
+                raise
+            except Exception as e:
+                print(f"General agent error: {e}")
+                response = AGENT_ERROR_MESSAGE
         
         return jsonify({
             "response": response,
-            "query_type": "general"
+            "query_type": "general",
+            "cached": cached
         })
     
+    except Overloaded:
+        raise
     except Exception as e:
         return jsonify({"error": f"Failed to process question: {str(e)}"}), 500
 
+def sse_event(event, payload):
+    """Format one server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def stream_agent_response(route, agent, prompt, metadata, error_label="Agent", started=None, on_complete=None):
+    """Yield agent chunks as SSE ``chunk`` events, then a ``done`` event with metadata
+
+    Time-to-first-byte is measured from ``started`` (the request start) and
+    logged together with the total time and chunk count. ``on_complete`` is
+    called with the full text after a successful, non-empty generation. The
+    caller must already hold an agent slot (see ``admit``).
+    """
+    started = started or time.perf_counter()
+    first_chunk_at = None
+    chunk_count = 0
+    parts = []
+    try:
+        for chunk in traced_chunks(agent.name, agent, prompt):
+            if not chunk.content:
+                continue
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+            chunk_count += 1
+            parts.append(chunk.content)
+            yield sse_event("chunk", {"content": chunk.content})
+        
+        if not chunk_count:
+            yield sse_event("chunk", {"content": NO_RESPONSE_MESSAGE})
+        elif on_complete is not None:
+            on_complete("".join(parts))
+    
+    except Exception as e:
+        print(f"{error_label} error: {e}")
+        yield sse_event("error", {"message": AGENT_ERROR_MESSAGE})
+    
+    yield sse_event("done", metadata)
+    
+    ttfb_ms = (first_chunk_at - started) * 1000.0 if first_chunk_at else None
+    total_ms = (time.perf_counter() - started) * 1000.0
+    print(f"{route} stream: ttfb={'n/a' if ttfb_ms is None else f'{ttfb_ms:.0f}ms'} total={total_ms:.0f}ms chunks={chunk_count}")
+
+def stream_cached_general(route, template, agent, prompt, query, metadata, started=None):
+    """Serve a general answer from the response cache, or stream it and cache the result
+
+    Returns an SSE response; only a cache miss takes an agent slot.
+    """
+    response = response_cache.get(template, query)
+    if response is not None:
+        def cached_events():
+            yield sse_event("chunk", {"content": response})
+            yield sse_event("done", {**metadata, "cached": True})
+        return sse_response(cached_events())
+    release = admit(agent)
+    return sse_response(stream_agent_response(
+        route, agent, prompt, {**metadata, "cached": False}, error_label="General agent",
+        started=started, on_complete=lambda text: response_cache.put(template, query, text)
+    ), on_close=release)
+
+def sse_response(events, on_close=None):
+    """Stream SSE events; ``on_close`` (e.g. a slot from ``admit``) runs when the response is closed"""
+    response = Response(
+        stream_with_context(events),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    if on_close is not None:
+        response.call_on_close(on_close)
+    return response
+
+@app.route('/smart_query/stream', methods=['POST'])
+@llm_lane
+def smart_query_stream():
+    """Streaming variant of /smart_query using server-sent events"""
+    started = time.perf_counter()
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "No JSON data provided"}), 400
+    
+    query = data.get("query", "").strip()
+    session_id = data.get("session_id", "").strip()
+    
+    if not query:
+        return jsonify({"error": "No question provided"}), 400
+    
+    if detect_query_type(query) == 'upload_request':
+        def upload_events():
+            yield sse_event("chunk", {"content": "To upload a lab report, please use the upload button above or drag and drop a PDF file. I'll be able to analyze your lab results once you upload the file."})
+            yield sse_event("done", {"query_type": "upload_request", "action_needed": "upload_file"})
+        return sse_response(upload_events())
+    
+    session_info = session_data.get(session_id) if session_id else None
+    if session_info is not None:
+        release = admit(assistant_agent)
+        return sse_response(stream_agent_response(
+            "/smart_query", assistant_agent,
+            build_report_query_prompt(report_context_for("/smart_query", session_info, query), query, session_id),
+            {"query_type": "lab_report", "filename": session_info.filename},
+            started=started
+        ), on_close=release)
+    
+    return stream_cached_general(
+        "/smart_query", GENERAL_QUERY_TEMPLATE, general_agent, build_general_query_prompt(query),
+        query, {"query_type": "general"}, started=started
+    )
+
+@app.route('/ask/stream', methods=['POST'])
+@llm_lane
+def ask_question_stream():
+    """Streaming variant of /ask using server-sent events"""
+    started = time.perf_counter()
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "No JSON data provided"}), 400
+    
+    query = data.get("query", "").strip()
+    session_id = data.get("session_id", "").strip()
+    
+    if not query:
+        return jsonify({"error": "No question provided"}), 400
+    
+    if not session_id:
+        return jsonify({"error": "No session ID provided"}), 400
+    
+    session_info = session_data.get(session_id)
+    if session_info is None:
+        return jsonify({"error": "Session not found or expired. Please upload your PDF again."}), 400
+    
+    release = admit(assistant_agent)
+    background_pool.submit(get_report_extraction, session_id, session_info)
+    
+    return sse_response(stream_agent_response(
+        "/ask", assistant_agent,
+        build_report_answer_prompt(report_context_for("/ask", session_info, query), query, session_id),
+        {"query_type": "lab_report", "filename": session_info.filename},
+        started=started
+    ), on_close=release)
+
+@app.route('/ask_general/stream', methods=['POST'])
+@llm_lane
+def ask_general_question_stream():
+    """Streaming variant of /ask_general using server-sent events"""
+    started = time.perf_counter()
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"error": "No JSON data provided"}), 400
+    
+    query = data.get("query", "").strip()
+    
+    if not query:
+        return jsonify({"error": "No question provided"}), 400
+    
+    return stream_cached_general(
+        "/ask_general", GENERAL_ANSWER_TEMPLATE, general_agent, build_general_answer_prompt(query),
+        query, {"query_type": "general"}, started=started
+    )
+
 @app.route('/extract_data', methods=['POST'])
+@llm_lane
 def extract_data():
     """Extract structured data from uploaded report"""
     try:
-        cleanup_expired_sessions()
-        
         data = request.get_json()
         if not data:
             return jsonify({"error": "No JSON data provided"}), 400
@@ -532,63 +1006,120 @@ def extract_data():
         if not session_id:
             return jsonify({"error": "No session ID provided"}), 400
         
-        if session_id not in session_data:
+        session_info = session_data.get(session_id)
+        if session_info is None:
             return jsonify({"error": "Session not found or expired. Please upload your PDF again."}), 400
         
-        session_info = session_data[session_id]
-        session_info['timestamp'] = datetime.now()
-        
-        context = session_info['text']
-        
-        extraction_prompt = f"""
-You are a medical assistant. From the following raw test report text, extract and clean up only the relevant medical information for the patient, including test names, values, reference ranges, whether they are within or outside normal limits, and any clinical interpretation or risk categories.
-
-Raw Report:
-\"\"\"
-{context}
-\"\"\"
-
-Output Format:
-- Patient Name:
-- Age:
-- Gender:
-
-- Test: [Test Name]
-  - Value: [X]
-  - Reference Range: [X-Y]
-  - Interpretation: [Low/Normal/High]
-  - Risk Category: [e.g., Optimal/Borderline/High Risk]
-
-Repeat for each test and include a short summary at the end with any notable observations (e.g., high triglycerides, low HDL, etc.).
-"""
-        
-        try:
-            extracted_data = ""
-            for chunk in data_extraction_agent.run(extraction_prompt, stream=True):
-                extracted_data += chunk.content
-            
-            if not extracted_data.strip():
-                extracted_data = "Unable to extract structured data from the report."
-        
-        except Exception as e:
-            print(f"Data extraction error: {e}")
-            extracted_data = "Error occurred during data extraction."
-        
-        # Send extracted data to external backend
-        success, external_response = send_to_external_backend(extracted_data, session_id, session_info['filename'])
+        extracted_data, success, external_response = get_report_extraction(session_id, session_info)
         
         return jsonify({
             "extracted_data": extracted_data,
-            "filename": session_info['filename'],
-            "external_backend_status": "success" if success else "failed",
+            "filename": session_info.filename,
+            "external_backend_status": "queued" if success else "failed",
             "external_backend_response": external_response if success else str(external_response)
         })
     
+    except Overloaded:
+        raise
     except Exception as e:
         return jsonify({"error": f"Failed to extract data: {str(e)}"}), 500
 
+def report_context_for(route, session_info, query):
+    """Select the report chunks relevant to ``query`` and log the prompt tokens saved"""
+    if not REPORT_CONTEXT_MAX_CHARS or REPORT_PROMPT_CONTEXT == 'full':
+        return session_info.text
+    with span("report_context"):
+        # Indexes are keyed by content hash, so a hit never decompresses the session text
+        index = report_indexes.get(session_info.digest, lambda: session_info.text)
+        context = index.select(query, max_chars=REPORT_CONTEXT_MAX_CHARS)
+    full_tokens = estimate_tokens(index.text)
+    context_tokens = estimate_tokens(context)
+    print(f"{route} context: {context_tokens} tokens, {full_tokens - context_tokens} saved of {full_tokens}")
+    return context
+
+def log_prompt(route, prompt, session_id=None):
+    """Log the prompt's prefix hash and sizes (and prefix reuse within the session); returns its text"""
+    reused = prompt_prefixes.observe(session_id, prompt) if session_id else None
+    print(f"{route} prompt {prompt.template.key}: prefix={prompt.prefix_hash} "
+          f"prefix_tokens={estimate_tokens(prompt.prefix)} suffix_tokens={estimate_tokens(prompt.suffix)}"
+          f"{'' if reused is None else f' reused={reused}'}")
+    return prompt.text
+
+def build_report_query_prompt(context, query, session_id=None):
+    """Prompt for a /smart_query question about an uploaded report"""
+    return log_prompt("/smart_query", REPORT_QUERY.render(report=context, query=query), session_id)
+
+def build_general_query_prompt(query):
+    """Prompt for a general /smart_query question"""
+    return log_prompt("/smart_query", GENERAL_QUERY.render(query=query))
+
+def build_report_answer_prompt(context, query, session_id=None):
+    """Prompt for an /ask question about an uploaded report"""
+    return log_prompt("/ask", REPORT_ANSWER.render(report=context, query=query), session_id)
+
+def build_general_answer_prompt(query):
+    """Prompt for an /ask_general question"""
+    return log_prompt("/ask_general", GENERAL_ANSWER.render(query=query))
+
+def build_extraction_prompt(context):
+    """Prompt asking the extraction agent for the structured lab summary"""
+    return log_prompt("extraction", EXTRACTION.render(report=context))
+
+@app.route('/sessions/memory', methods=['GET'])
+def session_memory():
+    """Report session count and compressed/uncompressed report text bytes"""
+    return jsonify(session_data.stats())
+
+@app.route('/prompts/stats', methods=['GET'])
+def prompt_stats():
+    """Report how often a session's prompt prefix repeated"""
+    return jsonify(prompt_prefixes.stats())
+
+def run_data_extraction(context):
+    """Parse the report locally, falling back to the extraction agent; returns (extracted_data, succeeded)"""
+    with span("lab_parser"):
+        parsed, confidence = parse_lab_report(context)
+    if confidence >= LAB_PARSER_MIN_CONFIDENCE:
+        print(f"Lab parser extracted {len(parsed['tests'])} tests (confidence {confidence:.2f}), skipping LLM")
+        return format_extraction(parsed), True
+    
+    try:
+        extracted_data = ""
+        for chunk in agent_chunks(data_extraction_agent, build_extraction_prompt(context)):
+            extracted_data += chunk.content
+        
+        if not extracted_data.strip():
+            return "Unable to extract structured data from the report.", False
+        return extracted_data, True
+    
+    except Overloaded:
+        raise
+    except Exception as e:
+        print(f"Data extraction error: {e}")
+        return "Error occurred during data extraction.", False
+
+def get_report_extraction(session_id, session_info):
+    """Extract and forward a report once per text hash, single-flighting concurrent callers
+
+    Returns (extracted_data, success, external_response).
+    """
+    text_hash = session_info.digest
+    extracted_data = extraction_cache.get_or_compute(
+        text_hash, lambda: run_data_extraction(session_info.text)
+    )
+    success, external_response = forward_cache.get_or_compute(
+        text_hash, lambda: _forward(extracted_data, session_id, session_info.filename)
+    )
+    return extracted_data, success, external_response
+
+def _forward(extracted_data, session_id, filename):
+    success, external_response = send_to_external_backend(extracted_data, session_id, filename)
+    if not success:
+        print(f"Failed to send to external backend: {external_response}")
+    return (success, external_response), success
+
 def send_to_external_backend(extracted_data, session_id, filename):
-    """Send extracted medical data to external backend"""
+    """Queue extracted medical data for delivery to the external backend"""
     try:
         payload = {
             "session_id": session_id,
@@ -597,22 +1128,73 @@ def send_to_external_backend(extracted_data, session_id, filename):
             "timestamp": datetime.now().isoformat()
         }
 
-        print(f"Sending data to external backend: {payload['extracted_data']}")
+        print(f"Queueing data for external backend: {payload['extracted_data']}")
 
-        response = requests.post(
-            f"{EXTERNAL_BACKEND_URL}",
-            json=payload,
-            headers={'Content-Type': 'application/json'},
-            timeout=30
-        )
-        
-        if response.status_code == 200:
-            return True, response.json()
-        else:
-            return False, f"External backend returned status code: {response.status_code}"
+        with span("forward_enqueue"):
+            delivery_id = report_forwarder.enqueue(payload)
+        return True, {"status": "queued", "delivery_id": delivery_id}
     
-    except requests.exceptions.RequestException as e:
-        return False, f"Error sending to external backend: {str(e)}"
+    except OSError as e:
+        return False, f"Error queueing report for external backend: {str(e)}"
+
+@app.route('/forwarder/stats', methods=['GET'])
+def forwarder_stats():
+    """Report forwarding queue depth, delivery latency and failure counts"""
+    return jsonify(report_forwarder.stats())
+
+def _session_stat(key):
+    return lambda: session_data.stats().get(key)
+
+registry.gauge("ml_sessions", "Live report sessions", _session_stat("sessions"))
+registry.gauge("ml_session_compressed_bytes", "Compressed report text held by the session store", _session_stat("compressed_bytes"))
+registry.gauge("ml_session_uncompressed_bytes", "Uncompressed size of the distinct reports in the session store",
+               _session_stat("uncompressed_bytes"))
+registry.gauge("ml_process_resident_memory_bytes", "Resident memory of this worker", current_rss_bytes)
+registry.gauge("ml_predict_queue_depth", "Rows waiting for the prediction micro-batcher",
+               lambda: batcher.stats()["queue_depth"] if batcher is not None else None)
+registry.gauge("ml_forward_queue_depth", "Reports waiting for delivery to the external backend",
+               lambda: report_forwarder.stats()["queue_depth"])
+registry.gauge("ml_forward_dead_lettered", "Unreadable spooled reports this worker moved aside as .bad",
+               lambda: report_forwarder.dead_lettered)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    g.request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex[:16]
+    start_trace(g.request_id)
+
+@app.after_request
+def record_request_latency(response):
+    started = g.get("request_started")
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        REQUEST_LATENCY.observe(time.perf_counter() - started, route, request.method, str(response.status_code))
+        response.headers["X-Request-ID"] = g.request_id
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Export route/stage latency histograms and session gauges in Prometheus text format"""
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+def preload():
+    """Build the agents and import the PDF stack up front
+
+    Used with ML_PRELOAD=1 (set by gunicorn.conf.py) so a preforking server
+    pays these costs once in the master and workers share the pages.
+    """
+    for agent in (assistant_agent, general_agent, data_extraction_agent):
+        try:
+            agent.get()
+        except Exception as e:
+            print(f"Agent preload failed: {e}")
+    with profile("import:pdfplumber"):
+        import pdfplumber  # noqa: F401
+
+
+if os.getenv('ML_PRELOAD') == '1':
+    preload()
+report_startup()
 
 if __name__ == "__main__":
     app.run(debug=True, port=5000)
@@ -0,0 +1,557 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import zstandard
+
+from startup import on_worker_fork
+
+COMPRESSION_LEVEL = 3
+
+
+class CompressedText:
+    """Report text kept zstd-compressed; the memory store shares one per distinct report"""
+
+    __slots__ = ("digest", "data", "size", "refs")
+
+    def __init__(self, data, digest=None, size=None):
+        self.data = data
+        self.digest = digest
+        self.size = size if size is not None else zstandard.frame_content_size(data)
+        self.refs = 0
+
+    @classmethod
+    def from_text(cls, text):
+        raw = text.encode("utf-8")
+        return cls(zstandard.ZstdCompressor(level=COMPRESSION_LEVEL).compress(raw),
+                   hashlib.sha256(raw).hexdigest(), len(raw))
+
+    def decompress(self):
+        return zstandard.ZstdDecompressor().decompress(self.data).decode("utf-8")
+
+
+class SessionRecord:
+    """One report session
+
+    ``text`` is decompressed on every access, so read it once per request.
+    ``digest`` is the SHA-256 of the UTF-8 text, so callers can key caches on
+    it without decompressing.
+    """
+
+    __slots__ = ("filename", "blob", "last_access")
+
+    def __init__(self, filename, blob, last_access):
+        self.filename = filename
+        self.blob = blob
+        self.last_access = last_access
+
+    @property
+    def text(self):
+        return self.blob.decompress()
+
+    @property
+    def digest(self):
+        if self.blob.digest is None:
+            self.blob.digest = hashlib.sha256(self.blob.decompress().encode("utf-8")).hexdigest()
+        return self.blob.digest
+
+
+class SessionBackend:
+    """Interface shared by the report session stores
+
+    Records are SessionRecords. ``get`` refreshes the sliding TTL unless
+    ``touch`` is False. The ``*_intake`` methods keep the answers of
+    in-progress intakes (intake.IntakeStore) under the same TTL, so every
+    worker sharing the sessions also shares the intakes.
+    """
+
+    def put(self, session_id, text, filename):
+        raise NotImplementedError
+
+    def get(self, session_id, touch=True):
+        raise NotImplementedError
+
+    def delete(self, session_id):
+        raise NotImplementedError
+
+    def put_intake(self, intake_id, answers):
+        raise NotImplementedError
+
+    def get_intake(self, intake_id):
+        """Return a copy of the intake's answers, refreshing its expiry, or None"""
+        raise NotImplementedError
+
+    def delete_intake(self, intake_id):
+        raise NotImplementedError
+
+    def expire(self):
+        """Remove expired sessions; returns how many were removed"""
+        return 0
+
+    def stats(self):
+        raise NotImplementedError
+
+    def __contains__(self, session_id):
+        return self.get(session_id, touch=False) is not None
+
+    def start_sweeper(self):
+        """Expire sessions periodically on a daemon thread"""
+        if getattr(self, "_sweeper", None) is not None:
+            return
+        self._spawn_sweeper()
+        # Threads do not survive fork; restart the sweeper in preloaded workers
+        on_worker_fork(self._spawn_sweeper)
+
+    def _spawn_sweeper(self):
+        def sweep():
+            while True:
+                time.sleep(self.sweep_interval)
+                try:
+                    removed = self.expire()
+                except Exception as e:
+                    print(f"Session sweep error: {e}")
+                    continue
+                if removed:
+                    print(f"Cleaned up {removed} expired sessions")
+
+        self._sweeper = threading.Thread(target=sweep, name="session-sweeper", daemon=True)
+        self._sweeper.start()
+
+
+class SessionStore(SessionBackend):
+    """In-memory report sessions with sliding TTL and a cap on stored text
+
+    Sessions are kept in an OrderedDict ordered by last access. With a fixed
+    TTL that is also expiry order, so get/touch are O(1) and expiry only ever
+    pops from the front. A background sweeper removes expired sessions off the
+    request path. Report text is stored compressed and interned by content
+    hash, so sessions for the same report share one copy; the compressed size
+    of the distinct reports is capped by evicting the least recently used
+    sessions.
+    """
+
+    def __init__(self, timeout_minutes=30, max_text_bytes=512 * 1024 * 1024, sweep_interval=60.0,
+                 max_intakes=10000):
+        self.ttl = timeout_minutes * 60.0
+        self.max_text_bytes = max_text_bytes
+        self.sweep_interval = sweep_interval
+        self.max_intakes = max_intakes
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()  # session_id -> SessionRecord (last_access is monotonic)
+        self._intakes = OrderedDict()  # intake_id -> (last_access monotonic, answers dict)
+        self._blobs = {}  # digest -> CompressedText shared by sessions
+        self._compressed_bytes = 0
+        self._uncompressed_bytes = 0
+        self._sweeper = None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def put(self, session_id, text, filename):
+        """Store a new report session and return its record"""
+        blob = CompressedText.from_text(text)
+        with self._lock:
+            self._discard(session_id)
+            shared = self._blobs.get(blob.digest)
+            if shared is None:
+                shared = self._blobs[blob.digest] = blob
+                self._compressed_bytes += len(blob.data)
+                self._uncompressed_bytes += blob.size
+            shared.refs += 1
+            record = SessionRecord(filename, shared, time.monotonic())
+            self._sessions[session_id] = record
+            self._evict_over_budget()
+        return record
+
+    def get(self, session_id, touch=True):
+        """Return the session record, refreshing its expiry, or None"""
+        now = time.monotonic()
+        with self._lock:
+            record = self._sessions.get(session_id)
+            if record is None:
+                return None
+            if now - record.last_access > self.ttl:
+                self._discard(session_id)
+                return None
+            if touch:
+                record.last_access = now
+                self._sessions.move_to_end(session_id)
+            return record
+
+    def delete(self, session_id):
+        with self._lock:
+            self._discard(session_id)
+
+    def _release(self, blob):
+        blob.refs -= 1
+        if blob.refs <= 0:
+            del self._blobs[blob.digest]
+            self._compressed_bytes -= len(blob.data)
+            self._uncompressed_bytes -= blob.size
+
+    def _discard(self, session_id):
+        record = self._sessions.pop(session_id, None)
+        if record is not None:
+            self._release(record.blob)
+
+    def _evict_over_budget(self):
+        while self._compressed_bytes > self.max_text_bytes and len(self._sessions) > 1:
+            _, record = self._sessions.popitem(last=False)
+            self._release(record.blob)
+
+    def put_intake(self, intake_id, answers):
+        with self._lock:
+            self._intakes[intake_id] = (time.monotonic(), dict(answers))
+            self._intakes.move_to_end(intake_id)
+            while len(self._intakes) > self.max_intakes:
+                self._intakes.popitem(last=False)
+
+    def get_intake(self, intake_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._intakes.get(intake_id)
+            if entry is None:
+                return None
+            if now - entry[0] > self.ttl:
+                del self._intakes[intake_id]
+                return None
+            self._intakes[intake_id] = (now, entry[1])
+            self._intakes.move_to_end(intake_id)
+            return dict(entry[1])
+
+    def delete_intake(self, intake_id):
+        with self._lock:
+            self._intakes.pop(intake_id, None)
+
+    def expire(self):
+        """Drop expired sessions from the front; returns how many were removed"""
+        cutoff = time.monotonic() - self.ttl
+        removed = 0
+        with self._lock:
+            while self._sessions:
+                session_id, record = next(iter(self._sessions.items()))
+                if record.last_access > cutoff:
+                    break
+                self._discard(session_id)
+                removed += 1
+            while self._intakes and next(iter(self._intakes.values()))[0] <= cutoff:
+                self._intakes.popitem(last=False)
+        return removed
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "distinct_reports": len(self._blobs),
+                "compressed_bytes": self._compressed_bytes,
+                "uncompressed_bytes": self._uncompressed_bytes,
+                "max_text_bytes": self.max_text_bytes
+            }
+
+
+# Keep session_totals in step with the sessions table (see SQLiteSessionStore)
+_TOTALS_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS sessions_added AFTER INSERT ON sessions BEGIN
+        UPDATE session_totals SET sessions = sessions + 1, stored_bytes = stored_bytes + NEW.stored_bytes;
+        -- Not INSERT OR IGNORE: put's INSERT OR REPLACE would override it and reset refs
+        INSERT INTO session_reports
+            SELECT COALESCE(NEW.digest, NEW.session_id), 0, COALESCE(NEW.text_bytes, 0)
+            WHERE NOT EXISTS (SELECT 1 FROM session_reports WHERE report = COALESCE(NEW.digest, NEW.session_id));
+        UPDATE session_reports SET refs = refs + 1 WHERE report = COALESCE(NEW.digest, NEW.session_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS sessions_removed AFTER DELETE ON sessions BEGIN
+        UPDATE session_totals SET sessions = sessions - 1, stored_bytes = stored_bytes - OLD.stored_bytes;
+        UPDATE session_reports SET refs = refs - 1 WHERE report = COALESCE(OLD.digest, OLD.session_id);
+        DELETE FROM session_reports WHERE report = COALESCE(OLD.digest, OLD.session_id) AND refs <= 0;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS session_reports_added AFTER INSERT ON session_reports BEGIN
+        UPDATE session_totals SET reports = reports + 1, text_bytes = text_bytes + NEW.text_bytes;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS session_reports_removed AFTER DELETE ON session_reports BEGIN
+        UPDATE session_totals SET reports = reports - 1, text_bytes = text_bytes - OLD.text_bytes;
+    END
+    """,
+)
+
+
+class SQLiteSessionStore(SessionBackend):
+    """Sessions shared by every worker process through a local SQLite WAL database
+
+    Report text is stored zstd-compressed. Expiry uses wall-clock time so all
+    processes agree on it, and an index on ``last_access`` keeps both expiry
+    and LRU eviction from scanning the table. Triggers keep the session count,
+    stored bytes and the distinct reports' sizes in ``session_totals``, so
+    neither the budget check on ``put`` nor ``stats`` sums the table.
+    """
+
+    def __init__(self, path, timeout_minutes=30, max_text_bytes=512 * 1024 * 1024, sweep_interval=60.0):
+        self.path = path
+        self.ttl = timeout_minutes * 60.0
+        self.max_text_bytes = max_text_bytes
+        self.sweep_interval = sweep_interval
+        self._sweeper = None
+        self._local = threading.local()
+        os.register_at_fork(after_in_child=self._reset_connections)
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sessions (
+                session_id TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                text BLOB NOT NULL,
+                stored_bytes INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                digest TEXT,
+                text_bytes INTEGER
+            )
+        """)
+        # Databases created before digest/text_bytes existed gain them as nullable columns;
+        # their old rows fall back to hashing and reading the zstd frame header
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        for column, kind in (("digest", "TEXT"), ("text_bytes", "INTEGER")):
+            if column not in columns:
+                conn.execute(f"ALTER TABLE sessions ADD COLUMN {column} {kind}")
+        conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+        self._create_totals(conn)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS intakes (
+                intake_id TEXT PRIMARY KEY,
+                answers TEXT NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS intakes_last_access ON intakes (last_access)")
+
+    @staticmethod
+    def _create_totals(conn):
+        # session_reports refcounts each distinct report (rows without a digest count alone)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_reports (
+                    report TEXT PRIMARY KEY,
+                    refs INTEGER NOT NULL,
+                    text_bytes INTEGER NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS session_totals (
+                    id INTEGER PRIMARY KEY CHECK (id = 0),
+                    sessions INTEGER NOT NULL,
+                    stored_bytes INTEGER NOT NULL,
+                    reports INTEGER NOT NULL,
+                    text_bytes INTEGER NOT NULL
+                )
+            """)
+            for trigger in _TOTALS_TRIGGERS:
+                conn.execute(trigger)
+            if conn.execute("SELECT 1 FROM session_totals").fetchone() is None:
+                # First start on this database (or one from before the totals existed)
+                conn.execute("""
+                    INSERT INTO session_reports
+                    SELECT COALESCE(digest, session_id), COUNT(*), COALESCE(MAX(text_bytes), 0)
+                    FROM sessions GROUP BY COALESCE(digest, session_id)
+                """)
+                conn.execute("""
+                    INSERT INTO session_totals
+                    SELECT 0, COUNT(*), COALESCE(SUM(stored_bytes), 0),
+                           (SELECT COUNT(*) FROM session_reports),
+                           (SELECT COALESCE(SUM(text_bytes), 0) FROM session_reports)
+                    FROM sessions
+                """)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _reset_connections(self):
+        # SQLite connections must not be shared with a forked child
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # INSERT OR REPLACE must fire the delete trigger that keeps session_totals right
+            conn.execute("PRAGMA recursive_triggers=ON")
+            self._local.conn = conn
+        return conn
+
+    def put(self, session_id, text, filename):
+        blob = CompressedText.from_text(text)
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO sessions "
+            "(session_id, filename, text, stored_bytes, last_access, digest, text_bytes) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (session_id, filename, blob.data, len(blob.data), now, blob.digest, blob.size)
+        )
+        self._evict_over_budget(conn)
+        return SessionRecord(filename, blob, now)
+
+    def get(self, session_id, touch=True):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT filename, text, last_access, digest, text_bytes FROM sessions WHERE session_id = ?",
+            (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        filename, blob, last_access, digest, text_bytes = row
+        if now - last_access > self.ttl:
+            self.delete(session_id)
+            return None
+        if touch:
+            conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id))
+            last_access = now
+        return SessionRecord(filename, CompressedText(blob, digest, text_bytes), last_access)
+
+    def delete(self, session_id):
+        self._connect().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+
+    def _evict_over_budget(self, conn):
+        count, total = conn.execute("SELECT sessions, stored_bytes FROM session_totals").fetchone()
+        while total > self.max_text_bytes and count > 1:
+            session_id, stored_bytes = conn.execute(
+                "SELECT session_id, stored_bytes FROM sessions ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            total -= stored_bytes
+            count -= 1
+
+    def put_intake(self, intake_id, answers):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO intakes (intake_id, answers, last_access) VALUES (?, ?, ?)",
+            (intake_id, json.dumps(answers), time.time())
+        )
+
+    def get_intake(self, intake_id):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT answers, last_access FROM intakes WHERE intake_id = ?", (intake_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if now - row[1] > self.ttl:
+            self.delete_intake(intake_id)
+            return None
+        conn.execute("UPDATE intakes SET last_access = ? WHERE intake_id = ?", (now, intake_id))
+        return json.loads(row[0])
+
+    def delete_intake(self, intake_id):
+        self._connect().execute("DELETE FROM intakes WHERE intake_id = ?", (intake_id,))
+
+    def expire(self):
+        conn = self._connect()
+        cutoff = time.time() - self.ttl
+        conn.execute("DELETE FROM intakes WHERE last_access < ?", (cutoff,))
+        cursor = conn.execute("DELETE FROM sessions WHERE last_access < ?", (cutoff,))
+        return cursor.rowcount
+
+    def stats(self):
+        count, stored, reports, text_bytes = self._connect().execute(
+            "SELECT sessions, stored_bytes, reports, text_bytes FROM session_totals"
+        ).fetchone()
+        return {
+            "backend": "sqlite",
+            "sessions": count,
+            "distinct_reports": reports,
+            "compressed_bytes": stored,
+            "uncompressed_bytes": text_bytes,
+            "max_text_bytes": self.max_text_bytes
+        }
+
+
+class RedisSessionStore(SessionBackend):
+    """Sessions in Redis (or any Redis-protocol server) using key TTLs
+
+    Requires the optional ``redis`` package. Size limits are left to the
+    server's ``maxmemory`` policy.
+    """
+
+    def __init__(self, url, timeout_minutes=30, prefix="session:", intake_prefix="intake:"):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("SESSION_BACKEND=redis requires the 'redis' package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.ttl = int(timeout_minutes * 60)
+        self.prefix = prefix
+        self.intake_prefix = intake_prefix
+        self.sweep_interval = 60.0
+
+    def put(self, session_id, text, filename):
+        key = self.prefix + session_id
+        blob = CompressedText.from_text(text)
+        with self.client.pipeline() as pipe:
+            pipe.hset(key, mapping={"filename": filename, "text": blob.data, "digest": blob.digest, "size": blob.size})
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+        return SessionRecord(filename, blob, time.time())
+
+    def get(self, session_id, touch=True):
+        key = self.prefix + session_id
+        values = self.client.hgetall(key)
+        if not values:
+            return None
+        if touch:
+            self.client.expire(key, self.ttl)
+        # Keys written before digest/size were stored fall back to hashing and the frame header
+        digest = values.get(b"digest")
+        size = values.get(b"size")
+        blob = CompressedText(
+            values[b"text"], digest.decode("ascii") if digest else None, int(size) if size else None
+        )
+        return SessionRecord(values[b"filename"].decode("utf-8"), blob, time.time())
+
+    def delete(self, session_id):
+        self.client.delete(self.prefix + session_id)
+
+    def put_intake(self, intake_id, answers):
+        self.client.set(self.intake_prefix + intake_id, json.dumps(answers), ex=self.ttl)
+
+    def get_intake(self, intake_id):
+        key = self.intake_prefix + intake_id
+        with self.client.pipeline() as pipe:
+            pipe.get(key)
+            pipe.expire(key, self.ttl)
+            value, _ = pipe.execute()
+        return json.loads(value) if value is not None else None
+
+    def delete_intake(self, intake_id):
+        self.client.delete(self.intake_prefix + intake_id)
+
+    def start_sweeper(self):
+        # Redis expires keys itself
+        pass
+
+    def stats(self):
+        return {"backend": "redis"}
+
+
+def create_session_store(backend="memory", timeout_minutes=30, max_text_bytes=512 * 1024 * 1024):
+    """Build the session store named by ``backend`` (memory, sqlite or redis)"""
+    if backend == "memory":
+        return SessionStore(timeout_minutes, max_text_bytes)
+    if backend == "sqlite":
+        return SQLiteSessionStore(os.getenv('SESSION_DB_PATH', 'sessions.db'), timeout_minutes, max_text_bytes)
+    if backend == "redis":
+        return RedisSessionStore(os.getenv('SESSION_REDIS_URL', 'redis://localhost:6379/0'), timeout_minutes)
+    raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
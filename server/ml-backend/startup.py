@@ -0,0 +1,86 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+PROFILE_ENABLED = os.getenv('ML_STARTUP_PROFILE') == '1'
+
+_started = time.perf_counter()
+_sections = []
+
+
+@contextmanager
+def profile(name):
+    """Time a startup section when ML_STARTUP_PROFILE=1"""
+    if not PROFILE_ENABLED:
+        yield
+        return
+    modules_before = len(sys.modules)
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _sections.append((name, time.perf_counter() - started, len(sys.modules) - modules_before))
+
+
+_worker_fork_hooks = []
+
+
+def on_worker_fork(callback):
+    """Run ``callback`` in every preforked server worker (gunicorn.conf.py's post_fork)
+
+    Background threads do not survive fork, so their owners register a
+    restart here. Unlike ``os.register_at_fork`` this does not fire in other
+    forked children such as the PDF extraction pool's processes.
+    """
+    _worker_fork_hooks.append(callback)
+
+
+def after_worker_fork():
+    for callback in _worker_fork_hooks:
+        callback()
+
+
+def report_startup():
+    """Print the recorded startup sections, slowest first"""
+    if not PROFILE_ENABLED:
+        return
+    total = time.perf_counter() - _started
+    print(f"Startup profile (pid={os.getpid()}, {total * 1000.0:.0f} ms since first import):")
+    for name, seconds, new_modules in sorted(_sections, key=lambda section: -section[1]):
+        print(f"  {seconds * 1000.0:8.1f} ms  {name}  (+{new_modules} modules)")
+
+
+class LazyAgent:
+    """Build an agent (and import its heavy dependencies) on first use
+
+    Attribute access such as ``.run`` or ``.arun`` triggers construction, so
+    processes that never serve a chat route never import the LLM stack.
+    """
+
+    def __init__(self, name, factory):
+        self.name = name
+        self._factory = factory
+        self._agent = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        agent = self._agent
+        if agent is None:
+            with self._lock:
+                if self._agent is None:
+                    with profile(f"agent:{self.name}"):
+                        self._agent = self._factory()
+                    if PROFILE_ENABLED:
+                        name, seconds, new_modules = _sections[-1]
+                        print(f"Lazy init {name}: {seconds * 1000.0:.1f} ms (+{new_modules} modules)")
+                agent = self._agent
+        return agent
+
+    @property
+    def loaded(self):
+        return self._agent is not None
+
+    def __getattr__(self, attribute):
+        return getattr(self.get(), attribute)
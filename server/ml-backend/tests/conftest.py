@@ -0,0 +1,47 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def server(tmp_path_factory):
+    """Import server.py against a small throwaway model and offline fake agents"""
+    import numpy as np
+    from sklearn.linear_model import LogisticRegression
+
+    from model_registry import save_model
+
+    workdir = tmp_path_factory.mktemp("server")
+    rng = np.random.default_rng(0)
+    features = rng.random((200, 21))
+    labels = np.arange(200) % 20
+    model_path = save_model(LogisticRegression(max_iter=200).fit(features, labels), str(workdir / "model.joblib"))
+
+    os.environ.update({
+        "MODEL_PATH": model_path,
+        "ML_FAKE_AGENT": "1",
+        "FAKE_AGENT_CHUNK_DELAY_MS": "0",
+        "SESSION_BACKEND": "sqlite",
+        "SESSION_DB_PATH": str(workdir / "sessions.db"),
+        "FORWARD_SPOOL_DIR": str(workdir / "spool"),
+        "EXTERNAL_BACKEND_URL": "http://127.0.0.1:9/api/v1/report/create",
+    })
+    import server as server_module
+    return server_module
+
+
+@pytest.fixture
+def client(server):
+    return server.app.test_client()
+
+
+@pytest.fixture
+def asgi_client(server):
+    from starlette.testclient import TestClient
+
+    import asgi
+    with TestClient(asgi.app) as client:
+        yield client
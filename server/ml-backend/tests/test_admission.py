@@ -0,0 +1,40 @@
+import asyncio
+import threading
+
+import pytest
+
+from admission import AgentLimiter, Overloaded
+
+
+def test_acquire_async_waits_for_a_threaded_release():
+    limiter = AgentLimiter("general", max_concurrent=1, max_waiting=1, wait_timeout=5.0)
+    held = limiter.acquire()
+
+    async def wait_for_slot():
+        threading.Timer(0.05, limiter.release, args=(held,)).start()
+        return await limiter.acquire_async()
+
+    limiter.release(asyncio.run(wait_for_slot()))
+    assert limiter.stats()["admitted"] == 2
+    assert limiter.active == 0
+    assert limiter.waiting == 0
+
+
+def test_acquire_async_sheds_when_queue_is_full_or_wait_expires():
+    limiter = AgentLimiter("general", max_concurrent=1, max_waiting=1, wait_timeout=0.05)
+    held = limiter.acquire()
+
+    async def contend():
+        waiter = asyncio.create_task(limiter.acquire_async())
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as full:
+            await limiter.acquire_async()
+        with pytest.raises(Overloaded) as expired:
+            await waiter
+        return full.value, expired.value
+
+    full, expired = asyncio.run(contend())
+    limiter.release(held)
+    assert (full.status, expired.status) == (429, 503)
+    assert full.retry_after >= 1
+    assert limiter.waiting == 0
@@ -0,0 +1,70 @@
+import uuid
+
+import pytest
+
+from fake_agent import FakeChunk
+
+
+class SyncOnlyModel:
+    """A model like phidata 2.7.10's Gemini: no aresponse_stream"""
+
+    id = "sync-only"
+
+
+class SyncOnlyAgent:
+    """Streams from ``run``; ``arun(stream=True)`` fails the way phi's Agent does without async streaming"""
+
+    def __init__(self, name, model=None):
+        self.name = name
+        self.model = model
+
+    def run(self, prompt, stream=False):
+        chunks = [FakeChunk("Sync "), FakeChunk(""), FakeChunk("answer")]
+        return iter(chunks) if stream else FakeChunk("Sync answer")
+
+    async def arun(self, prompt, stream=False):
+        async def fail():
+            raise NotImplementedError("sync-only does not support streaming")
+            yield
+        return fail()
+
+
+@pytest.mark.parametrize("model", [SyncOnlyModel(), None], ids=["model-without-async", "arun-not-implemented"])
+def test_ask_general_falls_back_to_sync_stream(server, asgi_client, monkeypatch, model):
+    monkeypatch.setattr(server, "general_agent", SyncOnlyAgent("general", model))
+    response = asgi_client.post("/ask_general", json={"query": f"what is anemia {uuid.uuid4()}"})
+    assert response.status_code == 200
+    assert response.json()["response"] == "Sync answer"
+
+
+def test_ask_general_stream_falls_back_to_sync_stream(server, asgi_client, monkeypatch):
+    monkeypatch.setattr(server, "general_agent", SyncOnlyAgent("general", SyncOnlyModel()))
+    response = asgi_client.post("/ask_general/stream", json={"query": f"what is anemia {uuid.uuid4()}"})
+    assert response.status_code == 200
+    assert '"content": "Sync "' in response.text
+    assert '"content": "answer"' in response.text
+    assert "event: error" not in response.text
+
+
+@pytest.mark.parametrize("path", ["/ask_general", "/ask_general/stream"])
+def test_ask_general_sheds_with_retry_after_when_agent_is_full(server, asgi_client, monkeypatch, path):
+    limiter = server.admission.limiters["general"]
+    monkeypatch.setattr(limiter, "max_concurrent", 1)
+    monkeypatch.setattr(limiter, "max_waiting", 0)
+    acquired_at = limiter.acquire()
+    try:
+        response = asgi_client.post(path, json={"query": f"what is anemia {uuid.uuid4()}"})
+    finally:
+        limiter.release(acquired_at)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert limiter.active == 0
+
+
+def test_stream_releases_its_agent_slot(server, asgi_client):
+    limiter = server.admission.limiters["general"]
+    admitted = limiter.admitted
+    response = asgi_client.post("/ask_general/stream", json={"query": f"what is anemia {uuid.uuid4()}"})
+    assert response.status_code == 200
+    assert limiter.admitted == admitted + 1
+    assert limiter.active == 0
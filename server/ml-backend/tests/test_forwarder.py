@@ -0,0 +1,99 @@
+import json
+import queue
+
+from forwarder import ReportForwarder
+
+
+def make_forwarder(spool_dir):
+    forwarder = ReportForwarder("http://127.0.0.1:9/report", spool_dir=str(spool_dir), replay_interval=3600)
+    # The delivery threads block on the original queue; replayed items stay here for inspection
+    forwarder._queue = queue.Queue()
+    return forwarder
+
+
+def spool(forwarder, count):
+    for i in range(count):
+        forwarder._spool({"id": f"report-{i}", "payload": {"n": i}, "enqueued_at": 1000.0 + i})
+
+
+def test_replay_claims_each_spooled_report_once(tmp_path):
+    first, second = make_forwarder(tmp_path), make_forwarder(tmp_path)
+    spool(first, 3)
+
+    replayed = first.replay_spool() + second.replay_spool()
+
+    ids = [first._queue.get_nowait()["id"] for _ in range(first._queue.qsize())]
+    ids += [second._queue.get_nowait()["id"] for _ in range(second._queue.qsize())]
+    assert replayed == 3
+    assert sorted(ids) == ["report-0", "report-1", "report-2"]
+    assert first._spool_files() == []
+
+
+def test_replay_releases_claims_of_exited_processes(tmp_path):
+    forwarder = make_forwarder(tmp_path)
+    stale = tmp_path / ".claimed-999999999"
+    stale.mkdir()
+    (stale / "000000000001000-orphan.json").write_text(
+        json.dumps({"id": "orphan", "payload": {}, "enqueued_at": 1.0})
+    )
+
+    assert forwarder.replay_spool() == 1
+    assert forwarder._queue.get_nowait()["id"] == "orphan"
+    assert not stale.exists()
+
+
+def test_unreadable_spool_file_is_dead_lettered_once(tmp_path):
+    forwarder = make_forwarder(tmp_path)
+    spool(forwarder, 1)
+    (tmp_path / "000000000000500-corrupt.json").write_text('{"id": "corrupt", "payl')
+
+    assert forwarder.replay_spool() == 1
+    assert forwarder.replay_spool() == 0
+
+    assert forwarder._queue.get_nowait()["id"] == "report-0"
+    assert forwarder._queue.empty()
+    assert (tmp_path / "000000000000500-corrupt.json.bad").exists()
+    assert forwarder._spool_files() == []
+    assert forwarder.stats()["dead_lettered"] == 1
+
+
+def test_posts_carry_the_delivery_id():
+    assert ReportForwarder._body({"id": "abc", "payload": {"session_id": "s"}}) == {"session_id": "s", "delivery_id": "abc"}
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None):
+        self.status_code = status_code
+        self._body = body or {}
+
+    def json(self):
+        return self._body
+
+
+def test_rejected_bulk_batch_is_retried_item_by_item(tmp_path, monkeypatch):
+    forwarder = ReportForwarder("http://127.0.0.1:9/report", bulk_url="http://127.0.0.1:9/report/bulk",
+                                spool_dir=str(tmp_path), replay_interval=3600)
+    posts = []
+
+    def post(url, json, timeout):
+        posts.append(url)
+        if url.endswith("/bulk"):
+            return FakeResponse(413)
+        return FakeResponse(400 if json["n"] == 1 else 201)
+
+    monkeypatch.setattr(forwarder.session, "post", post)
+    forwarder._deliver([{"id": f"r{i}", "payload": {"n": i}, "enqueued_at": 1.0} for i in range(3)])
+
+    assert posts == [forwarder.bulk_url] + [forwarder.url] * 3
+    assert (forwarder.delivered, forwarder.failed) == (2, 1)
+
+
+def test_bulk_per_item_errors_count_as_failed(tmp_path, monkeypatch):
+    forwarder = ReportForwarder("http://127.0.0.1:9/report", bulk_url="http://127.0.0.1:9/report/bulk",
+                                spool_dir=str(tmp_path), replay_interval=3600)
+    monkeypatch.setattr(forwarder.session, "post", lambda url, json, timeout: FakeResponse(
+        201, {"count": 2, "errors": [{"index": 1, "delivery_id": "r1", "message": "Missing required fields"}]}
+    ))
+    forwarder._deliver([{"id": f"r{i}", "payload": {"n": i}, "enqueued_at": 1.0} for i in range(3)])
+
+    assert (forwarder.delivered, forwarder.failed) == (2, 1)
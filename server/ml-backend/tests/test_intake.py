@@ -0,0 +1,58 @@
+ANSWERS = ["Diabetes", "6 months", "fatigue and nausea", "7", "yes", "none", "English"]
+
+
+def start_intake(client):
+    response = client.post("/intake/answer", json={})
+    assert response.status_code == 200
+    return response.get_json()["intake_id"]
+
+
+def answer_all(client, intake_id, answers):
+    response = None
+    for answer in answers:
+        response = client.post("/intake/answer", json={"intake_id": intake_id, "answer": answer})
+    return response
+
+
+def test_intake_answer_retries_the_last_answer_after_a_failed_prediction(server, client, monkeypatch):
+    intake_id = start_intake(client)
+    predict = server.predict_top_nurses
+
+    def fail_once(record, n=3):
+        monkeypatch.setattr(server, "predict_top_nurses", predict)
+        raise RuntimeError("model unavailable")
+
+    monkeypatch.setattr(server, "predict_top_nurses", fail_once)
+    assert answer_all(client, intake_id, ANSWERS).status_code == 500
+
+    response = client.post("/intake/answer", json={"intake_id": intake_id, "answer": ANSWERS[-1]})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(body["top_nurses"]) == 3
+    assert body["features"]["pain_level"] == 7
+
+
+def test_intake_answers_are_kept_in_the_session_backend(server, client):
+    intake_id = start_intake(client)
+    client.post("/intake/answer", json={"intake_id": intake_id, "answer": ANSWERS[0]})
+    # Another worker sharing the SQLite sessions sees the same intake
+    other_worker = type(server.session_data)(server.session_data.path)
+    assert other_worker.get_intake(intake_id) == {"disease": ANSWERS[0]}
+
+    response = answer_all(client, intake_id, ANSWERS[1:])
+    assert response.status_code == 200
+    assert other_worker.get_intake(intake_id) is None
+
+
+def test_intake_is_shed_when_the_llm_lane_is_full(server, client, monkeypatch):
+    lane = server.admission.lanes["llm"]
+    monkeypatch.setattr(lane, "in_flight", lane.max_in_flight)
+    response = client.post("/intake", json={"answers": ANSWERS})
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+
+
+def test_intake_answer_rejects_a_body_that_is_not_an_object(client):
+    for body in (["Diabetes"], "Diabetes", 3):
+        response = client.post("/intake/answer", json=body)
+        assert response.status_code == 400
@@ -0,0 +1,84 @@
+import pytest
+
+from intake import IntakeParser, parse_duration, parse_pain, parse_yes_no
+
+
+@pytest.fixture
+def parser(server):
+    return IntakeParser(server.columns)
+
+
+@pytest.mark.parametrize("answer", ["a lot", "an awful lot", "a few", "a couple"])
+def test_vague_pain_answers_are_ambiguous(answer):
+    assert parse_pain(answer) is None
+
+
+@pytest.mark.parametrize("answer, level", [("seven", 7.0), ("7/10", 7.0), ("moderate", 5.0)])
+def test_definite_pain_answers(answer, level):
+    assert parse_pain(answer) == level
+
+
+@pytest.mark.parametrize("answer", ["since 2019", "2019", "150 years", "1500"])
+def test_calendar_years_and_implausible_durations_are_ambiguous(answer):
+    assert parse_duration(answer) is None
+
+
+@pytest.mark.parametrize("answer, months", [("6", 6.0), ("2 years", 24.0), ("a few weeks", 0.7)])
+def test_durations(answer, months):
+    assert parse_duration(answer) == months
+
+
+@pytest.mark.parametrize("answer", ["not sure", "No idea", "I don't know", "dont know"])
+def test_unsure_prior_diagnosis_is_ambiguous(answer):
+    assert parse_yes_no(answer) is None
+
+
+def test_keywords_after_a_negation_are_dropped(parser):
+    assert parser.parse_field("comorbidity", "No, no kidney or liver problems") == []
+    assert parser.parse_field("symptoms", "no swelling, just fatigue") == ["fatigue"]
+    assert parser.parse_field("symptoms", "tired but without any nausea") == ["fatigue"]
+
+
+def test_blood_pressure_needs_high_for_hypertension(parser):
+    assert parser.parse_field("disease", "low blood pressure") is None
+    assert parser.parse_field("disease", "high blood pressure") == ["Hypertension"]
+
+
+@pytest.mark.parametrize("answer", ["not bad", "not severe", "it's not 7", "no, not moderate"])
+def test_negated_pain_levels_are_ambiguous(answer):
+    assert parse_pain(answer) is None
+
+
+@pytest.mark.parametrize("answer, level", [("no pain", 1.0), ("none", 1.0), ("bad, not unbearable", 7.0)])
+def test_pain_words_that_are_not_negated(answer, level):
+    assert parse_pain(answer) == level
+
+
+@pytest.mark.parametrize("answer, months", [
+    ("half a year", 6.0),
+    ("one and a half years", 18.0),
+    ("about a year and a half", 18.0),
+    ("6 and a half months", 6.5),
+    ("two weeks", 0.5),
+])
+def test_half_durations(answer, months):
+    assert parse_duration(answer) == months
+
+
+@pytest.mark.parametrize("answer", ["a quarter of a year", "1/2 year", "half"])
+def test_other_fractional_durations_are_ambiguous(answer):
+    assert parse_duration(answer) is None
+
+
+def test_low_blood_sugar_is_not_diabetes(parser):
+    assert parser.parse_field("disease", "low blood sugar") is None
+    assert parser.parse_field("disease", "sugar") == ["Diabetes"]
+
+
+@pytest.mark.parametrize("field, answer", [
+    ("disease", "my mother has diabetes"),
+    ("symptoms", "my husband has a cough"),
+    ("comorbidity", "family history of thyroid"),
+])
+def test_answers_about_someone_else_are_ambiguous(parser, field, answer):
+    assert parser.parse_field(field, answer) is None
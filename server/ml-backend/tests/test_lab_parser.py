@@ -0,0 +1,53 @@
+import pytest
+
+from lab_parser import parse_lab_report, parse_rows
+
+
+def parse_one(line):
+    tests, _ = parse_rows(line)
+    return tests[0] if tests else None
+
+
+@pytest.mark.parametrize("line, interpretation", [
+    ("Total WBC Count 4,500 cells/cumm 4000 - 11000", "Normal"),
+    ("Total WBC Count 12,500 cells/cumm 4,000 - 11,000", "High"),
+    ("RBC Count 1,234,567 /cumm 1,000,000 - 2,000,000", "Normal"),
+])
+def test_comma_before_three_digits_groups_thousands(line, interpretation):
+    assert parse_one(line)["interpretation"] == interpretation
+
+
+def test_indian_digit_grouping():
+    test = parse_one("Platelet Count 2,50,000 /cumm 1,50,000 - 4,50,000")
+    assert test["interpretation"] == "Normal"
+    assert test["value"] == "2,50,000 /cumm"
+    assert parse_one("Platelet Count 1,20,000 /cumm 150000 - 450000")["interpretation"] == "Low"
+
+
+def test_decimal_comma_needs_a_decimal_comma_range():
+    assert parse_one("Hemoglobin 13,5 g/dL 12,0 - 16,0")["interpretation"] == "Normal"
+    assert parse_one("Hemoglobin 11,5 g/dL 12,0 - 16,0")["interpretation"] == "Low"
+    assert parse_one("Hemoglobin 13,5 g/dL 12 - 16") is None
+
+
+def test_misread_commas_do_not_skip_the_llm():
+    report = "\n".join([
+        "Hemoglobin 13,5 g/dL 12 - 16",
+        "Total WBC Count 4,500 cells/cumm 4000 - 11000",
+        "Platelet Count 2,50,000 /cumm 1,50,000 - 4,50,000",
+        "Neutrophils 60 % 40 - 70",
+    ])
+    result, confidence = parse_lab_report(report)
+    assert [test["name"] for test in result["tests"]] == ["Total WBC Count", "Platelet Count", "Neutrophils"]
+    assert confidence == 0.75
+
+
+@pytest.mark.parametrize("line, name, value, interpretation", [
+    ("Vitamin B12 171.5 pg/mL 200 - 900", "Vitamin B12", "171.5 pg/mL", "Low"),
+    ("Vitamin D3 25 ng/mL 30 - 100", "Vitamin D3", "25 ng/mL", "Low"),
+    ("Vitamin B12 450 pg/mL 200 - 900", "Vitamin B12", "450 pg/mL", "Normal"),
+])
+def test_names_ending_in_a_digit_keep_their_value(line, name, value, interpretation):
+    test = parse_one(line)
+    assert (test["name"], test["value"], test["interpretation"]) == (name, value, interpretation)
+    assert test["reference_range"] != "0-900"
@@ -0,0 +1,27 @@
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+
+from model_registry import ModelManager, save_model, version_key
+
+
+def publish(model_dir, version):
+    rng = np.random.default_rng(0)
+    model = LogisticRegression(max_iter=200).fit(rng.random((40, 4)), np.arange(40) % 2)
+    (model_dir / version).mkdir()
+    save_model(model, str(model_dir / version / "model.joblib"))
+
+
+def test_latest_version_compares_numbers_not_strings(tmp_path):
+    for version in ("v2", "v9", "v10"):
+        publish(tmp_path, version)
+    (tmp_path / "v11").mkdir()  # not published yet: no model artifact
+
+    manager = ModelManager(4, {1: "nurse-a", 2: "nurse-b"}, model_dir=str(tmp_path))
+
+    assert manager.latest_version() == "v10"
+    assert manager.active.version == "v10"
+
+
+def test_version_key_orders_dates_and_mixed_names():
+    names = ["2024-10-01", "2024-9-30", "model-100", "model-20", "model-3"]
+    assert sorted(names, key=version_key) == ["2024-9-30", "2024-10-01", "model-3", "model-20", "model-100"]
@@ -0,0 +1,29 @@
+from pdf_cache import TextCache
+
+
+def test_truncated_flag_survives_memory_and_disk(tmp_path):
+    cache = TextCache(directory=str(tmp_path))
+    cache.put("aa-full", "whole report")
+    cache.put("bb-cut", "first pages", truncated=True)
+    assert cache.get("bb-cut") == ("first pages", True)
+
+    reopened = TextCache(directory=str(tmp_path))
+    assert reopened.get("aa-full") == ("whole report", False)
+    assert reopened.get("bb-cut") == ("first pages", True)
+    assert reopened.get("cc-missing") is None
+    assert reopened.stats()["disk_hits"] == 2
+
+
+def test_reupload_of_a_truncated_pdf_reports_truncated(server, client):
+    import io
+
+    from bench import make_pdf
+
+    pages = [[f"Hemoglobin {12 + page % 4}.5 g/dL 12.0 - 16.0", f"Page {page + 1}"]
+             for page in range(server.MAX_PAGES + 2)]
+    pdf = make_pdf(pages)
+    first = client.post("/upload", data={"pdf": (io.BytesIO(pdf), "long.pdf")})
+    second = client.post("/upload", data={"pdf": (io.BytesIO(pdf), "long.pdf")})
+    assert first.get_json()["truncated"] is True
+    assert second.get_json()["cached"] is True
+    assert second.get_json()["truncated"] is True
@@ -0,0 +1,59 @@
+import pytest
+
+
+RECORD = {"duration_months": 6, "pain_level": 7, "Diabetes": 1, "fatigue": 1}
+
+
+def test_predict_batch_ranks_every_record(client):
+    response = client.post("/predict/batch", json={"records": [RECORD, RECORD], "top_n": 2})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["count"] == 2
+    assert all(len(result["top_nurses"]) == 2 for result in body["results"])
+
+
+@pytest.mark.parametrize("top_n", ["3", "abc", 2.5, 0, -1, True, None])
+def test_predict_batch_rejects_invalid_top_n(client, top_n):
+    response = client.post("/predict/batch", json={"records": [RECORD], "top_n": top_n})
+    assert response.status_code == 400
+    assert "top_n" in response.get_json()["message"]
+
+
+@pytest.mark.parametrize("top_n", ["abc", 2.5, 0, True])
+def test_asgi_predict_batch_validates_like_flask(asgi_client, top_n):
+    response = asgi_client.post("/predict/batch", json={"records": [RECORD], "top_n": top_n})
+    assert response.status_code == 400
+    assert "top_n" in response.json()["message"]
+
+
+def test_asgi_predict_batch_ranks_every_record(asgi_client):
+    response = asgi_client.post("/predict/batch", json={"records": [RECORD, RECORD], "top_n": 2})
+    assert response.status_code == 200
+    assert all(len(result["top_nurses"]) == 2 for result in response.json()["results"])
+
+
+@pytest.mark.parametrize("path", ["/predict", "/predict/batch"])
+def test_predict_requires_json(client, asgi_client, path):
+    assert client.post(path, data="not json").status_code == 400
+    assert asgi_client.post(path, content="not json").status_code == 400
+
+
+@pytest.mark.parametrize("records, message", [
+    ([RECORD, "not a record"], "Record 1 is not a JSON object"),
+    ([RECORD, RECORD, {**RECORD, "pain_level": "severe"}], "Record 2: pain_level must be a number"),
+    ([{**RECORD, "fatigue": [1]}], "Record 0: fatigue must be a number"),
+])
+def test_predict_batch_rejects_bad_records(client, asgi_client, records, message):
+    response = client.post("/predict/batch", json={"records": records})
+    assert response.status_code == 400
+    assert message in response.get_json()["message"]
+    response = asgi_client.post("/predict/batch", json={"records": records})
+    assert response.status_code == 400
+    assert message in response.json()["message"]
+
+
+def test_predict_rejects_a_non_numeric_feature(client, asgi_client):
+    record = {**RECORD, "duration_months": "six"}
+    assert client.post("/predict", json=record).status_code == 400
+    assert asgi_client.post("/predict", json=record).status_code == 400
+    assert client.post("/predict", json=[RECORD]).status_code == 400
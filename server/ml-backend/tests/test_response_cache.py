@@ -0,0 +1,16 @@
+import time
+
+from response_cache import ResponseCache
+
+
+def test_purge_drops_expired_rows_and_caps_the_table(tmp_path):
+    cache = ResponseCache(ttl_seconds=60, db_path=str(tmp_path / "responses.db"), max_disk_entries=3)
+    for i in range(5):
+        cache.put("general:v2", f"question {i}", f"answer {i}")
+    conn = cache._connect()
+    conn.execute("UPDATE responses SET stored_at = ? WHERE key = ?",
+                 (time.time() - 3600, cache.make_key("general:v2", "question 4")))
+
+    assert cache.purge() == 2
+    stored = {row[0] for row in conn.execute("SELECT response FROM responses")}
+    assert stored == {"answer 1", "answer 2", "answer 3"}
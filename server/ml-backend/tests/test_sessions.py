@@ -0,0 +1,62 @@
+import hashlib
+import sqlite3
+
+from sessions import SQLiteSessionStore
+
+REPORT = "Hemoglobin 13.5 g/dL 12.0-16.0\n" * 50
+
+
+def test_sqlite_get_returns_stored_digest_and_size(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    store.put("s1", REPORT, "report.pdf")
+    record = store.get("s1")
+    assert record.blob.digest == hashlib.sha256(REPORT.encode("utf-8")).hexdigest()
+    assert record.blob.size == len(REPORT)
+    stats = store.stats()
+    assert stats["uncompressed_bytes"] == len(REPORT)
+    assert stats["compressed_bytes"] < stats["uncompressed_bytes"]
+
+
+def test_sqlite_adds_digest_columns_to_an_existing_table(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE sessions (session_id TEXT PRIMARY KEY, filename TEXT NOT NULL, "
+        "text BLOB NOT NULL, stored_bytes INTEGER NOT NULL, last_access REAL NOT NULL)"
+    )
+    conn.close()
+    store = SQLiteSessionStore(path)
+    store.put("s1", REPORT, "report.pdf")
+    assert store.get("s1").digest == hashlib.sha256(REPORT.encode("utf-8")).hexdigest()
+
+
+def test_sqlite_totals_follow_puts_deletes_and_replaces(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    store.put("s1", REPORT, "report.pdf")
+    store.put("s2", REPORT, "report.pdf")
+    store.put("s3", "Sodium 140 mmol/L 136-145", "other.pdf")
+    store.put("s3", "Potassium 4.2 mmol/L 3.5-5.1", "other.pdf")
+    store.delete("s2")
+    stats = store.stats()
+    conn = store._connect()
+    assert stats["sessions"] == 2
+    assert stats["compressed_bytes"] == conn.execute("SELECT SUM(stored_bytes) FROM sessions").fetchone()[0]
+    assert stats["distinct_reports"] == 2
+    assert stats["uncompressed_bytes"] == len(REPORT) + len("Potassium 4.2 mmol/L 3.5-5.1")
+
+
+def test_sqlite_counts_a_shared_report_once(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+    for session_id in ("s1", "s2", "s3"):
+        store.put(session_id, REPORT, "report.pdf")
+    assert store.stats()["uncompressed_bytes"] == len(REPORT)
+    assert SQLiteSessionStore(str(tmp_path / "sessions.db")).stats()["sessions"] == 3
+
+
+def test_sqlite_budget_evicts_least_recently_used(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), max_text_bytes=1)
+    store.put("s1", REPORT, "report.pdf")
+    store.put("s2", REPORT + "more", "report.pdf")
+    assert store.get("s1") is None
+    assert store.get("s2") is not None
+    assert store.stats()["sessions"] == 1
@@ -0,0 +1,29 @@
+import uuid
+
+import pytest
+
+
+@pytest.mark.parametrize("path", ["/ask_general", "/ask_general/stream", "/smart_query/stream"])
+def test_flask_sheds_with_retry_after_when_agent_is_full(server, client, monkeypatch, path):
+    limiter = server.admission.limiters["general"]
+    monkeypatch.setattr(limiter, "max_concurrent", 1)
+    monkeypatch.setattr(limiter, "max_waiting", 0)
+    acquired_at = limiter.acquire()
+    try:
+        response = client.post(path, json={"query": f"what is anemia {uuid.uuid4()}"})
+    finally:
+        limiter.release(acquired_at)
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
+    assert limiter.active == 0
+
+
+def test_flask_stream_releases_its_agent_slot(server, client):
+    limiter = server.admission.limiters["general"]
+    admitted = limiter.admitted
+    response = client.post("/ask_general/stream", json={"query": f"what is anemia {uuid.uuid4()}"})
+    assert response.status_code == 200
+    assert "event: error" not in response.get_data(as_text=True)
+    response.close()
+    assert limiter.admitted == admitted + 1
+    assert limiter.active == 0